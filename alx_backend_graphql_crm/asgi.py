@@ -2,6 +2,9 @@
 ASGI config for alx_backend_graphql_crm project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn alx_backend_graphql_crm.asgi:application``)
+to get the non-blocking ``graphql/async/`` endpoint and GraphQL subscriptions,
+served over WebSocket (graphql-transport-ws) at ``graphql/``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +16,22 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up.
+from alx_backend_graphql_crm.schema import schema  # noqa: E402
+from crm.websocket import GraphQLWebSocketApp  # noqa: E402
+
+WEBSOCKET_PATHS = ('/graphql/', '/graphql')
+
+websocket_application = GraphQLWebSocketApp(schema)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        if scope['path'] in WEBSOCKET_PATHS:
+            return await websocket_application(scope, receive, send)
+        # Nothing else speaks WebSocket: refuse the handshake.
+        await receive()
+        return await send({'type': 'websocket.close'})
+    return await django_application(scope, receive, send)
@@ -11,12 +11,18 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+import os
+import sys
 import datetime
 from celery.schedules import crontab
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# `manage.py test` runs without the services (Redis) a deployment has.
+TESTING = sys.argv[1:2] == ['test']
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -60,6 +66,20 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Upper bound, in seconds, for the /readyz dependency probes
+HEALTH_CHECK_TIMEOUT = 2
+# What the heartbeat cron polls
+CRM_HEALTH_URL = 'http://localhost:8000/readyz'
+
+# Order reminder pipeline (crm.reminders): async sender callable, sends in
+# flight at once, and orders fetched per query
+ORDER_REMINDER_SENDER = 'crm.reminders.log_sender'
+ORDER_REMINDER_CONCURRENCY = 10
+ORDER_REMINDER_CHUNK_SIZE = 500
+
+# Rejected rows listed in an /import/<kind>/ response (the rest are only counted)
+IMPORT_MAX_REPORTED_ERRORS = 1000
+
 CELERY_BEAT_SCHEDULE = {
     'generate-crm-report': {
         'task': 'crm.tasks.generate_crm_report',
@@ -67,8 +87,12 @@ CELERY_BEAT_SCHEDULE = {
     },
 }
 
+# UpdateLowStockProducts defaults (both can be overridden per call)
+LOW_STOCK_RESTOCK_AMOUNT = 10
+LOW_STOCK_MAX_BATCH_SIZE = 1000
+
 AUTHENTICATION_BACKENDS = [
-    'graphql_jwt.backends.JSONWebTokenBackend',
+    'crm.auth.CachedJSONWebTokenBackend',
     'django.contrib.auth.backends.ModelBackend',
 ]
 
@@ -106,10 +130,93 @@ AUTH_USER_MODEL = 'crm.User'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# DATABASE_PROFILE picks one of DATABASE_PROFILES:
+# - sqlite (default): WAL, so readers never block the writer; IMMEDIATE
+#   transactions, so concurrent writers queue on busy_timeout instead of
+#   failing with "database is locked"; persistent connections
+# - sqlite-untuned: Django's stock SQLite setup with a rollback journal, kept
+#   as the baseline for bench_db_writes
+# - postgres: psycopg 3 connection pool in each process (needs psycopg[pool])
+# - postgres-pgbouncer: persistent connections behind PgBouncer in transaction
+#   pooling mode, which can't hold server-side cursors open
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'sqlite')
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', '60'))
+SQLITE_PATH = os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3')
+
+# Run on every new SQLite connection.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # Durable at each checkpoint rather than each commit; safe in WAL mode.
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # ms
+    'cache_size': -65536,  # KiB, i.e. 64 MB of page cache per connection
+    'mmap_size': 268435456,  # bytes
+    'temp_store': 'MEMORY',
+}
+
+_POSTGRES = {
+    'ENGINE': 'django.db.backends.postgresql',
+    'NAME': os.environ.get('POSTGRES_DB', 'crm'),
+    'USER': os.environ.get('POSTGRES_USER', 'crm'),
+    'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+    'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+    'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+}
+
+DATABASE_PROFILES = {
+    'sqlite': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': SQLITE_PATH,
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+            'init_command': ';'.join(f"PRAGMA {name}={value}" for name, value in SQLITE_PRAGMAS.items()),
+        },
+    },
+    'sqlite-untuned': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': SQLITE_PATH,
+        # journal_mode is stored in the file; put back what a new file starts with.
+        'OPTIONS': {'init_command': 'PRAGMA journal_mode=DELETE'},
+    },
+    'postgres': {
+        **_POSTGRES,
+        # Django hands connections back to the pool; persistent ones aren't allowed with it.
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', '2')),
+                'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', '10')),
+                'timeout': 10,
+            },
+        },
+    },
+    'postgres-pgbouncer': {
+        **_POSTGRES,
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'DISABLE_SERVER_SIDE_CURSORS': True,
+    },
+}
+
+if DATABASE_PROFILE not in DATABASE_PROFILES:
+    raise ImproperlyConfigured(
+        f"DATABASE_PROFILE={DATABASE_PROFILE!r}; expected one of {', '.join(DATABASE_PROFILES)}."
+    )
+
 DATABASES = {
+    'default': DATABASE_PROFILES[DATABASE_PROFILE],
+}
+
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_CACHE_URL'],
+    } if os.environ.get('REDIS_CACHE_URL') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
@@ -160,13 +267,58 @@ GRAPHENE = {
     'SCHEMA': 'crm.schema.schema',
     'MIDDLEWARE': [
         'graphql_jwt.middleware.JSONWebTokenMiddleware',
+        'crm.tracing.TracingMiddleware',
     ],
 }
 
+# Parsed + validated documents kept in memory per process (LRU, also the APQ store)
+GRAPHQL_DOCUMENT_CACHE_SIZE = 256
+
+# Opt-in cache of query responses, invalidated per model by signals
+GRAPHQL_RESPONSE_CACHE = {
+    'ENABLED': os.environ.get('GRAPHQL_RESPONSE_CACHE', '') == '1',
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 60,
+}
+
+# Operations are costed before execution; connections multiply by first/last
+GRAPHQL_MAX_QUERY_DEPTH = 10
+GRAPHQL_MAX_QUERY_COST = 10000
+
+# Per-resolver tracing: staff (or DEBUG) requests sending HEADER get the trace
+# in extensions.tracing; SAMPLE_RATE of all other requests are traced and logged
+GRAPHQL_TRACING = {
+    'HEADER': 'X-GraphQL-Trace',
+    'SAMPLE_RATE': float(os.environ.get('GRAPHQL_TRACE_SAMPLE_RATE', '0.01')),
+    'LOG_TOP_FIELDS': 10,
+}
+
+# Subscriptions (WebSocket, graphql-transport-ws, on the ASGI app). Mutations
+# publish through BACKEND: Redis (the Celery broker) so every worker sees every
+# event, or crm.pubsub.InMemoryPubSub for tests (the default under TESTING) and
+# a single process
+GRAPHQL_PUBSUB = {
+    'BACKEND': os.environ.get(
+        'GRAPHQL_PUBSUB_BACKEND', 'crm.pubsub.InMemoryPubSub' if TESTING else 'crm.pubsub.RedisPubSub',
+    ),
+    'OPTIONS': {'url': os.environ.get('GRAPHQL_PUBSUB_URL', CELERY_BROKER_URL)},
+}
+GRAPHQL_SUBSCRIPTIONS = {
+    'CONNECTION_INIT_TIMEOUT': 10,
+    'MAX_OPERATIONS_PER_CONNECTION': 50,
+}
+
 GRAPHQL_JWT = {
     'JWT_VERIFY_EXPIRATION': True,
     'JWT_EXPIRATION_DELTA': datetime.timedelta(minutes=5),
     'JWT_REFRESH_EXPIRATION_DELTA': datetime.timedelta(days=7),
 }
 
+# Verified JWT -> user, per process (crm.auth). Entries never outlive the token;
+# saving a user drops them here, other processes catch up within TIMEOUT seconds
+GRAPHQL_JWT_USER_CACHE = {
+    'TIMEOUT': 30,
+    'MAX_SIZE': 10000,
+}
+
 CORS_ALLOW_ALL_ORIGINS = True # Allow all origins for CORS, adjust as needed for production
\ No newline at end of file
@@ -16,11 +16,17 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
+from crm.views import AsyncGraphQLView, CachedGraphQLView, export_orders, healthz, import_records, readyz
 from django.views.decorators.csrf import csrf_exempt
 from .schema import schema
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('graphql/', csrf_exempt(GraphQLView.as_view(graphiql=True, schema=schema))),
+    path('healthz', healthz),
+    path('readyz', readyz),
+    path('import/<str:kind>/', import_records),
+    path('export/orders/', export_orders),
+    path('graphql/', csrf_exempt(CachedGraphQLView.as_view(graphiql=True, schema=schema))),
+    # Async executor; only useful when served by an ASGI server (see asgi.py).
+    path('graphql/async/', csrf_exempt(AsyncGraphQLView.as_view(schema=schema))),
 ]
@@ -0,0 +1,142 @@
+"""JWT authentication with the verified user memoized per request and per token.
+
+graphql_jwt verifies the token signature and loads the user row on every
+`authenticate()` call, and its middleware calls that for each resolver
+until one succeeds (and for every resolver when the token is bad). Here a
+token is verified at most once per request, and tokens seen recently map
+straight to their user from a small in-process LRU, so an authenticated
+request costs no SQL for auth.
+
+Cache entries live for TIMEOUT seconds, never past the token's own expiry.
+Saving or deleting a user, logging out and revoking a refresh token drop
+that user's entries once the transaction commits. Other processes pick
+the change up when their entry times out.
+"""
+import copy
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from graphql_jwt.backends import JSONWebTokenBackend
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.utils import get_credentials, get_payload, get_user_by_payload
+
+
+class TokenUserCache:
+    """Bounded LRU of verified token -> user, with a TTL per entry."""
+
+    def __init__(self, maxsize=10000, timeout=30):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._tokens_by_user = {}
+        self._lock = Lock()
+
+    def get(self, token):
+        """A copy of the cached user for `token`, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._remove(token)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+        # Callers may set attributes (authenticate() sets `backend`).
+        return copy.copy(entry[1])
+
+    def set(self, token, user, expires_at=None):
+        """Cache `user` for `token`; `expires_at` is the token's `exp` (unix time)."""
+        ttl = self.timeout
+        if expires_at is not None:
+            ttl = min(ttl, expires_at - time.time())
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._remove(token)
+            self._entries[token] = (time.monotonic() + ttl, copy.copy(user))
+            self._tokens_by_user.setdefault(user.pk, set()).add(token)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, pk):
+        with self._lock:
+            for token in list(self._tokens_by_user.get(pk, ())):
+                self._remove(token)
+
+    def _remove(self, token):
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            tokens = self._tokens_by_user.get(entry[1].pk)
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[entry[1].pk]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+_config = getattr(settings, 'GRAPHQL_JWT_USER_CACHE', {})
+token_user_cache = TokenUserCache(
+    maxsize=_config.get('MAX_SIZE', 10000),
+    timeout=_config.get('TIMEOUT', 30),
+)
+
+
+def get_user_by_token(token, context=None):
+    """graphql_jwt.shortcuts.get_user_by_token, answered from token_user_cache when possible."""
+    user = token_user_cache.get(token)
+    if user is None:
+        payload = get_payload(token, context)
+        user = get_user_by_payload(payload)
+        if user is not None:
+            token_user_cache.set(token, user, payload.get('exp'))
+    return user
+
+
+class CachedJSONWebTokenBackend(JSONWebTokenBackend):
+    """JSONWebTokenBackend that resolves a request's token once and remembers the outcome.
+
+    A rejected token is remembered as well, so the error is raised again
+    without decoding it for every resolver.
+    """
+
+    def authenticate(self, request=None, **kwargs):
+        if request is None or getattr(request, "_jwt_token_auth", False):
+            return None
+
+        token = get_credentials(request, **kwargs)
+        if token is None:
+            return None
+
+        memo = getattr(request, '_jwt_user_memo', None)
+        if memo is None or memo[0] != token:
+            try:
+                memo = (token, get_user_by_token(token, request), None)
+            except JSONWebTokenError as e:
+                memo = (token, None, e)
+            request._jwt_user_memo = memo
+        if memo[2] is not None:
+            raise memo[2]
+        return memo[1]
+
@@ -0,0 +1,427 @@
+"""A catalog of representative GraphQL operations and a harness that times them.
+
+Every operation goes through the real /graphql/ view (parsing, validation,
+cost checks, loaders), so results reflect what a client sees minus the
+network. Mutations run in a transaction that is rolled back after each
+iteration, so the data set is the same on every run.
+
+WriteBenchmark is the exception: it measures concurrent writers, so its
+transactions commit, and it deletes what it created once it is done.
+"""
+import json
+import platform
+import statistics
+import subprocess
+import threading
+import time
+from collections import Counter
+import tracemalloc
+import uuid
+
+import django
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .cache import response_cache
+from .models import Customer, Order, Product
+
+REMINDER_QUERY = """
+query Reminders {
+  allOrdersKeyset(first: 100) {
+    edges {
+      node {
+        id
+        orderDate
+        totalAmount
+        customerId { name email }
+        productIds { edges { node { name price } } }
+      }
+    }
+  }
+}
+"""
+
+REPORT_QUERY = """
+query Report {
+  orderStats { count totalRevenue averageOrderValue minOrderValue maxOrderValue }
+}
+"""
+
+FILTERED_CUSTOMERS_QUERY = """
+query TopCustomers($name: String, $minOrders: Int) {
+  allCustomers(name_Icontains: $name, orderCount_Gte: $minOrders, orderBy: "-lifetime_value", first: 50) {
+    edges { node { id name email orderCount lifetimeValue lastOrderAt } }
+  }
+}
+"""
+
+CREATE_CUSTOMER_MUTATION = """
+mutation CreateCustomer($name: String!, $email: String!) {
+  createCustomer(name: $name, email: $email, phone: "+15551234567") {
+    customer { id }
+    errors { field message }
+  }
+}
+"""
+
+BULK_CREATE_CUSTOMERS_MUTATION = """
+mutation BulkCreateCustomers($customers: [CustomerInput]!) {
+  bulkCreateCustomers(customersData: $customers) {
+    message
+    errors { recordIndex field message }
+  }
+}
+"""
+
+CREATE_ORDER_MUTATION = """
+mutation CreateOrder($customer: String!, $products: [String]!) {
+  createOrder(customerUuid: $customer, productUuids: $products) {
+    order { id totalAmount }
+    errors { field message }
+  }
+}
+"""
+
+CREATE_ORDERS_MUTATION = """
+mutation CreateOrders($orders: [OrderInput!]!) {
+  createOrders(orders: $orders) {
+    message
+    errors { recordIndex field message }
+  }
+}
+"""
+
+
+class Operation:
+    """One benchmarked request; `variables(fixtures)` builds fresh variables per iteration."""
+
+    def __init__(self, name, query, variables=None, mutation=False):
+        self.name = name
+        self.query = query
+        self.variables = variables or (lambda fixtures: {})
+        self.mutation = mutation
+
+
+def _unique():
+    return uuid.uuid4().hex[:12]
+
+
+CATALOG = [
+    Operation('reminder_query', REMINDER_QUERY),
+    Operation('report_query', REPORT_QUERY),
+    Operation('filtered_customers', FILTERED_CUSTOMERS_QUERY, lambda f: {'name': 'an', 'minOrders': 5}),
+    Operation('create_customer', CREATE_CUSTOMER_MUTATION, lambda f: {
+        'name': 'Bench Customer', 'email': f"bench-{_unique()}@example.com",
+    }, mutation=True),
+    Operation('bulk_create_customers', BULK_CREATE_CUSTOMERS_MUTATION, lambda f: {
+        'customers': [
+            {'name': f"Bench {i}", 'email': f"bench-{_unique()}@example.com", 'phone': '+15551234567'}
+            for i in range(100)
+        ],
+    }, mutation=True),
+    Operation('create_order', CREATE_ORDER_MUTATION, lambda f: {
+        'customer': f['customers'][0], 'products': f['products'][:3],
+    }, mutation=True),
+    Operation('create_orders', CREATE_ORDERS_MUTATION, lambda f: {
+        'orders': [
+            {'customerUuid': f['customers'][i % len(f['customers'])], 'productUuids': f['products'][i % 3:i % 3 + 2]}
+            for i in range(20)
+        ],
+    }, mutation=True),
+]
+
+
+def load_fixtures():
+    """Existing rows the mutations refer to."""
+    return {
+        'customers': [str(pk) for pk in Customer.objects.order_by('-order_count').values_list('pk', flat=True)[:20]],
+        'products': [str(pk) for pk in Product.objects.order_by('pk').values_list('pk', flat=True)[:5]],
+    }
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def bench_client():
+    """A test Client whose Host passes ALLOWED_HOSTS; 'testserver' only does under the test runner."""
+    host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+    return Client(SERVER_NAME=host)
+
+
+class Benchmark:
+    def __init__(self, iterations=50, warmup=5, path='/graphql/'):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.path = path
+        self.client = bench_client()
+
+    def request(self, operation, fixtures):
+        body = json.dumps({'query': operation.query, 'variables': operation.variables(fixtures)})
+        if not operation.mutation:
+            return self.client.post(self.path, body, content_type='application/json')
+        with transaction.atomic():
+            response = self.client.post(self.path, body, content_type='application/json')
+            transaction.set_rollback(True)
+        return response
+
+    def check(self, operation, response):
+        payload = response.json()
+        if response.status_code != 200 or payload.get('errors'):
+            raise BenchmarkError(f"{operation.name} failed ({response.status_code}): {payload.get('errors')}")
+
+    def measure(self, operation, fixtures):
+        for _ in range(self.warmup):
+            self.check(operation, self.request(operation, fixtures))
+
+        latencies, queries = [], []
+        for _ in range(self.iterations):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = self.request(operation, fixtures)
+                latencies.append((time.perf_counter() - started) * 1000)
+            self.check(operation, response)
+            queries.append(len(captured.captured_queries))
+
+        # tracemalloc slows allocation down a lot, so memory gets a separate run.
+        tracemalloc.start()
+        try:
+            self.request(operation, fixtures)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        latencies.sort()
+        return {
+            'iterations': self.iterations,
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+            'max_ms': round(latencies[-1], 3),
+            'sql_queries': statistics.median_low(queries),
+            'sql_queries_max': max(queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def run(self, operations=CATALOG, log=print):
+        fixtures = load_fixtures()
+        # Repeating a query would otherwise measure cache hits.
+        cache_enabled, response_cache.enabled = response_cache.enabled, False
+        try:
+            results = {}
+            for operation in operations:
+                results[operation.name] = self.measure(operation, fixtures)
+                log(format_result(operation.name, results[operation.name]))
+        finally:
+            response_cache.enabled = cache_enabled
+        return {'meta': environment(), 'operations': results}
+
+
+class WriteBenchmark:
+    """Concurrent writers, plus readers, through the real view with committed transactions.
+
+    Shows how the database profile (settings.DATABASE_PROFILE) holds up
+    under contention: each writer thread alternates createCustomer and
+    createOrder for a customer of its own, while readers loop on the
+    reminder query. Everything the run creates is deleted afterwards;
+    orders go with their customers.
+    """
+
+    def __init__(self, writers=8, writes=50, readers=2, path='/graphql/'):
+        self.writers = writers
+        self.writes = writes
+        self.readers = readers
+        self.path = path
+
+    def post(self, client, query, variables):
+        started = time.perf_counter()
+        response = client.post(self.path, json.dumps({'query': query, 'variables': variables}),
+                               content_type='application/json')
+        elapsed = (time.perf_counter() - started) * 1000
+        payload = response.json()
+        errors = payload.get('errors') or [
+            error for result in (payload.get('data') or {}).values() for error in (result or {}).get('errors') or ()
+        ]
+        return elapsed, errors[0]['message'][:120] if errors else None
+
+    def writer(self, index, owner, products, tag, results):
+        client = bench_client()
+        try:
+            for i in range(self.writes):
+                if i % 2:
+                    results.append(self.post(client, CREATE_ORDER_MUTATION, {'customer': owner, 'products': products}))
+                else:
+                    results.append(self.post(client, CREATE_CUSTOMER_MUTATION, {
+                        'name': 'Bench Customer', 'email': f"bench-{tag}-{index}-{i}@example.com",
+                    }))
+        finally:
+            connection.close()
+
+    def reader(self, stop, results):
+        client = bench_client()
+        try:
+            while not stop.is_set():
+                results.append(self.post(client, REMINDER_QUERY, {}))
+        finally:
+            connection.close()
+
+    def run(self, log=print):
+        tag = _unique()
+        products = [str(pk) for pk in Product.objects.order_by('pk').values_list('pk', flat=True)[:3]]
+        if not products:
+            raise BenchmarkError("No products; seed the database with seed_crm first.")
+        owners = [
+            str(Customer.objects.create(name='Bench Writer', email=f"bench-{tag}-writer-{i}@example.com").pk)
+            for i in range(self.writers)
+        ]
+        writes, reads = [], []
+        stop = threading.Event()
+        writers = [
+            threading.Thread(target=self.writer, args=(i, owner, products, tag, writes))
+            for i, owner in enumerate(owners)
+        ]
+        readers = [threading.Thread(target=self.reader, args=(stop, reads)) for _ in range(self.readers)]
+        cache_enabled, response_cache.enabled = response_cache.enabled, False
+        try:
+            started = time.perf_counter()
+            for thread in writers + readers:
+                thread.start()
+            for thread in writers:
+                thread.join()
+            seconds = time.perf_counter() - started
+            stop.set()
+            for thread in readers:
+                thread.join()
+        finally:
+            response_cache.enabled = cache_enabled
+            Customer.objects.filter(email__startswith=f"bench-{tag}-").delete()
+
+        result = {
+            'meta': {**environment(), 'profile': getattr(settings, 'DATABASE_PROFILE', None), **database_settings()},
+            'writers': self.writers,
+            'readers': self.readers,
+            'seconds': round(seconds, 3),
+            'writes': summarize(writes, seconds),
+            'reads': summarize(reads, seconds),
+        }
+        log(format_write_result(result))
+        return result
+
+
+def database_settings():
+    """The connection settings that decide how writers contend."""
+    settings_dict = connections['default'].settings_dict
+    info = {
+        'conn_max_age': settings_dict.get('CONN_MAX_AGE'),
+        'options': {key: value for key, value in settings_dict.get('OPTIONS', {}).items() if key != 'init_command'},
+    }
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout'):
+                cursor.execute(f"PRAGMA {pragma}")
+                info[pragma] = cursor.fetchone()[0]
+    return info
+
+
+def summarize(samples, seconds):
+    latencies = sorted(elapsed for elapsed, error in samples if error is None)
+    errors = Counter(error for _, error in samples if error is not None)
+    summary = {
+        'total': len(samples),
+        'ok': len(latencies),
+        'failed': sum(errors.values()),
+        'per_second': round(len(latencies) / seconds, 1) if seconds else 0.0,
+        'errors': dict(errors.most_common()),
+    }
+    if latencies:
+        summary.update({
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+        })
+    return summary
+
+
+def format_write_result(result):
+    lines = [f"profile {result['meta']['profile']} ({result['meta']['database']}), "
+             f"{result['writers']} writers, {result['readers']} readers, {result['seconds']}s"]
+    for kind in ('writes', 'reads'):
+        summary = result[kind]
+        lines.append(
+            f"{kind:<7} {summary['per_second']:>8.1f}/s  ok {summary['ok']:>6}  failed {summary['failed']:>5}  "
+            f"p50 {summary.get('p50_ms', 0):>8.2f}ms  p95 {summary.get('p95_ms', 0):>8.2f}ms  "
+            f"p99 {summary.get('p99_ms', 0):>8.2f}ms"
+        )
+        for message, count in summary['errors'].items():
+            lines.append(f"        {count:>6} x {message}")
+    return "\n".join(lines)
+
+
+def compare_writes(baseline, current):
+    lines = []
+    for kind in ('writes', 'reads'):
+        before, after = baseline[kind], current[kind]
+        change = f"{(after['per_second'] - before['per_second']) / before['per_second']:+.1%}" if before['per_second'] else "n/a"
+        lines.append(
+            f"{kind:<7} {before['per_second']:.1f}/s -> {after['per_second']:.1f}/s ({change}), "
+            f"failed {before['failed']} -> {after['failed']}"
+        )
+    return lines
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        'revision': git_revision(),
+        'timestamp': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'rows': {
+            'customers': Customer.objects.count(),
+            'products': Product.objects.count(),
+            'orders': Order.objects.count(),
+        },
+    }
+
+
+def format_result(name, result):
+    return (
+        f"{name:<24} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+        f"p99 {result['p99_ms']:>9.2f}ms  sql {result['sql_queries']:>4}  "
+        f"peak {result['peak_memory_kb']:>9.1f}KB"
+    )
+
+
+def compare(baseline, current):
+    """Lines showing how each operation moved relative to a baseline run."""
+    lines = []
+    for name, result in current['operations'].items():
+        before = baseline['operations'].get(name)
+        if before is None:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'sql_queries', 'peak_memory_kb'):
+            if before[key]:
+                changes.append(f"{key} {(result[key] - before[key]) / before[key]:+.1%}")
+        lines.append(f"{name:<24} " + "  ".join(changes))
+    return lines
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import time
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from graphql import TypeInfo, TypeInfoVisitor, Visitor, get_named_type, print_ast, visit
+
+from .models import Customer, Product, Order
+
+
+# Models whose changes we can observe; a query touching anything else is never cached.
+WATCHED_MODELS = (Customer, Product, Order)
+
+
+def model_tag(model):
+    return model._meta.label_lower
+
+
+class _TypeCollector(Visitor):
+    def __init__(self, type_info):
+        super().__init__()
+        self.type_info = type_info
+        self.types = set()
+
+    def enter_field(self, node, *args):
+        field_type = self.type_info.get_type()
+        if field_type is not None:
+            self.types.add(get_named_type(field_type))
+
+
+def document_models(schema, document):
+    """Return the models an operation can read, or None if it reads an unwatched one.
+
+    DjangoObjectTypes map to their model; other object types can name the
+    models they are computed from with a `cache_models` attribute.
+    """
+    type_info = TypeInfo(schema)
+    collector = _TypeCollector(type_info)
+    visit(document, TypeInfoVisitor(type_info, collector))
+
+    models = set()
+    for graphql_type in collector.types:
+        graphene_type = getattr(graphql_type, 'graphene_type', None)
+        if graphene_type is None:
+            continue
+        model = getattr(getattr(graphene_type, '_meta', None), 'model', None)
+        if model is not None:
+            if model not in WATCHED_MODELS:
+                return None
+            models.add(model)
+        models.update(getattr(graphene_type, 'cache_models', ()))
+    return models
+
+
+class ResponseCache:
+    """Opt-in cache of query results in Django's cache framework.
+
+    Entries are keyed by the normalized document, variables, operation name
+    and auth scope, plus the current version of every model tag the query
+    reads. Invalidating a tag bumps its version, so exactly the entries that
+    read that model stop matching and age out through the timeout.
+    """
+
+    def __init__(self, alias='default', timeout=60, enabled=False):
+        self.alias = alias
+        self.timeout = timeout
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _version_key(self, tag):
+        return f"graphql:tag:{tag}"
+
+    def tag_versions(self, tags):
+        keys = {tag: self._version_key(tag) for tag in tags}
+        versions = self.cache.get_many(keys.values())
+        for tag, key in keys.items():
+            if key not in versions:
+                # Seed from the clock so a version key that was itself evicted
+                # can never come back at a value an old entry was stored under.
+                self.cache.add(key, time.time_ns(), timeout=None)
+                versions[key] = self.cache.get(key)
+        return {tag: versions[key] for tag, key in keys.items()}
+
+    def key_for(self, schema, document, variables, operation_name, scope):
+        """Return the cache key for this operation, or None if it can't be cached."""
+        models = document_models(schema, document)
+        if not models:
+            return None
+        versions = self.tag_versions(sorted(model_tag(model) for model in models))
+        payload = json.dumps(
+            [print_ast(document), variables or {}, operation_name, scope, versions],
+            sort_keys=True,
+            cls=DjangoJSONEncoder,
+        )
+        return "graphql:response:" + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        data = self.cache.get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def set(self, key, data):
+        self.cache.set(key, data, timeout=self.timeout)
+
+    def invalidate(self, *models):
+        for model in models:
+            key = self._version_key(model_tag(model))
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.add(key, time.time_ns(), timeout=None)
+            with self._lock:
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+_config = getattr(settings, 'GRAPHQL_RESPONSE_CACHE', {})
+response_cache = ResponseCache(
+    alias=_config.get('CACHE_ALIAS', 'default'),
+    timeout=_config.get('TIMEOUT', 60),
+    enabled=_config.get('ENABLED', False),
+)
+
+
+def invalidate_models(*models):
+    """Invalidate cached responses reading `models` once the current transaction commits."""
+    transaction.on_commit(lambda: response_cache.invalidate(*models))
+
+
+def request_scope(request):
+    """Identify whose view of the data a response is (user, token or anonymous)."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if authorization:
+        return "token:" + hashlib.sha256(authorization.encode('utf-8')).hexdigest()
+    return "anonymous"
@@ -0,0 +1,114 @@
+from graphql import GraphQLError, get_named_type, get_operation_ast
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode, VariableNode
+from graphql.type import GraphQLObjectType, GraphQLInterfaceType
+
+# Relay wrappers don't add a level of nesting from the client's point of view.
+TRANSPARENT_FIELDS = ('edges', 'node')
+
+
+class QueryCostError(GraphQLError):
+    def __init__(self, message, cost, depth):
+        super().__init__(message, extensions={'code': 'QUERY_TOO_EXPENSIVE', 'cost': cost, 'depth': depth})
+
+
+class QueryCostAnalyzer:
+    """Static cost and depth estimate of an operation, computed before execution.
+
+    Every field returning an object costs 1 and scalars are free. A connection
+    multiplies the cost of its selection by `first`/`last` (or `default_page_size`
+    when neither is given), so `allOrders(first: 50) { edges { node { customerId { name } } } }`
+    costs 1 + 50 * 1. `edges`/`node` are free and don't count towards depth.
+    """
+
+    def __init__(self, schema, document, variables=None, operation_name=None, default_page_size=100):
+        self.schema = schema
+        self.document = document
+        self.variables = variables or {}
+        self.operation_name = operation_name
+        self.default_page_size = default_page_size
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if definition.kind == 'fragment_definition'
+        }
+
+    def analyze(self):
+        """Return `(cost, depth)` for the selected operation."""
+        operation = get_operation_ast(self.document, self.operation_name)
+        if operation is None:
+            return 0, 0
+        root_type = self.schema.get_root_type(operation.operation)
+        return self._selection_cost(root_type, operation.selection_set, set())
+
+    def _fields(self, parent_type, selection_set, visited):
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                yield parent_type, selection
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = parent_type
+                if selection.type_condition is not None:
+                    fragment_type = self.schema.get_type(selection.type_condition.name.value)
+                yield from self._fields(fragment_type, selection.selection_set, visited)
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = self.fragments.get(name)
+                if fragment is None or name in visited:
+                    continue
+                fragment_type = self.schema.get_type(fragment.type_condition.name.value)
+                yield from self._fields(fragment_type, fragment.selection_set, visited | {name})
+
+    def _selection_cost(self, parent_type, selection_set, visited):
+        total_cost, max_depth = 0, 0
+        for field_type, field_node in self._fields(parent_type, selection_set, visited):
+            cost, depth = self._field_cost(field_type, field_node, visited)
+            total_cost += cost
+            max_depth = max(max_depth, depth)
+        return total_cost, max_depth
+
+    def _field_cost(self, parent_type, field_node, visited):
+        name = field_node.name.value
+        if not isinstance(parent_type, (GraphQLObjectType, GraphQLInterfaceType)) or name not in parent_type.fields:
+            return 0, 0
+        field = parent_type.fields[name]
+        named_type = get_named_type(field.type)
+        level = 0 if name in TRANSPARENT_FIELDS else 1
+        if field_node.selection_set is None:
+            return 0, level
+
+        child_cost, child_depth = self._selection_cost(named_type, field_node.selection_set, visited)
+        if name in TRANSPARENT_FIELDS:
+            return child_cost, child_depth
+        return 1 + self._multiplier(field, field_node) * child_cost, child_depth + level
+
+    def _multiplier(self, field, field_node):
+        if 'first' not in field.args and 'last' not in field.args:
+            return 1
+        arguments = {argument.name.value: argument.value for argument in field_node.arguments}
+        sizes = [self._argument_value(arguments.get(name)) for name in ('first', 'last')]
+        sizes = [size for size in sizes if size is not None]
+        return max(sizes) if sizes else self.default_page_size
+
+    def _argument_value(self, value_node):
+        if value_node is None:
+            return None
+        if isinstance(value_node, VariableNode):
+            value = self.variables.get(value_node.name.value)
+        else:
+            value = getattr(value_node, 'value', None)
+        try:
+            return max(int(value), 0) if value is not None else None
+        except (TypeError, ValueError):
+            return None
+
+
+def check_query_cost(schema, document, variables=None, operation_name=None,
+                     max_cost=None, max_depth=None, default_page_size=100):
+    """Compute the operation cost and raise QueryCostError if it breaks a limit."""
+    cost, depth = QueryCostAnalyzer(
+        schema, document, variables, operation_name, default_page_size
+    ).analyze()
+    if max_depth is not None and depth > max_depth:
+        raise QueryCostError(f"Query depth {depth} exceeds the maximum depth of {max_depth}.", cost, depth)
+    if max_cost is not None and cost > max_cost:
+        raise QueryCostError(f"Query cost {cost} exceeds the maximum cost of {max_cost}.", cost, depth)
+    return cost, depth
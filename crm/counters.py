@@ -0,0 +1,81 @@
+from django.db.models import Count, F, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .cache import invalidate_models
+from .models import Customer, Order
+
+
+def record_orders(orders):
+    """Add freshly created `orders` to their customers' counters.
+
+    Call it inside the transaction that creates the orders, so counters and
+    orders commit or roll back together. Each customer is one UPDATE with
+    F() expressions, so concurrent writers never lose an increment; customers
+    are updated in pk order so two batches can't deadlock on each other.
+    """
+    totals = {}
+    for order in orders:
+        count, value, last = totals.get(order.customer_id_id, (0, 0, order.order_date))
+        totals[order.customer_id_id] = (count + 1, value + int(order.total_amount), max(last, order.order_date))
+
+    for customer_id in sorted(totals):
+        count, value, last = totals[customer_id]
+        Customer.objects.filter(pk=customer_id).update(
+            order_count=F('order_count') + count,
+            lifetime_value=F('lifetime_value') + value,
+            last_order_at=Greatest(Coalesce('last_order_at', Value(last)), Value(last)),
+        )
+    if totals:
+        invalidate_models(Customer)
+
+
+def forget_order(order):
+    """Take a deleted `order` off its customer's counters.
+
+    Sent for every deleted order (post_delete), cascades included. Count and
+    value are decremented with F() like record_orders adds them, floored at
+    zero in case they had drifted; last_order_at can't be undone that way, so
+    it is recomputed from the customer's remaining orders.
+    """
+    Customer.objects.filter(pk=order.customer_id_id).update(
+        order_count=Greatest(F('order_count') - 1, Value(0)),
+        lifetime_value=Greatest(F('lifetime_value') - int(order.total_amount), Value(0)),
+        last_order_at=customer_counter_expressions()['last_order_at'],
+    )
+    invalidate_models(Customer)
+
+
+def _order_aggregate(aggregate):
+    orders = Order.objects.filter(customer_id=OuterRef('pk')).order_by().values('customer_id')
+    return Subquery(orders.annotate(value=aggregate).values('value'))
+
+
+def customer_counter_expressions():
+    """The counters' true values, as correlated subqueries over Order."""
+    return {
+        'order_count': Coalesce(_order_aggregate(Count('id')), 0),
+        'lifetime_value': Coalesce(_order_aggregate(Sum('total_amount')), 0, output_field=IntegerField()),
+        'last_order_at': _order_aggregate(Max('order_date')),
+    }
+
+
+def stale_customers():
+    """Customers whose stored counters don't match their orders."""
+    expressions = customer_counter_expressions()
+    customers = Customer.objects.annotate(**{f"actual_{name}": expr for name, expr in expressions.items()})
+    return customers.exclude(
+        Q(order_count=F('actual_order_count'))
+        & Q(lifetime_value=F('actual_lifetime_value'))
+        & (
+            Q(last_order_at=F('actual_last_order_at'))
+            | Q(last_order_at__isnull=True, actual_last_order_at__isnull=True)
+        )
+    )
+
+
+def reconcile_customer_counters(customers=None):
+    """Recompute the counters of `customers` (default: all) in one UPDATE."""
+    customers = Customer.objects.all() if customers is None else customers
+    updated = customers.update(**customer_counter_expressions())
+    invalidate_models(Customer)
+    return updated
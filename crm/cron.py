@@ -2,31 +2,30 @@ from datetime import datetime, timedelta, timezone
 from gql import Client, gql
 import asyncio
 from gql.transport.requests import RequestsHTTPTransport
+import requests
+from django.conf import settings
 
-async def log_crm_heartbeat():
+def log_crm_heartbeat():
+  """Poll the readiness endpoint and log whether the CRM and its dependencies are up."""
   HEART_BEAT_LOG = "/tmp/crm_heartbeat_log.txt"
-  transport = RequestsHTTPTransport(url="http://localhost:8000/graphql/")
-  
-  async with Client(transport=transport, fetch_schema_from_transport=True) as session:
-      query = gql(
-          """
-          query {
-            hello
-          }
-          """
-      )
-      
-      result = await session.execute(query)
-      if result and result.get('hello') == 'Hello, world!':
-          with open(HEART_BEAT_LOG, 'a') as f:
-              log_timestamp = datetime.now(timezone.utc).strftime('%d/%m/%Y-%H:%M:%S')
-              f.write(f"{log_timestamp} - CRM is alive\n")
-          print(f"CRM is alive at {log_timestamp}")
-      else:
-          with open(HEART_BEAT_LOG, 'a') as f:
-              log_timestamp = datetime.now(timezone.utc).strftime('%d/%m/%Y-%H:%M:%S')
-              f.write(f"{log_timestamp} - CRM is not responding\n")
-          print(f"CRM is not responding at {log_timestamp}")
+  timeout = getattr(settings, 'HEALTH_CHECK_TIMEOUT', 2)
+
+  try:
+      response = requests.get(settings.CRM_HEALTH_URL, timeout=timeout + 1)
+      report = response.json()
+      alive = response.status_code == 200
+  except (requests.RequestException, ValueError) as e:
+      report = {'error': str(e)}
+      alive = False
+
+  checks = ", ".join(
+      f"{name} {'ok' if check['ok'] else 'FAIL'} {check['latency_ms']}ms"
+      for name, check in report.get('checks', {}).items()
+  ) or report.get('error', '')
+  log_timestamp = datetime.now(timezone.utc).strftime('%d/%m/%Y-%H:%M:%S')
+  status = "CRM is alive" if alive else "CRM is not responding"
+  with open(HEART_BEAT_LOG, 'a') as f:
+      f.write(f"{log_timestamp} - {status} ({checks})\n")
 
 
 async def update_low_stock():
@@ -66,5 +65,5 @@ async def update_low_stock():
 
 
 if __name__ == "__main__":
-    asyncio.run(log_crm_heartbeat())
+    log_crm_heartbeat()
     asyncio.run(update_low_stock())
\ No newline at end of file
@@ -0,0 +1,45 @@
+"""Events published for GraphQL subscriptions.
+
+Each helper publishes once the current transaction commits, so subscribers
+never hear about rows that were rolled back, and only ids (plus the stock,
+for filtering) go over the wire: the subscription loads the objects itself.
+"""
+import logging
+
+from django.db import transaction
+
+from .pubsub import get_pubsub
+
+logger = logging.getLogger(__name__)
+
+ORDER_CREATED = 'crm.order_created'
+CUSTOMER_CREATED = 'crm.customer_created'
+PRODUCT_STOCK_CHANGED = 'crm.product_stock_changed'
+
+
+def publish_on_commit(channel, message):
+    def publish():
+        try:
+            get_pubsub().publish(channel, message)
+        except Exception:
+            # The write went through; a lost event must not fail the request.
+            logger.exception("Could not publish to %s.", channel)
+
+    transaction.on_commit(publish)
+
+
+def orders_created(orders):
+    if orders:
+        publish_on_commit(ORDER_CREATED, {'ids': [order.pk for order in orders]})
+
+
+def customers_created(customers):
+    if customers:
+        publish_on_commit(CUSTOMER_CREATED, {'ids': [str(customer.pk) for customer in customers]})
+
+
+def stock_changed(products):
+    if products:
+        publish_on_commit(PRODUCT_STOCK_CHANGED, {
+            'products': [[str(product.pk), product.stock] for product in products],
+        })
@@ -0,0 +1,310 @@
+import base64
+import inspect
+import json
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q, QuerySet
+from django_filters import OrderingFilter
+from graphene.relay.connection import PageInfo
+from graphene_django.fields import connection_adapter, page_info_adapter
+from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.utils import maybe_queryset
+from graphql import GraphQLError
+from graphql_relay import connection_from_array_slice, cursor_to_offset, get_offset_with_default, offset_to_cursor
+
+from .loaders import get_loaders
+from .optimizer import optimize_queryset
+
+
+class BatchedConnectionField(DjangoFilterConnectionField):
+    """Filter connection that feeds its page into the request's loaders.
+
+    Nested relations (e.g. `OrderType.product_ids`) resolve to plain lists
+    coming from a loader. Those are paginated as-is unless the client passes
+    filter arguments, in which case we fall back to a filtered queryset.
+    Querysets get select_related/prefetch_related for the selected relations.
+    """
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, filtering_args, filterset_class):
+        # List-typed orderings reach the OrderingFilter as the comma-separated
+        # string it parses.
+        orderings = {
+            name: ",".join(value) for name, value in args.items()
+            if isinstance(value, list) and isinstance(filterset_class.base_filters.get(name), OrderingFilter)
+        }
+        if orderings:
+            args = {**args, **orderings}
+        if isinstance(iterable, list):
+            if not any(args.get(name) is not None for name in filtering_args):
+                return iterable
+            model = connection._meta.node._meta.model
+            iterable = model._default_manager.filter(pk__in=[obj.pk for obj in iterable])
+        queryset = super().resolve_queryset(
+            connection, iterable, info, args, filtering_args, filterset_class
+        )
+        return optimize_queryset(queryset, info)
+
+    @classmethod
+    def connection_resolver(cls, resolver, connection, default_manager, queryset_resolver,
+                            max_limit, enforce_first_or_last, root, info, **args):
+        loaders = get_loaders(info.context)
+        if loaders.is_async:
+            return cls.connection_resolver_async(
+                resolver, connection, default_manager, queryset_resolver,
+                max_limit, enforce_first_or_last, root, info, **args
+            )
+        resolved = super().connection_resolver(
+            resolver, connection, default_manager, queryset_resolver,
+            max_limit, enforce_first_or_last, root, info, **args
+        )
+        loaders.enqueue_nodes(edge.node for edge in resolved.edges)
+        return resolved
+
+    @classmethod
+    async def connection_resolver_async(cls, resolver, connection, default_manager, queryset_resolver,
+                                        max_limit, enforce_first_or_last, root, info, **args):
+        """Async counterpart of `connection_resolver`, used under the async executor.
+
+        The resolver may return an awaitable (an async loader); querysets are
+        counted and sliced through Django's async ORM.
+        """
+        # Same argument checks as DjangoConnectionField.connection_resolver.
+        first, last = args.get('first'), args.get('last')
+        if enforce_first_or_last:
+            assert first or last, (
+                f"You must provide a `first` or `last` value to properly paginate the `{info.field_name}` connection."
+            )
+        if max_limit:
+            for name, value in (('first', first), ('last', last)):
+                if value:
+                    assert value <= max_limit, (
+                        f"Requesting {value} records on the `{info.field_name}` connection "
+                        f"exceeds the `{name}` limit of {max_limit} records."
+                    )
+        if args.get('offset') is not None:
+            assert args.get('before') is None, (
+                f"You can't provide a `before` value at the same time as an `offset` value "
+                f"to properly paginate the `{info.field_name}` connection."
+            )
+
+        iterable = resolver(root, info, **args)
+        if inspect.isawaitable(iterable):
+            iterable = await iterable
+        if iterable is None:
+            iterable = default_manager
+        iterable = queryset_resolver(connection, iterable, info, args)
+        resolved = await cls.resolve_connection_async(connection, args, iterable, max_limit=max_limit)
+        get_loaders(info.context).enqueue_nodes(edge.node for edge in resolved.edges)
+        return resolved
+
+    @classmethod
+    async def resolve_connection_async(cls, connection, args, iterable, max_limit=None):
+        iterable = maybe_queryset(iterable)
+        if not isinstance(iterable, QuerySet):
+            return cls.resolve_connection(connection, args, iterable, max_limit=max_limit)
+
+        # Same offset/max_limit handling as DjangoConnectionField.resolve_connection.
+        offset = args.pop('offset', None)
+        after = args.get('after')
+        if offset:
+            if after:
+                offset += cursor_to_offset(after) + 1
+            args['after'] = offset_to_cursor(offset - 1)
+        if max_limit is not None and args.get('first') is None and args.get('last') is None:
+            args['first'] = max_limit
+
+        array_length = await iterable.acount()
+        start, end = slice_bounds(args, array_length)
+        nodes = [node async for node in iterable[start:end]] if end > start else []
+
+        resolved = connection_from_array_slice(
+            nodes,
+            args,
+            slice_start=start,
+            array_length=array_length,
+            array_slice_length=len(nodes),
+            connection_type=partial(connection_adapter, connection),
+            edge_type=connection.Edge,
+            page_info_type=page_info_adapter,
+        )
+        resolved.iterable = iterable
+        resolved.length = array_length
+        return resolved
+
+
+def slice_bounds(args, array_length):
+    """The `[start, end)` rows a relay page covers, as graphql_relay computes them."""
+    start, end = 0, array_length
+    after_offset = get_offset_with_default(args.get('after'), -1)
+    if 0 <= after_offset < array_length:
+        start = after_offset + 1
+    before_offset = get_offset_with_default(args.get('before'), end)
+    if 0 <= before_offset < array_length:
+        end = min(end, before_offset)
+    first, last = args.get('first'), args.get('last')
+    if isinstance(first, int):
+        if first < 0:
+            raise GraphQLError("Argument 'first' must be a non-negative integer.")
+        end = min(end, start + first)
+    if isinstance(last, int):
+        if last < 0:
+            raise GraphQLError("Argument 'last' must be a non-negative integer.")
+        start = max(start, end - last)
+    return start, max(start, end)
+
+
+def encode_keyset_cursor(obj, keys):
+    values = [getattr(obj, key.lstrip('-')) for key in keys]
+    payload = json.dumps(values, default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_keyset_cursor(cursor, keys):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise GraphQLError(f"Invalid cursor: {cursor}")
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise GraphQLError(f"Invalid cursor: {cursor}")
+    return values
+
+
+def keyset_filter(keys, values, forward=True):
+    """Build the row-comparison predicate `(k1, k2, ...) > (v1, v2, ...)`.
+
+    Each key sorts in its own direction (`-name` is descending); `forward=False`
+    flips every comparison to walk the keyset backwards.
+    """
+    condition = Q()
+    for i, key in enumerate(keys):
+        name = key.lstrip('-')
+        ascending = not key.startswith('-')
+        lookup = 'gt' if ascending == forward else 'lt'
+        clause = Q(**{f"{name}__{lookup}": values[i]})
+        for prev_key, prev_value in zip(keys[:i], values[:i]):
+            clause &= Q(**{prev_key.lstrip('-'): prev_value})
+        condition |= clause
+    return condition
+
+
+class KeysetConnectionField(BatchedConnectionField):
+    """Opt-in connection paginated by keyset instead of offset.
+
+    Cursors carry the sort key values plus the primary key of the edge, so
+    each page is a range scan on `(keyset..., pk)` with a LIMIT, whatever the
+    depth. `keyset` lists the sort fields (prefix with `-` for descending);
+    the primary key is always appended as a tiebreaker. No total count is
+    computed, and `offset` is not supported.
+    """
+
+    def __init__(self, type_, keyset=(), *args, **kwargs):
+        self.keyset = tuple(keyset)
+        super().__init__(type_, *args, **kwargs)
+
+    @property
+    def args(self):
+        args = super().args
+        args.pop('offset', None)
+        return args
+
+    @args.setter
+    def args(self, args):
+        self._base_args = args
+
+    @property
+    def filtering_args(self):
+        # The keyset fixes the order, so an OrderingFilter (`orderBy`) isn't offered.
+        base_filters = self.filterset_class.base_filters
+        return {
+            name: arg for name, arg in super().filtering_args.items()
+            if not isinstance(base_filters.get(name), OrderingFilter)
+        }
+
+    @property
+    def keys(self):
+        pk_name = self.model._meta.pk.name
+        direction = '-' if self.keyset and self.keyset[-1].startswith('-') else ''
+        return self.keyset + (f"{direction}{pk_name}",)
+
+    def wrap_resolve(self, parent_resolver):
+        return partial(
+            self.keyset_connection_resolver,
+            self.keys,
+            self.resolver or parent_resolver,
+            self.connection_type,
+            self.get_manager(),
+            self.get_queryset_resolver(),
+            self.max_limit,
+        )
+
+    @classmethod
+    def keyset_connection_resolver(cls, keys, resolver, connection, default_manager,
+                                   queryset_resolver, max_limit, root, info, **args):
+        loaders = get_loaders(info.context)
+        iterable = resolver(root, info, **args)
+        if iterable is None:
+            iterable = default_manager
+        queryset = queryset_resolver(connection, iterable, info, args)
+        if loaders.is_async:
+            return cls.resolve_keyset_connection_async(connection, args, queryset, keys, max_limit, loaders)
+        resolved = cls.resolve_keyset_connection(connection, args, queryset, keys, max_limit)
+        loaders.enqueue_nodes(edge.node for edge in resolved.edges)
+        return resolved
+
+    @classmethod
+    async def resolve_keyset_connection_async(cls, connection, args, queryset, keys, max_limit, loaders):
+        resolved = await sync_to_async(cls.resolve_keyset_connection)(connection, args, queryset, keys, max_limit)
+        loaders.enqueue_nodes(edge.node for edge in resolved.edges)
+        return resolved
+
+    @classmethod
+    def resolve_keyset_connection(cls, connection, args, queryset, keys, max_limit=None):
+        first, last = args.get('first'), args.get('last')
+        after, before = args.get('after'), args.get('before')
+        if first is not None and first < 0:
+            raise GraphQLError("Argument 'first' must be a non-negative integer.")
+        if last is not None and last < 0:
+            raise GraphQLError("Argument 'last' must be a non-negative integer.")
+        if max_limit is not None:
+            if (first or 0) > max_limit or (last or 0) > max_limit:
+                raise GraphQLError(f"Requesting more than {max_limit} records is not allowed.")
+            if first is None and last is None:
+                first = max_limit
+
+        queryset = queryset.order_by(*keys)
+        if after:
+            queryset = queryset.filter(keyset_filter(keys, decode_keyset_cursor(after, keys)))
+        if before:
+            queryset = queryset.filter(
+                keyset_filter(keys, decode_keyset_cursor(before, keys), forward=False)
+            )
+
+        has_next_page = has_previous_page = False
+        if last is not None and first is None:
+            nodes = list(queryset.reverse()[:last + 1])
+            has_previous_page = len(nodes) > last
+            nodes = nodes[:last][::-1]
+            has_next_page = bool(before)
+        else:
+            nodes = list(queryset[:first + 1])
+            has_next_page = len(nodes) > first
+            nodes = nodes[:first]
+            if last is not None:
+                has_previous_page = len(nodes) > last
+                nodes = nodes[len(nodes) - last:] if last else []
+            else:
+                has_previous_page = bool(after)
+
+        edges = [
+            connection.Edge(node=node, cursor=encode_keyset_cursor(node, keys))
+            for node in nodes
+        ]
+        page_info = PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=has_previous_page,
+            has_next_page=has_next_page,
+        )
+        return connection(edges=edges, page_info=page_info)
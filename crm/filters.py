@@ -1,24 +1,85 @@
 import django_filters
+import graphene
+from django_filters.constants import EMPTY_VALUES
+from graphene_django.filter import TypedFilter
 from crm.models import Customer, Order, Product
+from crm.phones import normalize_phone, phone_prefix_range
 import re
 
 
+class StableOrderingFilter(TypedFilter, django_filters.OrderingFilter):
+    """OrderingFilter that adds the pk as a final key, in the direction of the last one.
+
+    Keeps pages stable across equal values and lets `(field, id)` indexes be
+    walked in either direction. The GraphQL argument is a list of keys,
+    `orderBy: ["-lifetimeValue", "name"]`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('input_type', graphene.List(graphene.String))
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        ordering = [self.get_ordering_value(param) for param in value]
+        pk = qs.model._meta.pk.name
+        return qs.order_by(*ordering, f"-{pk}" if ordering[-1].startswith('-') else pk)
+
+
 class CustomerFilter(django_filters.FilterSet):
   
+    phone_exact = django_filters.CharFilter(
+        field_name='phone_normalized',
+        method='filter_phone_exact',
+        label="Phone Number (any accepted format, matched in E.164)"
+    )
+
+    phone_prefix = django_filters.CharFilter(
+        field_name='phone_normalized',
+        method='filter_phone_prefix',
+        label="Phone Number Prefix (E.164, e.g., +1555)"
+    )
+
+    # Expensive: a regex can't use an index, so this scans every customer.
+    # Prefer phoneExact / phonePrefix.
     phone_pattern = django_filters.CharFilter(
         field_name='phone',
         lookup_expr='regex',
-        label="Phone Number Pattern (regex, e.g., ^\\+1.*)"
+        label="Phone Number Pattern (regex, e.g., ^\\+1.*; full scan, prefer phonePrefix)"
     )
   
+    # orderBy: "-lifetimeValue" (top spenders), "orderCount" (no orders first), ...
+    order_by = StableOrderingFilter(
+        fields=('name', 'created_at', 'order_count', 'lifetime_value', 'last_order_at'),
+    )
+
     class Meta:
         model = Customer
         fields = {
             'name': ['exact', 'icontains'],
             'email': ['exact', 'icontains'],
             'created_at': ['date__gte', 'date__lte'],
+            'order_count': ['exact', 'gte', 'lte'],
+            'lifetime_value': ['gte', 'lte'],
+            'last_order_at': ['gte', 'lte', 'isnull'],
         }
 
+    def filter_phone_exact(self, queryset, name, value):
+        normalized = normalize_phone(value)
+        if normalized is None:
+            return queryset.none()
+        return queryset.filter(**{name: normalized})
+
+    def filter_phone_prefix(self, queryset, name, value):
+        bounds = phone_prefix_range(value)
+        if bounds is None:
+            return queryset
+        # A range rather than startswith: LIKE can't use a plain index on
+        # every backend, a range always can.
+        low, high = bounds
+        return queryset.filter(**{f"{name}__gte": low, f"{name}__lt": high})
+
 
 class ProductFilter(django_filters.FilterSet):
     class Meta:
@@ -32,19 +93,19 @@ class ProductFilter(django_filters.FilterSet):
         
 class OrderFilter(django_filters.FilterSet):
     customer_name = django_filters.CharFilter(
-        field_name='customer__name',
+        field_name='customer_id__name',
         lookup_expr='icontains',
         label="Customer Name (contains)"
     )
     
     product_name = django_filters.CharFilter(
-        field_name='product__name',
+        field_name='product_ids__name',
         lookup_expr='icontains',
         label="Product Name (contains)"
     )
     
     product_id = django_filters.UUIDFilter(
-        field_name='product__product_id',
+        field_name='product_ids__product_id',
         lookup_expr='exact',
         label="Product ID (exact)"
     )
@@ -0,0 +1,87 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from kombu import Connection
+
+
+def check_database(timeout):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+
+
+def check_broker(timeout):
+    with Connection(settings.CELERY_BROKER_URL, connect_timeout=timeout) as broker:
+        broker.ensure_connection(max_retries=1, timeout=timeout)
+
+
+# Once the database has caught up with the migrations on disk it stays that
+# way for the life of the process, so a clean result is only computed once.
+_migrations_applied = False
+
+
+def check_migrations(timeout):
+    global _migrations_applied
+    if _migrations_applied:
+        return
+    executor = MigrationExecutor(connection)
+    plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    if plan:
+        raise RuntimeError(f"{len(plan)} unapplied migration(s)")
+    _migrations_applied = True
+
+
+READINESS_CHECKS = {
+    'database': check_database,
+    'broker': check_broker,
+    'migrations': check_migrations,
+}
+
+# Room for a second round of probes while a stuck one is still timing out.
+_executor = ThreadPoolExecutor(max_workers=2 * len(READINESS_CHECKS), thread_name_prefix='readyz')
+
+
+def _probe(check, timeout):
+    started = time.perf_counter()
+    try:
+        check(timeout)
+        error = None
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+    finally:
+        # Probes run on pool threads; don't leave a connection open on each.
+        connection.close()
+    return {
+        'ok': error is None,
+        'latency_ms': round((time.perf_counter() - started) * 1000, 3),
+        'error': error,
+    }
+
+
+def run_checks(checks=READINESS_CHECKS, timeout=None):
+    """Run `checks` concurrently and return `(ok, {name: result})`.
+
+    Each result reports `ok`, `latency_ms` and `error`. A check that hasn't
+    finished within `timeout` seconds is reported as failed; the call never
+    blocks much longer than that.
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'HEALTH_CHECK_TIMEOUT', 2)
+    started = time.perf_counter()
+    futures = {name: _executor.submit(_probe, check, timeout) for name, check in checks.items()}
+    wait(futures.values(), timeout=timeout)
+
+    results = {}
+    for name, future in futures.items():
+        if future.done():
+            results[name] = future.result()
+        else:
+            results[name] = {
+                'ok': False,
+                'latency_ms': round((time.perf_counter() - started) * 1000, 3),
+                'error': f"timed out after {timeout}s",
+            }
+    return all(result['ok'] for result in results.values()), results
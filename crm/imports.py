@@ -0,0 +1,402 @@
+"""Streaming bulk import of customers and products from CSV or NDJSON.
+
+Rows are read one at a time and handled in batches, so memory stays bounded
+by the batch size however large the file is. Each batch is validated with
+the same rules as the GraphQL mutations, checked against the database with
+one query, and written with prepared executemany statements in its own
+transaction. Rejected rows go to an error sink with their line number.
+"""
+import csv
+import json
+import time
+import uuid
+from decimal import Decimal, InvalidOperation
+from types import SimpleNamespace
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .cache import invalidate_models
+from .models import Customer, Product, customers_with_emails
+from .phones import normalize_phone, validate_phone_number
+from .search import get_search_backend
+
+DEFAULT_BATCH_SIZE = 5000
+FORMATS = ('csv', 'ndjson')
+
+
+class ImportFormatError(Exception):
+    """The input as a whole can't be imported (bad format, missing columns)."""
+
+
+def detect_format(filename):
+    if filename and filename.lower().endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return 'csv'
+
+
+def read_rows(lines, format='csv', required=()):
+    """Yield `(line_number, row_dict)` from an iterable of text lines.
+
+    Rows that can't be parsed are yielded as `(line_number, exception)`. A CSV
+    header lacking one of the `required` columns fails the whole import.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(lines)
+        missing = [column for column in required if column not in (reader.fieldnames or ())]
+        if missing:
+            raise ImportFormatError(f"Missing CSV columns: {', '.join(missing)}.")
+        try:
+            for row in reader:
+                # line_num is where the record ended, which is where a
+                # multi-line quoted field puts it for the user too.
+                yield reader.line_num, row
+        except csv.Error as e:
+            raise ImportFormatError(f"Line {reader.line_num}: {e}")
+    elif format == 'ndjson':
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, e
+                continue
+            yield line_number, row if isinstance(row, dict) else ValueError("Expected a JSON object.")
+    else:
+        raise ImportFormatError(f"Unknown format {format!r}; expected one of {', '.join(FORMATS)}.")
+
+
+def _text(row, field):
+    value = row.get(field)
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+class RowError:
+    __slots__ = ('line', 'field', 'message', 'row')
+
+    def __init__(self, line, field, message, row=None):
+        self.line = line
+        self.field = field
+        self.message = message
+        self.row = row
+
+    def as_dict(self):
+        return {'line': self.line, 'field': self.field, 'message': self.message}
+
+
+class ErrorFile:
+    """Writes rejected rows as CSV: line, field, message and the original row as JSON."""
+
+    def __init__(self, stream):
+        self.writer = csv.writer(stream)
+        self.writer.writerow(['line', 'field', 'message', 'row'])
+
+    def __call__(self, error):
+        row = error.row if isinstance(error.row, dict) else None
+        self.writer.writerow([error.line, error.field, error.message, json.dumps(row, default=str)])
+
+
+class RowWriter:
+    """Prepared INSERT and UPDATE statements for one model, run with executemany.
+
+    bulk_create pushes every value of every row through several layers of
+    field methods, which caps it at a few thousand rows a second. Here the
+    columns a row doesn't supply get their default once per batch (a fresh
+    one per row for callables such as the uuid4 pk), and only values the
+    driver can't take as they are go through get_db_prep_save.
+    """
+
+    PASSTHROUGH_TYPES = {
+        'CharField', 'TextField', 'IntegerField', 'BigIntegerField',
+        'PositiveIntegerField', 'PositiveBigIntegerField', 'BooleanField',
+    }
+
+    def __init__(self, model):
+        self.model = model
+        self.fields = model._meta.concrete_fields
+        self.pk = model._meta.pk
+        self.table = connection.ops.quote_name(model._meta.db_table)
+
+    def prepare(self, field, value):
+        if value is None or field.get_internal_type() in self.PASSTHROUGH_TYPES:
+            return value
+        return field.get_db_prep_save(value, connection)
+
+    def insert(self, rows):
+        """Insert `rows`, dicts of attname to value; missing pks are generated into them."""
+        now = timezone.now()
+        constants, per_row = {}, []
+        for field in self.fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                constants[field.attname] = self.prepare(field, now)
+            elif field is self.pk or callable(field.default):
+                per_row.append(field)
+            else:
+                constants[field.attname] = self.prepare(field, field.get_default())
+
+        values = []
+        for row in rows:
+            if row.get(self.pk.attname) is None:
+                row[self.pk.attname] = self.pk.get_default()
+            prepared = dict(constants)
+            for field in per_row:
+                prepared[field.attname] = self.prepare(field, row[field.attname] if field.attname in row else field.get_default())
+            for attname, value in row.items():
+                if attname in constants:
+                    prepared[attname] = self.prepare(self.model._meta.get_field(attname), value)
+            values.append([prepared[field.attname] for field in self.fields])
+
+        columns = ", ".join(connection.ops.quote_name(field.column) for field in self.fields)
+        placeholders = ", ".join(["%s"] * len(self.fields))
+        with connection.cursor() as cursor:
+            cursor.executemany(f"INSERT INTO {self.table} ({columns}) VALUES ({placeholders})", values)
+
+    def update(self, rows, attnames):
+        """Set `attnames` (plus any auto_now field) on `rows`, matched by pk."""
+        now = timezone.now()
+        fields = [self.model._meta.get_field(attname) for attname in attnames]
+        auto_now = [field for field in self.fields if getattr(field, 'auto_now', False) and field not in fields]
+        assignments = ", ".join(f"{connection.ops.quote_name(field.column)} = %s" for field in fields + auto_now)
+        values = [
+            [self.prepare(field, row[field.attname]) for field in fields]
+            + [self.prepare(field, now) for field in auto_now]
+            + [self.prepare(self.pk, row[self.pk.attname])]
+            for row in rows
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE {self.table} SET {assignments} WHERE {connection.ops.quote_name(self.pk.column)} = %s",
+                values,
+            )
+
+
+class Importer:
+    """Validate and write one model's rows in batches.
+
+    Subclasses implement `clean(row) -> (values, errors)`, where values maps
+    field attnames to Python values and errors is a list of `(field,
+    message)`; `key(values)`, the natural key rows are matched on (None for
+    rows that are always inserted); and `existing(keys)`, mapping the keys
+    already in the database to their pks.
+    """
+
+    model = None
+    required_columns = ()
+    update_fields = ()
+
+    def __init__(self, upsert=False, batch_size=DEFAULT_BATCH_SIZE, search_index=True, on_error=None):
+        self.upsert = upsert
+        self.batch_size = batch_size
+        self.search_index = search_index
+        self.on_error = on_error or (lambda error: None)
+        self.writer = RowWriter(self.model)
+        self.rows = self.created = self.updated = self.failed = 0
+
+    def clean(self, row):
+        raise NotImplementedError
+
+    def key(self, values):
+        return None
+
+    def existing(self, keys):
+        return {}
+
+    def reject(self, line, field, message, row=None):
+        self.failed += 1
+        self.on_error(RowError(line, field, message, row))
+
+    def run(self, rows):
+        """Import `(line, row)` pairs; returns the counts as a dict."""
+        started = time.perf_counter()
+        batch = []
+        for line, row in rows:
+            self.rows += 1
+            batch.append((line, row))
+            if len(batch) >= self.batch_size:
+                self.process(batch)
+                batch = []
+        if batch:
+            self.process(batch)
+        if self.created or self.updated:
+            invalidate_models(self.model)
+        return self.summary(time.perf_counter() - started)
+
+    def summary(self, elapsed):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(self.rows / elapsed) if elapsed else None,
+        }
+
+    def process(self, batch):
+        valid, keys = [], set()
+        for line, row in batch:
+            if isinstance(row, Exception):
+                self.reject(line, '__all__', f"Unreadable row: {row}")
+                continue
+            values, errors = self.clean(row)
+            key = self.key(values) if not errors else None
+            if key is not None and key in keys:
+                errors.append(self.duplicate_in_file)
+            if errors:
+                for field, message in errors:
+                    self.reject(line, field, message, row)
+                continue
+            if key is not None:
+                keys.add(key)
+            valid.append((line, row, values))
+
+        existing = self.existing(keys) if keys else {}
+        to_create, to_update = [], []
+        for line, row, values in valid:
+            pk = existing.get(self.key(values))
+            if pk is None:
+                to_create.append((line, row, values))
+            elif self.upsert:
+                values[self.model._meta.pk.attname] = pk
+                to_update.append((line, row, values))
+            else:
+                self.reject(line, *self.already_exists, row)
+
+        try:
+            self.write(to_create, to_update)
+        except IntegrityError:
+            # Something else wrote a conflicting row meanwhile: fall back to
+            # one row at a time so only the offending rows fail.
+            for entry in to_create:
+                self.write([entry], [])
+            for entry in to_update:
+                self.write([], [entry])
+
+    def write(self, to_create, to_update):
+        created = [values for _, _, values in to_create]
+        updated = [values for _, _, values in to_update]
+        try:
+            with transaction.atomic():
+                if created:
+                    self.writer.insert(created)
+                if updated:
+                    self.writer.update(updated, self.update_fields)
+                if self.search_index:
+                    # Raw writes send no post_save, so index here.
+                    get_search_backend().index(
+                        self.model, [SimpleNamespace(pk=values[self.model._meta.pk.attname], **values) for values in created + updated]
+                    )
+        except IntegrityError as e:
+            if len(created) + len(updated) > 1:
+                raise
+            line, row, _ = (to_create or to_update)[0]
+            self.reject(line, '__all__', f"Database constraint: {e}", row)
+            return
+        self.created += len(created)
+        self.updated += len(updated)
+
+
+class CustomerImporter(Importer):
+    """Columns: name, email, phone, address. Upserts match on email."""
+
+    model = Customer
+    required_columns = ('name', 'email')
+    update_fields = ('name', 'phone', 'phone_normalized', 'address')
+    duplicate_in_file = ('email', "Email appears more than once in this file.")
+    already_exists = ('email', "Email already exists.")
+
+    def clean(self, row):
+        errors = []
+        name, email, phone, address = (_text(row, field) for field in ('name', 'email', 'phone', 'address'))
+
+        if not name:
+            errors.append(('name', "Name is required."))
+        elif len(name) > Customer._meta.get_field('name').max_length:
+            errors.append(('name', "Name is too long."))
+        try:
+            validate_email(email)
+        except ValidationError:
+            errors.append(('email', "Invalid email format."))
+        if phone:
+            phone_error = validate_phone_number(phone)
+            if phone_error:
+                errors.append(('phone', phone_error))
+
+        values = {
+            'name': name,
+            'email': email,
+            'phone': phone or None,
+            'phone_normalized': normalize_phone(phone),
+            'address': address or None,
+        }
+        return values, errors
+
+    def key(self, values):
+        # Emails are unique regardless of case.
+        return values['email'].lower()
+
+    def existing(self, keys):
+        return dict(customers_with_emails(keys).values_list('email_lower', 'pk'))
+
+
+class ProductImporter(Importer):
+    """Columns: name, description, price, stock and optionally product_id.
+
+    Rows with a product_id update that product when upserting; rows without
+    one are always inserted.
+    """
+
+    model = Product
+    required_columns = ('name', 'price')
+    update_fields = ('name', 'description', 'price', 'stock')
+    duplicate_in_file = ('product_id', "product_id appears more than once in this file.")
+    already_exists = ('product_id', "Product already exists.")
+
+    def clean(self, row):
+        errors = []
+        name, description = _text(row, 'name'), _text(row, 'description')
+        if not name:
+            errors.append(('name', "Name is required."))
+        elif len(name) > Product._meta.get_field('name').max_length:
+            errors.append(('name', "Name is too long."))
+
+        price = None
+        try:
+            price = Decimal(_text(row, 'price'))
+            if not price.is_finite() or price <= 0:
+                errors.append(('price', "Price must be positive."))
+        except InvalidOperation:
+            errors.append(('price', "Price must be a number."))
+
+        stock = 0
+        if _text(row, 'stock'):
+            try:
+                stock = int(_text(row, 'stock'))
+                if stock < 0:
+                    errors.append(('stock', "Stock cannot be negative."))
+            except ValueError:
+                errors.append(('stock', "Stock must be a whole number."))
+
+        values = {'name': name, 'description': description, 'price': price, 'stock': stock}
+        if _text(row, 'product_id'):
+            try:
+                values['product_id'] = uuid.UUID(_text(row, 'product_id'))
+            except ValueError:
+                errors.append(('product_id', "Invalid UUID."))
+        return values, errors
+
+    def key(self, values):
+        return values.get('product_id')
+
+    def existing(self, keys):
+        return {pk: pk for pk in Product.objects.filter(pk__in=keys).values_list('pk', flat=True)}
+
+
+IMPORTERS = {
+    'customers': CustomerImporter,
+    'products': ProductImporter,
+}
@@ -0,0 +1,173 @@
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from graphene.utils.dataloader import DataLoader as AsyncDataLoader
+
+from .models import Customer, Product, Order
+
+
+class DataLoader:
+    """Per-request batching loader.
+
+    The view executes synchronously, so there is no event loop tick to batch
+    on. Instead keys are queued up front (by the connection that produced the
+    parent nodes) and the first `load()` that misses the cache fetches every
+    queued key in a single query.
+    """
+
+    def __init__(self, batch_load_fn, default=None):
+        self.batch_load_fn = batch_load_fn
+        self.default = default
+        self._cache = {}
+        self._queue = set()
+
+    def enqueue(self, keys):
+        for key in keys:
+            if key is not None and key not in self._cache:
+                self._queue.add(key)
+
+    def prime(self, key, value):
+        self._cache.setdefault(key, value)
+        self._queue.discard(key)
+
+    def load(self, key):
+        if key not in self._cache:
+            self._queue.add(key)
+            self.dispatch()
+        return self._cache.get(key, self.default)
+
+    def dispatch(self):
+        if not self._queue:
+            return
+        keys = list(self._queue)
+        self._queue.clear()
+        results = self.batch_load_fn(keys)
+        for key in keys:
+            self._cache[key] = results.get(key, self.default)
+
+
+# Each relation the loaders batch: the query for a set of keys, how to find
+# the key a row belongs to and the value it contributes, and whether a key
+# maps to a single object or a list.
+RELATIONS = {
+    'customers': (
+        lambda keys: Customer.objects.filter(pk__in=keys),
+        lambda customer: customer.pk, lambda customer: customer, False,
+    ),
+    'products': (
+        lambda keys: Product.objects.filter(pk__in=keys),
+        lambda product: product.pk, lambda product: product, False,
+    ),
+    'orders': (
+        lambda keys: Order.objects.filter(pk__in=keys),
+        lambda order: order.pk, lambda order: order, False,
+    ),
+    'customer_orders': (
+        lambda keys: Order.objects.filter(customer_id__in=keys).order_by('pk'),
+        lambda order: order.customer_id_id, lambda order: order, True,
+    ),
+    'order_products': (
+        lambda keys: Order.product_ids.through.objects.filter(order_id__in=keys).select_related('product').order_by('pk'),
+        lambda row: row.order_id, lambda row: row.product, True,
+    ),
+    'product_orders': (
+        lambda keys: Order.product_ids.through.objects.filter(product_id__in=keys).select_related('order').order_by('pk'),
+        lambda row: row.product_id, lambda row: row.order, True,
+    ),
+}
+
+
+class Loaders:
+    """The set of loaders attached to a single GraphQL request."""
+
+    is_async = False
+
+    def __init__(self):
+        for name, (query, key_of, value_of, many) in RELATIONS.items():
+            setattr(self, name, self.make_loader(query, key_of, value_of, many))
+
+    def make_loader(self, query, key_of, value_of, many):
+        def batch_load(keys):
+            return self._group(list(query(keys)), key_of, value_of, many)
+        return DataLoader(batch_load, default=[] if many else None)
+
+    def _group(self, rows, key_of, value_of, many):
+        results = defaultdict(list) if many else {}
+        for row in rows:
+            value = value_of(row)
+            if many:
+                results[key_of(row)].append(value)
+            else:
+                results[key_of(row)] = value
+        self.enqueue_nodes(value_of(row) for row in rows)
+        return results
+
+    def enqueue_nodes(self, nodes):
+        """Queue the relation keys of freshly resolved nodes for the next batch.
+
+        Relations the queryset already fetched through select_related or
+        prefetch_related are primed instead, so they never hit the database again.
+        """
+        for node in nodes:
+            prefetched = getattr(node, '_prefetched_objects_cache', {})
+            if isinstance(node, Order):
+                if Order.customer_id.is_cached(node):
+                    self.customers.prime(node.customer_id_id, node.customer_id)
+                    self.enqueue_nodes([node.customer_id])
+                else:
+                    self.customers.enqueue([node.customer_id_id])
+                self._enqueue_or_prime(self.order_products, node, prefetched, 'product_ids')
+            elif isinstance(node, Customer):
+                self._enqueue_or_prime(self.customer_orders, node, prefetched, 'order_set')
+            elif isinstance(node, Product):
+                self._enqueue_or_prime(self.product_orders, node, prefetched, 'orders')
+
+    def _enqueue_or_prime(self, loader, node, prefetched, cache_name):
+        if cache_name in prefetched:
+            loader.prime(node.pk, list(prefetched[cache_name]))
+        else:
+            loader.enqueue([node.pk])
+
+
+class _AsyncLoader(AsyncDataLoader):
+    def enqueue(self, keys):
+        # Batching happens per event loop tick, nothing to queue ahead.
+        pass
+
+
+class AsyncLoaders(Loaders):
+    """Loaders for the async executor.
+
+    Sibling `load()` calls made in the same event loop tick are batched into
+    one query, which runs through Django's async ORM.
+    """
+
+    is_async = True
+
+    def make_loader(self, query, key_of, value_of, many):
+        async def batch_load(keys):
+            rows = [row async for row in query(keys)]
+            results = self._group(rows, key_of, value_of, many)
+            default = [] if many else None
+            return [results.get(key, default) for key in keys]
+        return _AsyncLoader(batch_load)
+
+
+def load_node(loader, model, id):
+    """Load a relay node by its raw id; ids that aren't valid for the pk resolve to None."""
+    try:
+        key = model._meta.pk.to_python(id)
+    except ValidationError:
+        return None
+    return loader.load(key)
+
+
+def get_loaders(context):
+    """Return the loaders for this request, creating them on first use."""
+    if context is None:
+        return Loaders()
+    loaders = getattr(context, 'loaders', None)
+    if loaders is None:
+        loaders = Loaders()
+        context.loaders = loaders
+    return loaders
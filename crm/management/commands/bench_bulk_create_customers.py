@@ -0,0 +1,56 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from alx_backend_graphql_crm.schema import schema
+
+
+BULK_CREATE_MUTATION = """
+mutation BulkCreate($customers: [CustomerInput]!) {
+  bulkCreateCustomers(customersData: $customers) {
+    message
+    errors { recordIndex field message }
+  }
+}
+"""
+
+
+class Command(BaseCommand):
+    help = "Measure bulkCreateCustomers throughput. Runs in a transaction that is rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--duplicates', type=int, default=0,
+                            help="How many rows repeat an earlier email in the batch.")
+
+    def handle(self, *args, **options):
+        rows, duplicates = options['rows'], options['duplicates']
+        run_id = uuid.uuid4().hex[:8]
+        customers = [
+            {'name': f"Bench {i}", 'email': f"bench-{run_id}-{i}@example.com", 'phone': '+12345678901'}
+            for i in range(rows - duplicates)
+        ]
+        customers += customers[:duplicates]
+
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                result = schema.execute(BULK_CREATE_MUTATION, variable_values={'customers': customers})
+                elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+
+        if result.errors:
+            self.stderr.write(self.style.ERROR(str(result.errors)))
+            return
+
+        payload = result.data['bulkCreateCustomers']
+        self.stdout.write(payload['message'])
+        self.stdout.write(
+            f"{len(customers)} rows in {elapsed:.3f}s "
+            f"({len(customers) / elapsed:,.0f} rows/s), "
+            f"{len(queries.captured_queries)} SQL queries, "
+            f"{len(payload['errors'])} record errors"
+        )
@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.benchmarks import BenchmarkError, WriteBenchmark, compare_writes
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent GraphQL writers (and readers) against the current database profile "
+        "and report write/read throughput, latency and failures such as 'database is locked'. "
+        "Compare profiles with DATABASE_PROFILE=sqlite-untuned and DATABASE_PROFILE=sqlite."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--writes', type=int, default=50, help="Mutations per writer.")
+        parser.add_argument('--readers', type=int, default=2)
+        parser.add_argument('--output', default='benchmark_writes.json')
+        parser.add_argument('--compare', metavar='FILE',
+                            help="An earlier --output file, e.g. from another profile.")
+
+    def handle(self, *args, **options):
+        benchmark = WriteBenchmark(writers=options['writers'], writes=options['writes'], readers=options['readers'])
+        try:
+            results = benchmark.run(log=self.stdout.write)
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(f"Wrote {options['output']}")
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            self.stdout.write(f"Against profile {baseline['meta'].get('profile')}:")
+            for line in compare_writes(baseline, results):
+                self.stdout.write(line)
@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.benchmarks import CATALOG, Benchmark, BenchmarkError, compare
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the benchmark catalog (crm.benchmarks) against the current database and "
+        "write p50/p95/p99 latency, SQL query counts and peak memory to a JSON file. "
+        "Seed the database with seed_crm first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--only', nargs='+', metavar='NAME',
+                            help=f"Operations to run, out of: {', '.join(op.name for op in CATALOG)}.")
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--compare', metavar='FILE',
+                            help="An earlier --output file to report changes against.")
+
+    def handle(self, *args, **options):
+        operations = CATALOG
+        if options['only']:
+            unknown = set(options['only']) - {op.name for op in CATALOG}
+            if unknown:
+                raise CommandError(f"Unknown operations: {', '.join(sorted(unknown))}")
+            operations = [op for op in CATALOG if op.name in options['only']]
+
+        benchmark = Benchmark(iterations=options['iterations'], warmup=options['warmup'])
+        try:
+            results = benchmark.run(operations, log=self.stdout.write)
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(f"Wrote {options['output']}")
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            self.stdout.write(f"Against {baseline['meta'].get('revision')}:")
+            for line in compare(baseline, results):
+                self.stdout.write(line)
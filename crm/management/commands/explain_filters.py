@@ -0,0 +1,133 @@
+import itertools
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import models
+from django.utils import timezone
+from django_filters import OrderingFilter
+
+from crm.filters import CustomerFilter, ProductFilter, OrderFilter
+from crm.models import Customer, Product, Order, customers_with_emails
+
+
+FILTERSETS = (CustomerFilter, ProductFilter, OrderFilter)
+
+
+def sample_value(model, field_name, lookup_expr):
+    """A plausible value for `field_name__lookup_expr`, good enough for the planner."""
+    lookups = lookup_expr.split('__')
+    if 'range' in lookups:
+        today = date.today()
+        return (today - timedelta(days=7), today)
+    if 'date' in lookups:
+        return date.today()
+    if 'day' in lookups:
+        return 15
+    if 'isnull' in lookups:
+        return True
+    if 'regex' in lookups:
+        return r'^\+1'
+    if field_name.startswith('phone'):
+        return '+15551234567'
+
+    field = model._meta.get_field(field_name.split('__')[0])
+    for part in field_name.split('__')[1:]:
+        field = field.related_model._meta.get_field(part)
+    if isinstance(field, models.DateTimeField):
+        return timezone.now()
+    if isinstance(field, models.DecimalField):
+        return Decimal('10.00')
+    if isinstance(field, models.IntegerField):
+        return 5
+    if isinstance(field, models.UUIDField):
+        return uuid.uuid4()
+    return 'a'
+
+
+def costly_step(line):
+    """Why a plan line is expensive ('full scan' or 'sort'), or None.
+
+    SQLite reports index lookups as SEARCH; a SCAN is a full pass, even
+    `SCAN t USING INDEX i` (every entry of the index). FTS lookups show up
+    as a SCAN of the virtual table but are index probes.
+    """
+    if 'USE TEMP B-TREE' in line or line.lstrip(' ->').startswith('Sort'):
+        return 'sort'
+    if 'Seq Scan' in line:
+        return 'full scan'
+    if 'SCAN' in line and 'SEARCH' not in line and 'VIRTUAL TABLE' not in line and 'CONSTANT ROW' not in line:
+        return 'full scan'
+    return None
+
+
+class Command(BaseCommand):
+    help = "Print the query plan for every CRM filter (and filter pair) so index coverage can be checked."
+
+    # Access paths that don't go through a FilterSet but run on hot paths.
+    EXTRA_PATHS = {
+        'Customer email probe (CreateCustomer)': lambda: customers_with_emails(['a@example.com']),
+        'Customer default ordering': lambda: Customer.objects.all()[:100],
+        'Customer keyset page (name, id)': lambda: Customer.objects.filter(name__gt='m').order_by('name', 'id')[:100],
+        'Order keyset page (order_date desc, id desc)': lambda: Order.objects.filter(order_date__lt=timezone.now()).order_by('-order_date', '-id')[:100],
+        "Customer's orders by date": lambda: Order.objects.filter(customer_id=uuid.uuid4()).order_by('order_date'),
+        'Low stock restock scan': lambda: Product.objects.filter(stock__lt=5).order_by('stock', 'pk')[:1000],
+        'Top customers by spend': lambda: Customer.objects.order_by('-lifetime_value', '-id')[:100],
+        'Customers without orders': lambda: Customer.objects.filter(order_count=0).order_by('order_count', 'id')[:100],
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pairs', action='store_true', help="Also explain every pair of filters on the same model.")
+        parser.add_argument('--sql', action='store_true', help="Print the SQL next to each plan.")
+
+    def handle(self, *args, **options):
+        for label, build in self.EXTRA_PATHS.items():
+            self.explain(label, build, options['sql'])
+
+        for filterset_class in FILTERSETS:
+            model = filterset_class._meta.model
+            # Orderings are covered by EXTRA_PATHS.
+            filters = [
+                (name, f.field_name, f.lookup_expr)
+                for name, f in filterset_class.base_filters.items()
+                if not isinstance(f, OrderingFilter)
+            ]
+            combos = [(f,) for f in filters]
+            if options['pairs']:
+                combos += list(itertools.combinations(filters, 2))
+
+            for combo in combos:
+                label = f"{filterset_class.__name__}: " + " + ".join(name for name, _, _ in combo)
+
+                def build(model=model, combo=combo, filterset_class=filterset_class):
+                    filterset = filterset_class(queryset=model._default_manager.all())
+                    queryset = filterset.queryset
+                    kwargs = {}
+                    for name, field_name, lookup_expr in combo:
+                        value = sample_value(model, field_name, lookup_expr)
+                        if filterset.filters[name].method:
+                            # Method filters build their own lookups.
+                            queryset = filterset.filters[name].filter(queryset, value)
+                        else:
+                            kwargs[f"{field_name}__{lookup_expr}"] = value
+                    return queryset.filter(**kwargs)
+
+                self.explain(label, build, options['sql'])
+
+    def explain(self, label, build, show_sql):
+        self.stdout.write(self.style.MIGRATE_HEADING(label))
+        try:
+            queryset = build()
+            if show_sql:
+                self.stdout.write(str(queryset.query))
+            plan = queryset.explain()
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"  cannot plan: {e}"))
+            return
+        for line in plan.splitlines():
+            reason = costly_step(line)
+            if reason:
+                self.stdout.write(self.style.WARNING(f"  {line}  <- {reason}"))
+            else:
+                self.stdout.write(f"  {line}")
@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.exports import DEFAULT_CHUNK_SIZE, FORMATS, ExportFilterError, stream_orders
+
+
+class Command(BaseCommand):
+    help = "Stream orders with their customer and products to a file as NDJSON or CSV, in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--output', default='-', help="File to write, or - for stdout (default).")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--filter', action='append', default=[], metavar='NAME=VALUE',
+                            help="An OrderFilter filter, e.g. --filter total_amount__gte=100. Repeatable.")
+
+    def handle(self, *args, **options):
+        filters = {}
+        for item in options['filter']:
+            name, sep, value = item.partition('=')
+            if not sep:
+                raise CommandError(f"Expected NAME=VALUE, got {item!r}.")
+            filters[name] = value
+
+        try:
+            content = stream_orders(filters, options['format'], options['chunk_size'])
+        except ExportFilterError as e:
+            raise CommandError(f"{e} {e.errors}")
+
+        output = sys.stdout if options['output'] == '-' else open(options['output'], 'w', newline='', encoding='utf-8')
+        try:
+            for text in content:
+                output.write(text)
+        finally:
+            if output is not sys.stdout:
+                output.close()
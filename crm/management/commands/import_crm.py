@@ -0,0 +1,52 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.imports import DEFAULT_BATCH_SIZE, FORMATS, IMPORTERS, ErrorFile, ImportFormatError, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream customers or products from a CSV or NDJSON file into the database. "
+        "Rejected rows are written to an error file with their line number."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('path', help="Input file, or - for stdin.")
+        parser.add_argument('--format', choices=FORMATS,
+                            help="Default: from the file extension (.ndjson/.jsonl, else csv).")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--upsert', action='store_true',
+                            help="Update existing rows (customers by email, products by product_id) "
+                                 "instead of rejecting them.")
+        parser.add_argument('--errors', default='import_errors.csv',
+                            help="Where to write rejected rows (default: %(default)s).")
+        parser.add_argument('--skip-search-index', action='store_true',
+                            help="Don't index rows for search; run rebuild_search_index afterwards.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or detect_format(path)
+        importer_class = IMPORTERS[options['kind']]
+
+        with open(options['errors'], 'w', newline='', encoding='utf-8') as errors:
+            importer = importer_class(
+                upsert=options['upsert'],
+                batch_size=options['batch_size'],
+                search_index=not options['skip_search_index'],
+                on_error=ErrorFile(errors),
+            )
+            source = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+            try:
+                summary = importer.run(read_rows(source, format, importer.required_columns))
+            except ImportFormatError as e:
+                raise CommandError(str(e))
+            finally:
+                if source is not sys.stdin:
+                    source.close()
+
+        self.stdout.write(json.dumps(summary))
+        if summary['failed']:
+            self.stdout.write(self.style.WARNING(f"{summary['failed']} rows rejected, see {options['errors']}"))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from crm.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the customer/product full-text search index from the tables."
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        started = time.perf_counter()
+        with transaction.atomic():
+            backend.rebuild()
+        self.stdout.write(
+            f"Rebuilt the {backend.__class__.__name__} index in {time.perf_counter() - started:.3f}s"
+        )
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from crm.counters import reconcile_customer_counters, stale_customers
+from crm.models import Customer
+
+
+class Command(BaseCommand):
+    help = "Recompute Customer.order_count, lifetime_value and last_order_at from the orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Only report how many customers are out of sync.")
+        parser.add_argument('--stale-only', action='store_true',
+                            help="Rewrite only the customers that are out of sync.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['check']:
+            stale = stale_customers().count()
+            self.stdout.write(f"{stale} customers out of sync ({time.perf_counter() - started:.3f}s)")
+            return
+
+        with transaction.atomic():
+            customers = None
+            if options['stale_only']:
+                customers = Customer.objects.filter(pk__in=stale_customers().values('pk'))
+            updated = reconcile_customer_counters(customers)
+        self.stdout.write(f"Reconciled {updated} customers in {time.perf_counter() - started:.3f}s")
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.models import Customer, Order, Product
+from crm.seed_db import clear, seed
+
+
+class Command(BaseCommand):
+    help = "Fill the database with synthetic customers, products and orders for benchmarking."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=10000)
+        parser.add_argument('--products', type=int, default=500)
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--days', type=int, default=365,
+                            help="Orders are spread over this many days before now.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0,
+                            help="RNG seed; the same seed always produces the same data.")
+        parser.add_argument('--clear', action='store_true',
+                            help="Delete existing customers, products and orders first.")
+        parser.add_argument('--skip-search-index', action='store_true',
+                            help="Don't rebuild the search index afterwards.")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            clear()
+        elif Customer.objects.exists() or Product.objects.exists() or Order.objects.exists():
+            raise CommandError("The database already has CRM data; pass --clear to replace it.")
+
+        timings = seed(
+            customers=options['customers'],
+            products=options['products'],
+            orders=options['orders'],
+            batch_size=options['batch_size'],
+            days=options['days'],
+            random_seed=options['seed'],
+            search_index=not options['skip_search_index'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Seeded in {sum(timings.values()):.1f}s"))
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:20
+
+from django.db import migrations, models
+
+from crm.phones import normalize_phone
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def backfill_phone_normalized(apps, schema_editor):
+    Customer = apps.get_model('crm', 'Customer')
+    customers = (
+        Customer.objects.filter(phone__isnull=False)
+        .exclude(phone='')
+        .only('pk', 'phone')
+        .order_by('pk')
+    )
+    batch = []
+    for customer in customers.iterator(chunk_size=BACKFILL_BATCH_SIZE):
+        customer.phone_normalized = normalize_phone(customer.phone)
+        if customer.phone_normalized is not None:
+            batch.append(customer)
+        if len(batch) >= BACKFILL_BATCH_SIZE:
+            Customer.objects.bulk_update(batch, ['phone_normalized'])
+            batch = []
+    if batch:
+        Customer.objects.bulk_update(batch, ['phone_normalized'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='phone_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=16, null=True),
+        ),
+        migrations.RunPython(backfill_phone_normalized, migrations.RunPython.noop),
+        # After the backfill, so the index is built once instead of maintained row by row.
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(condition=models.Q(('phone_normalized__isnull', False)), fields=['phone_normalized'], name='crm_customer_phone_norm_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:30
+
+from django.db import migrations
+
+# Mirrors crm.search: FTS5 tables on SQLite, GIN expression indexes on Postgres.
+SQLITE_TABLES = {
+    'crm_customer': ('Customer', 'id', ('name', 'email')),
+    'crm_product': ('Product', 'product_id', ('name', 'description')),
+}
+
+POSTGRES_VECTORS = {
+    'crm_customer': (
+        "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(email, '')), 'B')"
+    ),
+    'crm_product': (
+        "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(description, '')), 'B')"
+    ),
+}
+
+BACKFILL_BATCH_SIZE = 2000
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for table, (model_name, pk, fields) in SQLITE_TABLES.items():
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {table}_fts USING fts5("
+                f"pk UNINDEXED, {', '.join(fields)}, tokenize='unicode61', prefix='2 3')"
+            )
+            model = apps.get_model('crm', model_name)
+            placeholders = ", ".join(["%s"] * (len(fields) + 2))
+            insert = f"INSERT INTO {table}_fts (rowid, pk, {', '.join(fields)}) VALUES ({placeholders})"
+            rows = model.objects.order_by().values_list(pk, *fields).iterator(chunk_size=BACKFILL_BATCH_SIZE)
+            batch = []
+            for pk_value, *values in rows:
+                batch.append((pk_value.int >> 65, pk_value.hex, *(value or '' for value in values)))
+                if len(batch) >= BACKFILL_BATCH_SIZE:
+                    with schema_editor.connection.cursor() as cursor:
+                        cursor.executemany(insert, batch)
+                    batch = []
+            if batch:
+                with schema_editor.connection.cursor() as cursor:
+                    cursor.executemany(insert, batch)
+    elif vendor == 'postgresql':
+        for table, vector in POSTGRES_VECTORS.items():
+            schema_editor.execute(f"CREATE INDEX {table}_search_idx ON {table} USING gin (({vector}))")
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for table in SQLITE_TABLES:
+            schema_editor.execute(f"DROP TABLE IF EXISTS {table}_fts")
+    elif vendor == 'postgresql':
+        for table in POSTGRES_VECTORS:
+            schema_editor.execute(f"DROP INDEX IF EXISTS {table}_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_customer_phone_normalized'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
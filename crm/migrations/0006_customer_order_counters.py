@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:20
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Customer = apps.get_model('crm', 'Customer')
+    Order = apps.get_model('crm', 'Order')
+
+    def aggregate(expression):
+        orders = Order.objects.filter(customer_id=OuterRef('pk')).order_by().values('customer_id')
+        return Subquery(orders.annotate(value=expression).values('value'))
+
+    Customer.objects.update(
+        order_count=Coalesce(aggregate(Count('id')), 0),
+        lifetime_value=Coalesce(aggregate(Sum('total_amount')), 0, output_field=IntegerField()),
+        last_order_at=aggregate(Max('order_date')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0005_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='last_order_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='lifetime_value',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='order_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['lifetime_value', 'id'], name='crm_customer_ltv_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['order_count', 'id'], name='crm_customer_order_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['last_order_at'], name='crm_customer_last_order_idx'),
+        ),
+    ]
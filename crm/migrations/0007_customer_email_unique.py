@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:21
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+def check_no_duplicate_emails(apps, schema_editor):
+    Customer = apps.get_model('crm', 'Customer')
+    duplicates = list(
+        Customer.objects.filter(email__isnull=False)
+        .values(normalized=Lower('email'))
+        .annotate(n=Count('pk'))
+        .filter(n__gt=1)
+        .values_list('normalized', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Customers share these emails (case-insensitively); merge or fix them "
+            f"before migrating: {', '.join(duplicates)}"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_customer_order_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_no_duplicate_emails, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='customer',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), name='crm_customer_email_ci_uniq'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:10
+
+from django.db import migrations
+
+# 0005 derived each FTS rowid from the top bits of the UUID pk, which two pks
+# can share; INSERT OR REPLACE then silently dropped one of them. The rowid
+# now comes from a <table>_fts_keys mapping, and the index is rebuilt so
+# rows lost to a collision come back.
+SQLITE_TABLES = {
+    'crm_customer': ('id', ('name', 'email')),
+    'crm_product': ('product_id', ('name', 'description')),
+}
+
+
+def add_keys_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, (pk, fields) in SQLITE_TABLES.items():
+        values = ", ".join(f"coalesce(t.{field}, '')" for field in fields)
+        schema_editor.execute(f"CREATE TABLE {table}_fts_keys (id INTEGER PRIMARY KEY, pk TEXT NOT NULL UNIQUE)")
+        schema_editor.execute(f"INSERT INTO {table}_fts_keys (pk) SELECT {pk} FROM {table}")
+        schema_editor.execute(f"DELETE FROM {table}_fts")
+        schema_editor.execute(
+            f"INSERT INTO {table}_fts (rowid, pk, {', '.join(fields)}) "
+            f"SELECT k.id, k.pk, {values} FROM {table}_fts_keys k JOIN {table} t ON t.{pk} = k.pk"
+        )
+
+
+def drop_keys_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, (pk, fields) in SQLITE_TABLES.items():
+        schema_editor.execute(f"DROP TABLE {table}_fts_keys")
+        schema_editor.execute(f"DELETE FROM {table}_fts")
+        placeholders = ", ".join(["%s"] * (len(fields) + 2))
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f"SELECT {pk}, {', '.join(fields)} FROM {table}")
+            rows = [(int(pk_value, 16) >> 65, pk_value, *(value or '' for value in values))
+                    for pk_value, *values in cursor.fetchall()]
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO {table}_fts (rowid, pk, {', '.join(fields)}) VALUES ({placeholders})",
+                rows,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0007_customer_email_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_keys_tables, drop_keys_tables),
+    ]
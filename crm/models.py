@@ -1,7 +1,11 @@
 from uuid import uuid4
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractUser
 
+from .phones import normalize_phone
+
 class User(AbstractUser):
     user = models.UUIDField(default=uuid4, editable=False, unique=True)
     email = models.EmailField(unique=True)
@@ -16,19 +20,58 @@ class Customer(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     name = models.CharField(max_length=255, null=False, blank=False, default='')
     phone = models.CharField(max_length=15, blank=True, null=True)
+    # E.164 form of `phone`, kept in sync by save(); what phone filters query.
+    phone_normalized = models.CharField(max_length=16, blank=True, null=True, editable=False)
     email = models.EmailField(blank=True, null=True)
     address = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized from Order, maintained by crm.counters (reconcile_customer_counters rebuilds them)
+    order_count = models.PositiveIntegerField(default=0, editable=False)
+    lifetime_value = models.PositiveBigIntegerField(default=0, editable=False)
+    last_order_at = models.DateTimeField(blank=True, null=True, editable=False)
 
     class Meta:
         ordering = ['name']
         verbose_name = 'customer'
         verbose_name_plural = 'customers'
-        
+        indexes = [
+            # default ordering, name filters and keyset pagination on (name, id)
+            models.Index(fields=['name', 'id'], name='crm_customer_name_id_idx'),
+            # CreateCustomer / BulkCreateCustomers email probes
+            models.Index(fields=['email'], name='crm_customer_email_idx', condition=Q(email__isnull=False)),
+            models.Index(fields=['created_at'], name='crm_customer_created_idx'),
+            # phoneExact / phonePrefix lookups
+            models.Index(fields=['phone_normalized'], name='crm_customer_phone_norm_idx', condition=Q(phone_normalized__isnull=False)),
+            # top customers by spend / order count, and recency, with id as keyset tie-breaker
+            models.Index(fields=['lifetime_value', 'id'], name='crm_customer_ltv_idx'),
+            models.Index(fields=['order_count', 'id'], name='crm_customer_order_count_idx'),
+            models.Index(fields=['last_order_at'], name='crm_customer_last_order_idx'),
+        ]
+        constraints = [
+            # One customer per email, whatever the case; NULLs don't collide.
+            models.UniqueConstraint(Lower('email'), name='crm_customer_email_ci_uniq'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.phone_normalized = normalize_phone(self.phone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'phone_normalized'}
+        super().save(*args, **kwargs)
+
+def customers_with_emails(emails):
+    """Customers whose email is one of `emails`, ignoring case.
+
+    Matches the way crm_customer_email_ci_uniq compares emails, and can use it.
+    The result is annotated with `email_lower`.
+    """
+    return Customer.objects.annotate(email_lower=Lower('email')).filter(
+        email_lower__in=[email.lower() for email in emails if email]
+    )
+
 class Product(models.Model):
     product_id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     name = models.CharField(max_length=100)
@@ -39,6 +82,15 @@ class Product(models.Model):
     stock = models.PositiveIntegerField(default=0)
     # owner = models.ForeignKey(Customer, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            # stock filters and the most-depleted-first restock scan
+            models.Index(fields=['stock', 'product_id'], name='crm_product_stock_idx'),
+            models.Index(fields=['price'], name='crm_product_price_idx'),
+            # keyset pagination on (created_at, product_id)
+            models.Index(fields=['created_at', 'product_id'], name='crm_product_created_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -50,5 +102,14 @@ class Order(models.Model):
     order_date = models.DateTimeField(auto_now_add=True)
     total_amount= models.PositiveIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            # date range filters and keyset pagination on (order_date, id)
+            models.Index(fields=['order_date', 'id'], name='crm_order_date_id_idx'),
+            # a customer's orders by date (also covers the FK lookup)
+            models.Index(fields=['customer_id', 'order_date'], name='crm_order_customer_date_idx'),
+            models.Index(fields=['total_amount'], name='crm_order_total_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.order_id} by {self.customer_id.name}"
@@ -0,0 +1,93 @@
+from django.db.models import QuerySet
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+
+def _collect_fields(selection_set, fragments):
+    """Flatten a selection set into its field nodes, expanding fragments."""
+    fields = []
+    if selection_set is None:
+        return fields
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            fields.append(selection)
+        elif isinstance(selection, InlineFragmentNode):
+            fields.extend(_collect_fields(selection.selection_set, fragments))
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = fragments.get(selection.name.value)
+            if fragment is not None:
+                fields.extend(_collect_fields(fragment.selection_set, fragments))
+    return fields
+
+
+def _node_fields(field_node, fragments):
+    """Return the fields selected on the object itself, unwrapping relay `edges { node }`."""
+    fields = _collect_fields(field_node.selection_set, fragments)
+    edges = [f for f in fields if f.name.value == 'edges']
+    if not edges:
+        return fields
+    node_fields = []
+    for edge in edges:
+        for f in _collect_fields(edge.selection_set, fragments):
+            if f.name.value == 'node':
+                node_fields.extend(_collect_fields(f.selection_set, fragments))
+    return node_fields
+
+
+def _relations(model):
+    """Map the attribute name graphene exposes for each relation to its Django field."""
+    relations = {}
+    for field in model._meta.get_fields():
+        if not field.is_relation:
+            continue
+        if field.auto_created and not field.concrete:
+            relations[field.get_accessor_name()] = field
+        else:
+            relations[field.name] = field
+    return relations
+
+
+def _walk(model, fields, fragments, prefix, in_prefetch, select, prefetch):
+    relations = _relations(model)
+    for field_node in fields:
+        name = to_snake_case(field_node.name.value)
+        field = relations.get(name)
+        if field is None or field_node.selection_set is None:
+            continue
+        path = f"{prefix}{name}"
+        single = field.many_to_one or field.one_to_one
+        if single and not in_prefetch:
+            select.add(path)
+            nested_prefetch = False
+        else:
+            prefetch.add(path)
+            nested_prefetch = True
+        _walk(
+            field.related_model,
+            _node_fields(field_node, fragments),
+            fragments,
+            f"{path}__",
+            nested_prefetch,
+            select,
+            prefetch,
+        )
+
+
+def get_related_paths(model, info):
+    """Return the (select_related, prefetch_related) paths needed for this selection."""
+    select, prefetch = set(), set()
+    for field_node in info.field_nodes:
+        _walk(model, _node_fields(field_node, info.fragments), info.fragments, '', False, select, prefetch)
+    return sorted(select), sorted(prefetch)
+
+
+def optimize_queryset(queryset, info):
+    """Add select_related/prefetch_related for the relations the client selected."""
+    if not isinstance(queryset, QuerySet):
+        return queryset
+    select, prefetch = get_related_paths(queryset.model, info)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
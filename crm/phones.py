@@ -0,0 +1,44 @@
+import re
+
+# Accepted input formats: +1234567890 (10-15 digits, optional +) or 123-456-7890 style.
+PHONE_REGEX = r"^(?:\+?\d{10,15}|\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4})$"
+
+# Ten-digit numbers without a country code are taken as North American.
+DEFAULT_COUNTRY_CODE = '1'
+
+
+def validate_phone_number(phone):
+    """Validate phone number format."""
+    if not re.fullmatch(PHONE_REGEX, phone):
+        return "Invalid phone format. Use formats like +1234567890 or 123-456-7890."
+    return None
+
+
+def normalize_phone(phone):
+    """Return `phone` in E.164 form (`+15551234567`), or None if it isn't a valid number.
+
+    Accepts exactly what `validate_phone_number` accepts.
+    """
+    if not phone:
+        return None
+    phone = phone.strip()
+    if not re.fullmatch(PHONE_REGEX, phone):
+        return None
+    digits = re.sub(r'\D', '', phone)
+    if not phone.startswith('+') and len(digits) == 10:
+        digits = DEFAULT_COUNTRY_CODE + digits
+    return '+' + digits
+
+
+def phone_prefix_range(prefix):
+    """The `[low, high)` string range of normalized numbers starting with `prefix`.
+
+    `prefix` is a leading part of an E.164 number, with or without the `+`;
+    anything but digits is ignored. Returns None if no digits are left.
+    """
+    digits = re.sub(r'\D', '', prefix or '')
+    if not digits:
+        return None
+    low = '+' + digits
+    # Normalized numbers are '+' and digits only, and ':' sorts right after '9'.
+    return low, low + ':'
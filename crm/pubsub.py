@@ -0,0 +1,133 @@
+"""Publish/subscribe backends behind GraphQL subscriptions.
+
+Mutations publish from request threads with `publish()`; subscriptions
+consume with `async for message in subscribe(channel)` on the ASGI event
+loop. Messages are JSON-serializable dicts.
+
+- InMemoryPubSub delivers within one process (tests, a single dev server).
+- RedisPubSub goes through Redis PUBLISH/SUBSCRIBE, so every worker sees
+  every event. Each event loop holds one Redis connection, shared by all
+  its subscribers, and fans messages out to them locally.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Messages a slow subscriber may have pending before the oldest are dropped.
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class PubSub:
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        """Async iterator over the messages published to `channel` from now on."""
+        raise NotImplementedError
+
+
+class InMemoryPubSub(PubSub):
+    def __init__(self, **options):
+        # Options for other backends (e.g. `url`) are ignored, so switching
+        # BACKEND alone is enough.
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def publish(self, channel, message):
+        self._deliver(channel, message)
+
+    def _deliver(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            # publish() runs on request threads; queues belong to their loop.
+            loop.call_soon_threadsafe(self._put, queue, message)
+
+    @staticmethod
+    def _put(queue, message):
+        if queue.full():
+            queue.get_nowait()
+            logger.warning("Subscriber queue full, dropped the oldest message.")
+        queue.put_nowait(message)
+
+    async def _listen(self, channel):
+        """Hook run before a subscriber starts waiting; backends connect here."""
+
+    async def subscribe(self, channel):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        try:
+            await self._listen(channel)
+            while True:
+                yield await queue.get()
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscriber)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+
+class RedisPubSub(InMemoryPubSub):
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+        self._publisher = None
+        self._readers = {}
+
+    def publish(self, channel, message):
+        import redis
+
+        if self._publisher is None:
+            self._publisher = redis.Redis.from_url(self.url)
+        self._publisher.publish(channel, json.dumps(message))
+
+    async def _listen(self, channel):
+        import redis.asyncio
+
+        loop = asyncio.get_running_loop()
+        reader = self._readers.get(loop)
+        if reader is None:
+            reader = self._readers[loop] = {'lock': asyncio.Lock(), 'task': None, 'channels': set()}
+        async with reader['lock']:
+            if reader['task'] is None or reader['task'].done():
+                # (Re)connect, subscribing to everything local subscribers still wait on.
+                client = redis.asyncio.Redis.from_url(self.url)
+                pubsub = client.pubsub()
+                with self._lock:
+                    channels = {channel, *self._subscribers}
+                await pubsub.subscribe(*channels)
+                reader.update(pubsub=pubsub, channels=channels, task=loop.create_task(self._read(client, pubsub)))
+            elif channel not in reader['channels']:
+                # Channels stay subscribed once used; there are only a handful.
+                await reader['pubsub'].subscribe(channel)
+                reader['channels'].add(channel)
+
+    async def _read(self, client, pubsub):
+        try:
+            while True:
+                item = await pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+                if item is not None:
+                    self._deliver(item['channel'].decode(), json.loads(item['data']))
+        except Exception:
+            logger.exception("Redis subscription reader stopped; it restarts with the next subscription.")
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+
+@lru_cache(maxsize=None)
+def get_pubsub():
+    """The configured backend (settings.GRAPHQL_PUBSUB), one per process."""
+    config = getattr(settings, 'GRAPHQL_PUBSUB', {})
+    backend = import_string(config.get('BACKEND', 'crm.pubsub.InMemoryPubSub'))
+    return backend(**config.get('OPTIONS', {}))
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .fields import keyset_filter
+from .models import Order
+
+logger = logging.getLogger(__name__)
+
+REMINDER_LOG_FILE = "/tmp/order_reminders_log.txt"
+CHECKPOINT_FILE = "/tmp/order_reminders_checkpoint.json"
+
+
+async def log_sender(reminder):
+    """Default sender: records the reminder in the application log."""
+    logger.info("Reminder for order %s to %s", reminder['order_id'], reminder['email'])
+
+
+def get_sender():
+    return import_string(getattr(settings, 'ORDER_REMINDER_SENDER', 'crm.reminders.log_sender'))
+
+
+def load_checkpoint(path):
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+        after = (datetime.fromisoformat(checkpoint['last_order_date']), checkpoint['last_pk'])
+        return datetime.fromisoformat(checkpoint['since']), after
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_checkpoint(path, since, after):
+    # Write-then-rename, so a crash mid-write leaves the previous checkpoint intact.
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump({'since': since.isoformat(), 'last_order_date': after[0].isoformat(), 'last_pk': after[1]}, f)
+    os.replace(tmp, path)
+
+
+def clear_checkpoint(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def append_log(path, text):
+    with open(path, 'a') as f:
+        f.write(text)
+
+
+def last_key(chunk):
+    return chunk[-1]['order_date'], chunk[-1]['pk']
+
+
+async def iter_order_chunks(since, after=None, chunk_size=500):
+    """Yield orders placed since `since`, `chunk_size` rows per query.
+
+    Pages are keyset-based on `(order_date, pk)`, resuming after the `after`
+    key, so each query is a range scan of the order date index however far
+    into the window the run is.
+    """
+    orders = (
+        Order.objects.filter(order_date__gte=since)
+        .order_by('order_date', 'pk')
+        .values('pk', 'order_id', 'order_date', 'total_amount', 'customer_id__name', 'customer_id__email')
+    )
+    while True:
+        page = orders.filter(keyset_filter(('order_date', 'pk'), after)) if after else orders
+        chunk = [row async for row in page[:chunk_size]]
+        if not chunk:
+            return
+        yield chunk
+        after = last_key(chunk)
+
+
+async def _dispatch(sender, semaphore, row):
+    reminder = {
+        'order_id': str(row['order_id']),
+        'order_date': row['order_date'],
+        'total_amount': row['total_amount'],
+        'name': row['customer_id__name'],
+        'email': row['customer_id__email'],
+    }
+    async with semaphore:
+        try:
+            await sender(reminder)
+        except Exception as e:
+            logger.warning("Reminder for order %s failed: %s", reminder['order_id'], e)
+            return reminder, False
+    return reminder, True
+
+
+async def send_order_reminders(days=7, sender=None, concurrency=None, chunk_size=None,
+                               log_file=REMINDER_LOG_FILE, checkpoint_file=CHECKPOINT_FILE):
+    """Send a reminder for every order placed in the last `days` days.
+
+    At most `concurrency` sends are in flight at a time and each chunk's log
+    lines are written in one append. Progress is checkpointed after every
+    chunk, so a run that dies resumes after the last finished chunk (with the
+    same time window) instead of starting over. The file I/O runs in worker
+    threads, off the event loop the sends share.
+
+    Returns `(sent, failed)`.
+    """
+    sender = sender or get_sender()
+    concurrency = concurrency or getattr(settings, 'ORDER_REMINDER_CONCURRENCY', 10)
+    chunk_size = chunk_size or getattr(settings, 'ORDER_REMINDER_CHUNK_SIZE', 500)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    checkpoint = await asyncio.to_thread(load_checkpoint, checkpoint_file)
+    if checkpoint is not None:
+        since, after = checkpoint
+        logger.info("Resuming order reminders after order pk %s", after[1])
+    else:
+        since, after = datetime.now(timezone.utc) - timedelta(days=days), None
+
+    sent = failed = 0
+    async for chunk in iter_order_chunks(since, after, chunk_size):
+        results = await asyncio.gather(*(_dispatch(sender, semaphore, row) for row in chunk))
+
+        log_timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
+        lines = []
+        for reminder, ok in results:
+            status = "" if ok else " (send failed)"
+            lines.append(f"{log_timestamp} - Order ID: {reminder['order_id']}, Customer Email: {reminder['email']}{status}\n")
+            if ok:
+                sent += 1
+            else:
+                failed += 1
+        await asyncio.to_thread(append_log, log_file, "".join(lines))
+        await asyncio.to_thread(save_checkpoint, checkpoint_file, since, last_key(chunk))
+
+    await asyncio.to_thread(clear_checkpoint, checkpoint_file)
+    return sent, failed
@@ -2,7 +2,7 @@ import uuid
 import graphene
 from graphene_django import DjangoObjectType
 from django.contrib.auth import get_user_model, authenticate
-from .models import Customer, Product, Order, User
+from .models import Customer, Product, Order, User, customers_with_emails
 import graphql_jwt
 from graphql_jwt.decorators import login_required
 from django.contrib.auth.password_validation import validate_password
@@ -10,22 +10,32 @@ from django.core.exceptions import ValidationError
 from django.core.validators import validate_email
 import re
 from graphene.types import JSONString
-from graphene_django.filter import DjangoFilterConnectionField
 from django.db import transaction, IntegrityError
+from django.db.models import Avg, Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from graphene_django.filter.utils import get_filtering_args_from_filterset
 from decimal import Decimal
 from django.utils import timezone
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from graphql import GraphQLError
+from graphql_relay import cursor_to_offset, offset_to_cursor
 from .filters import CustomerFilter, ProductFilter, OrderFilter
+from .fields import BatchedConnectionField, KeysetConnectionField
+from .loaders import AsyncLoaders, get_loaders, load_node
+from .stock import restock_low_stock
+from .cache import invalidate_models
+from .phones import normalize_phone, validate_phone_number
+from .search import get_search_backend, search_objects
+from .counters import record_orders
+from . import events
+from .pubsub import get_pubsub
 
 # from crm.models import Product
 
 User = get_user_model()
 
-def validate_phone_number(phone):
-    """Validate phone number format."""
-    phone_regex = r"^(?:\+?\d{10,15}|\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4})$"
-    if not re.fullmatch(phone_regex, phone):
-        return "Invalid phone format. Use formats like +1234567890 or 123-456-7890."
-    return None
+BULK_CREATE_BATCH_SIZE = 500
 
 def validate_password_strength(password):
     """Custom password strength validation"""
@@ -62,6 +72,7 @@ class UserType(DjangoObjectType):
     
 class CustomerType(DjangoObjectType):
   uuid = graphene.String()
+  order_set = BatchedConnectionField(lambda: OrderType)
   class Meta:
     model = Customer
     fields = "__all__"
@@ -71,8 +82,16 @@ class CustomerType(DjangoObjectType):
   def resolve_uuid(self, info):
       return str(self.id)  #
 
+  def resolve_order_set(self, info, **kwargs):
+      return get_loaders(info.context).customer_orders.load(self.pk)
+
+  @classmethod
+  def get_node(cls, info, id):
+      return load_node(get_loaders(info.context).customers, Customer, id)
+
 class ProductType(DjangoObjectType):
   uuid = graphene.String()
+  orders = BatchedConnectionField(lambda: OrderType)
   class Meta:
     model = Product
     fields = "__all__"
@@ -82,23 +101,171 @@ class ProductType(DjangoObjectType):
   def resolve_uuid(self, info):
       return str(self.product_id)  #
 
+  def resolve_orders(self, info, **kwargs):
+      return get_loaders(info.context).product_orders.load(self.pk)
+
+  @classmethod
+  def get_node(cls, info, id):
+      return load_node(get_loaders(info.context).products, Product, id)
+
 class OrderType(DjangoObjectType):
+  product_ids = BatchedConnectionField(ProductType)
   class Meta:
     model = Order
     fields = "__all__"
     filter_fields = ['order_date', 'total_amount']
     interfaces = (graphene.relay.Node,)
+
+  def resolve_customer_id(self, info):
+      return get_loaders(info.context).customers.load(self.customer_id_id)
+
+  def resolve_product_ids(self, info, **kwargs):
+      return get_loaders(info.context).order_products.load(self.pk)
+
+  @classmethod
+  def get_node(cls, info, id):
+      return load_node(get_loaders(info.context).orders, Order, id)
      
+class OrderDayBucketType(graphene.ObjectType):
+    cache_models = (Order,)
+    day = graphene.Date()
+    count = graphene.Int()
+    revenue = graphene.Decimal()
+
+class OrderStatsType(graphene.ObjectType):
+    cache_models = (Order,)
+    count = graphene.Int()
+    total_revenue = graphene.Decimal()
+    average_order_value = graphene.Decimal()
+    min_order_value = graphene.Int()
+    max_order_value = graphene.Int()
+    daily = graphene.List(OrderDayBucketType)
+
+def _filtered_orders(info, kwargs):
+    filterset = OrderFilter(data=kwargs, queryset=Order.objects.all(), request=info.context)
+    if not filterset.is_valid():
+        raise GraphQLError(
+            "Invalid filters.",
+            extensions={'code': 'BAD_USER_INPUT', 'errors': filterset.errors.get_json_data()},
+        )
+    # Product filters join through the M2M and can match an order more than
+    # once; aggregating over the pks keeps each order counted once.
+    return Order.objects.filter(pk__in=filterset.qs.order_by().values('pk'))
+
+def _order_totals():
+    return dict(
+        count=Count('id'),
+        total_revenue=Sum('total_amount'),
+        average_order_value=Avg('total_amount'),
+        min_order_value=Min('total_amount'),
+        max_order_value=Max('total_amount'),
+    )
+
+def _order_days(orders):
+    return (
+        orders.annotate(day=TruncDate('order_date'))
+        .values('day')
+        .annotate(count=Count('id'), revenue=Sum('total_amount'))
+        .order_by('day')
+    )
+
+def _order_stats(totals, daily):
+    average = totals['average_order_value']
+    return OrderStatsType(
+        count=totals['count'],
+        total_revenue=Decimal(totals['total_revenue'] or 0),
+        average_order_value=Decimal(str(average)).quantize(Decimal('0.01')) if average is not None else None,
+        min_order_value=totals['min_order_value'],
+        max_order_value=totals['max_order_value'],
+        daily=[OrderDayBucketType(day=row['day'], count=row['count'], revenue=Decimal(row['revenue'] or 0)) for row in daily],
+    )
+
+def resolve_order_stats(root, info, **kwargs):
+    """Aggregate the filtered orders in SQL: one row for totals, one per day for buckets."""
+    orders = _filtered_orders(info, kwargs)
+    if get_loaders(info.context).is_async:
+        return resolve_order_stats_async(orders)
+    return _order_stats(orders.aggregate(**_order_totals()), list(_order_days(orders)))
+
+async def resolve_order_stats_async(orders):
+    totals = await orders.aaggregate(**_order_totals())
+    return _order_stats(totals, [row async for row in _order_days(orders)])
+
+class SearchResult(graphene.Union):
+  # Read by the response cache: results come from both tables.
+  cache_models = (Customer, Product)
+  class Meta:
+    types = (CustomerType, ProductType)
+
+class SearchResultConnection(graphene.relay.Connection):
+  class Meta:
+    node = SearchResult
+
+  class Edge:
+    rank = graphene.Float()
+
+SEARCH_DEFAULT_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+def _search_connection(query, first, after):
+    offset = cursor_to_offset(after) + 1 if after else 0
+    # One extra row tells us whether there is a next page without counting matches.
+    results = search_objects(query, first + 1, offset)
+    edges = [
+        SearchResultConnection.Edge(node=instance, rank=rank, cursor=offset_to_cursor(offset + i))
+        for i, (instance, rank) in enumerate(results[:first])
+    ]
+    return SearchResultConnection(
+        edges=edges,
+        page_info=graphene.relay.PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=offset > 0,
+            has_next_page=len(results) > first,
+        ),
+    )
+
+def resolve_search(root, info, query, first=None, after=None):
+    """Ranked full-text search over customers and products, best match first."""
+    if first is not None and first < 1:
+        raise GraphQLError("Argument 'first' must be a positive integer.")
+    first = min(first or SEARCH_DEFAULT_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE)
+    if after is not None and cursor_to_offset(after) is None:
+        raise GraphQLError("Invalid cursor")
+    if get_loaders(info.context).is_async:
+        return sync_to_async(_search_connection)(query, first, after)
+    return _search_connection(query, first, after)
+
 class Query(graphene.ObjectType):
     users = graphene.List(UserType)
     customer = graphene.relay.Node.Field(CustomerType)
-    all_customers = DjangoFilterConnectionField(CustomerType, filterset_class=CustomerFilter, order_by=graphene.List(graphene.String))
+    all_customers = BatchedConnectionField(CustomerType, filterset_class=CustomerFilter)
     
     product = graphene.relay.Node.Field(ProductType)
-    all_products = DjangoFilterConnectionField(ProductType, filterset_class=ProductFilter, order_by=graphene.List(graphene.String))
+    all_products = BatchedConnectionField(ProductType, filterset_class=ProductFilter)
 
     order = graphene.relay.Node.Field(OrderType)
-    all_orders = DjangoFilterConnectionField(OrderType, filterset_class=OrderFilter, order_by=graphene.List(graphene.String))
+    all_orders = BatchedConnectionField(OrderType, filterset_class=OrderFilter)
+
+    # Keyset-paginated variants: cursors encode the sort key plus the pk, so
+    # deep pages cost the same as the first one. No offset, no totalCount.
+    all_customers_keyset = KeysetConnectionField(CustomerType, keyset=('name',), filterset_class=CustomerFilter)
+    all_products_keyset = KeysetConnectionField(ProductType, keyset=('created_at',), filterset_class=ProductFilter)
+    all_orders_keyset = KeysetConnectionField(OrderType, keyset=('-order_date',), filterset_class=OrderFilter)
+
+    order_stats = graphene.Field(
+        OrderStatsType,
+        args=get_filtering_args_from_filterset(OrderFilter, OrderType),
+        resolver=resolve_order_stats,
+    )
+
+    search = graphene.Field(
+        SearchResultConnection,
+        query=graphene.String(required=True),
+        first=graphene.Int(),
+        after=graphene.String(),
+        resolver=resolve_search,
+    )
 
 class ErrorType(graphene.ObjectType):
     field = graphene.String()
@@ -246,7 +413,7 @@ class CreateCustomer(graphene.Mutation):
         except ValidationError:
             errors.append(ErrorType(field="email", message="Invalid email format."))
 
-        if Customer.objects.filter(email=email).exists():
+        if customers_with_emails([email]).exists():
             errors.append(ErrorType(field="email", message="Email already exists."))
         if phone:
             phone_error = validate_phone_number(phone)
@@ -257,7 +424,9 @@ class CreateCustomer(graphene.Mutation):
             return CreateCustomer(success=False, message="Validation failed.", errors=errors)
 
         try:
-            customer = Customer.objects.create(name=name, email=email, phone=phone)
+            with transaction.atomic():
+                customer = Customer.objects.create(name=name, email=email, phone=phone)
+            events.customers_created([customer])
             return CreateCustomer(customer=customer, success=True, message="Customer created successfully.")
         except IntegrityError:
             errors.append(ErrorType(field="email", message="Email already exists (database constraint)."))
@@ -289,18 +458,32 @@ class BulkCreateCustomers(graphene.Mutation):
         created_customers = []
         failed_records_errors = []
 
+        def add_error(index, field, message):
+            failed_records_errors.append({
+                'record_index': index,
+                'field': field,
+                'message': message
+            })
+
+        # One probe for every email already in the table; duplicates inside
+        # the batch are caught in memory as we go. Emails are unique
+        # regardless of case, so both compare lowercased.
+        emails = {customer_input.email for customer_input in customers_data}
+        seen_emails = set(customers_with_emails(emails).values_list('email_lower', flat=True))
+
+        pending = []
         for i, customer_input in enumerate(customers_data):
             record_errors = []
             name = customer_input.name
             email = customer_input.email
             phone = customer_input.phone
-            
+
             try:
                 validate_email(email)
             except ValidationError:
                 record_errors.append(ErrorType(field="email", message="Invalid email format."))
 
-            if Customer.objects.filter(email=email).exists():
+            if email.lower() in seen_emails:
                 record_errors.append(ErrorType(field="email", message="Email already exists."))
 
             if phone:
@@ -310,33 +493,47 @@ class BulkCreateCustomers(graphene.Mutation):
 
             if record_errors:
                 for error in record_errors:
-                    failed_records_errors.append({
-                        'record_index': i,
-                        'field': error.field,
-                        'message': error.message
-                    })
+                    add_error(i, error.field, error.message)
                 continue
 
+            seen_emails.add(email.lower())
+            # bulk_create skips Customer.save(), so normalize here.
+            pending.append((i, Customer(name=name, email=email, phone=phone, phone_normalized=normalize_phone(phone))))
+
+        bulk_created = []
+        for start in range(0, len(pending), BULK_CREATE_BATCH_SIZE):
+            chunk = pending[start:start + BULK_CREATE_BATCH_SIZE]
             try:
                 with transaction.atomic():
-                    customer = Customer.objects.create(
-                        name=name,
-                        email=email,
-                        phone=phone
-                    )
-                    created_customers.append(customer)
+                    Customer.objects.bulk_create([customer for _, customer in chunk])
             except IntegrityError:
-                failed_records_errors.append({
-                    'record_index': i,
-                    'field': "email",
-                    'message': "Email already exists (database constraint)."
-                })
-            except Exception as e:
-                failed_records_errors.append({
-                    'record_index': i,
-                    'field': "__all__",
-                    'message': f"An unexpected error occurred: {str(e)}"
-                })
+                pass
+            else:
+                bulk_created.extend(customer for _, customer in chunk)
+                created_customers.extend(customer for _, customer in chunk)
+                continue
+
+            # Another request inserted one of these emails since the probe and
+            # the unique index on lower(email) refused the chunk: retry row by
+            # row so only the clashing records fail, each with its own error.
+            for i, customer in chunk:
+                try:
+                    with transaction.atomic():
+                        customer.save(force_insert=True)
+                    created_customers.append(customer)
+                except IntegrityError:
+                    add_error(i, "email", "Email already exists (database constraint).")
+                except Exception as e:
+                    add_error(i, "__all__", f"An unexpected error occurred: {str(e)}")
+
+        if bulk_created:
+            # bulk_create sends no post_save, so index and invalidate here;
+            # rows saved one by one went through the signals already.
+            get_search_backend().index(Customer, bulk_created)
+            invalidate_models(Customer)
+        events.customers_created(created_customers)
+
+        failed_records_errors.sort(key=lambda err: err['record_index'])
 
         message = "Bulk customer creation completed."
         if failed_records_errors:
@@ -378,6 +575,7 @@ class CreateProduct(graphene.Mutation):
 
         try:
             product = Product.objects.create(name=name, price=price, stock=stock)
+            events.stock_changed([product])
             return CreateProduct(product=product, success=True, message="Product created successfully.")
         except Exception as e:
             errors.append(ErrorType(field="__all__", message=f"An unexpected error occurred: {str(e)}"))
@@ -417,15 +615,13 @@ class CreateOrder(graphene.Mutation):
         products = []
         total_amount = Decimal('0.00')
         if validated_product_uuids:
-            fetched_products = Product.objects.filter(product_id__in=validated_product_uuids)
-            print(f"Fetched products: {fetched_products}")
-            if fetched_products.count() != len(validated_product_uuids):
-                found_ids = {str(p.product_id) for p in fetched_products}
+            products = list(Product.objects.filter(product_id__in=validated_product_uuids))
+            if len(products) != len(validated_product_uuids):
+                found_ids = {str(p.product_id) for p in products}
                 invalid_ids = [pid for pid in validated_product_uuids if pid not in found_ids]
                 for inv_id in invalid_ids:
                     errors.append(ErrorType(field="product_ids", message=f"Product with ID '{inv_id}' not found."))
-            
-            products = list(fetched_products)
+
             total_amount = sum(p.price for p in products)
 
 
@@ -438,10 +634,11 @@ class CreateOrder(graphene.Mutation):
                     customer_id=customer,
                     quantity=len(products),
                     order_date=order_date or timezone.now(),
+                    total_amount=total_amount,
                 )
                 order.product_ids.set(products)
-                order.total_amount = total_amount
-                order.save()
+                record_orders([order])
+                events.orders_created([order])
 
             return CreateOrder(order=order, success=True, message="Order created successfully.")
         except Exception as e:
@@ -449,29 +646,154 @@ class CreateOrder(graphene.Mutation):
             return CreateOrder(success=False, message="Order creation failed.", errors=errors)
 
 
+class OrderInput(graphene.InputObjectType):
+    order_date = graphene.DateTime(required=False)
+    customer_uuid = graphene.String(required=True)
+    product_uuids = graphene.List(graphene.String, required=True)
+
+class BulkCreateOrderErrorType(graphene.ObjectType):
+    record_index = graphene.Int()
+    field = graphene.String()
+    message = graphene.String()
+
+def _parse_uuid(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+class CreateOrders(graphene.Mutation):
+    class Arguments:
+        orders = graphene.List(graphene.NonNull(OrderInput), required=True)
+
+    successful_orders = graphene.List(OrderType)
+    errors = graphene.List(BulkCreateOrderErrorType)
+    message = graphene.String()
+
+    def mutate(self, info, orders):
+        failed_records_errors = []
+
+        def add_error(index, field, message):
+            failed_records_errors.append({
+                'record_index': index,
+                'field': field,
+                'message': message
+            })
+
+        # Every customer and product referenced by the batch, in two queries.
+        customer_ids = {_parse_uuid(o.customer_uuid) for o in orders} - {None}
+        product_ids = {_parse_uuid(pid) for o in orders for pid in (o.product_uuids or [])} - {None}
+        customers = Customer.objects.in_bulk(customer_ids)
+        products = Product.objects.in_bulk(product_ids)
+
+        pending = []
+        for i, order_input in enumerate(orders):
+            record_errors = []
+            customer = customers.get(_parse_uuid(order_input.customer_uuid))
+            if customer is None:
+                record_errors.append(("customer_id", "Invalid customer ID."))
+
+            product_uuids = order_input.product_uuids or []
+            if not product_uuids:
+                record_errors.append(("product_ids", "At least one product must be selected."))
+
+            order_products = []
+            for pid in product_uuids:
+                product_uuid = _parse_uuid(pid)
+                if product_uuid is None:
+                    record_errors.append(("product_ids", f"Invalid UUID format for product ID: {pid}"))
+                elif product_uuid not in products:
+                    record_errors.append(("product_ids", f"Product with ID '{pid}' not found."))
+                elif products[product_uuid] not in order_products:
+                    order_products.append(products[product_uuid])
+
+            if record_errors:
+                for field, message in record_errors:
+                    add_error(i, field, message)
+                continue
+
+            order = Order(
+                customer_id=customer,
+                quantity=len(order_products),
+                order_date=order_input.order_date or timezone.now(),
+                total_amount=sum(p.price for p in order_products),
+            )
+            pending.append((order, order_products))
+
+        created_orders = [order for order, _ in pending]
+        if pending:
+            try:
+                with transaction.atomic():
+                    Order.objects.bulk_create(created_orders, batch_size=BULK_CREATE_BATCH_SIZE)
+                    if any(order.pk is None for order in created_orders):
+                        # Backend can't return ids from a bulk insert; order_id
+                        # is generated client-side, so map back through it.
+                        pks = dict(
+                            Order.objects.filter(order_id__in=[o.order_id for o in created_orders])
+                            .values_list('order_id', 'pk')
+                        )
+                        for order in created_orders:
+                            order.pk = pks[order.order_id]
+                    through = Order.product_ids.through
+                    through.objects.bulk_create(
+                        [
+                            through(order_id=order.pk, product_id=product.pk)
+                            for order, order_products in pending
+                            for product in order_products
+                        ],
+                        batch_size=BULK_CREATE_BATCH_SIZE,
+                    )
+                    record_orders(created_orders)
+                    invalidate_models(Order, Product)
+                    events.orders_created(created_orders)
+            except Exception as e:
+                created_orders = []
+                add_error(None, "__all__", f"An unexpected error occurred: {str(e)}")
+
+        message = "Bulk order creation completed."
+        if failed_records_errors:
+            message += f" Some records failed ({len(failed_records_errors)} errors)."
+        else:
+            message += " All orders created successfully."
+
+        return CreateOrders(
+            successful_orders=created_orders,
+            errors=[BulkCreateOrderErrorType(**err) for err in failed_records_errors],
+            message=message
+        )
+
+
 class UpdateLowStockProducts(graphene.Mutation):
     class Arguments:
         threshold = graphene.Int(required=True)
+        restock_amount = graphene.Int(required=False)
+        max_batch_size = graphene.Int(required=False)
 
     updated_count = graphene.Int()
     low_stock_products = graphene.List(ProductType)
     message = graphene.String()
     errors = graphene.List(ErrorType)
 
-    def mutate(self, info, threshold):
+    def mutate(self, info, threshold, restock_amount=None, max_batch_size=None):
         errors = []
+        if restock_amount is None:
+            restock_amount = getattr(settings, 'LOW_STOCK_RESTOCK_AMOUNT', 10)
+        if max_batch_size is None:
+            max_batch_size = getattr(settings, 'LOW_STOCK_MAX_BATCH_SIZE', 1000)
+
         if threshold < 0:
             errors.append(ErrorType(field="threshold", message="Threshold cannot be negative."))
+        if restock_amount <= 0:
+            errors.append(ErrorType(field="restock_amount", message="Restock amount must be positive."))
+        if max_batch_size <= 0:
+            errors.append(ErrorType(field="max_batch_size", message="Max batch size must be positive."))
 
         if errors:
             return UpdateLowStockProducts(updated_count=0, message="Validation failed.", errors=errors)
 
         try:
-            low_stock_products = Product.objects.filter(stock__lt=threshold)
-            count = low_stock_products.count()
-            for product in low_stock_products:
-                product.stock += 10
-                product.save()
+            low_stock_products = restock_low_stock(threshold, restock_amount, max_batch_size)
+            count = len(low_stock_products)
 
             return UpdateLowStockProducts(updated_count=count, low_stock_products=low_stock_products, message=f"Updated {count} products.", errors=[])
         except Exception as e:
@@ -486,8 +808,52 @@ class Mutation(graphene.ObjectType):
   create_product = CreateProduct.Field()
   update_low_stock_products = UpdateLowStockProducts.Field()
   create_order = CreateOrder.Field()
+  create_orders = CreateOrders.Field()
   token = graphql_jwt.ObtainJSONWebToken.Field()
   verify_token = graphql_jwt.Verify.Field()
   refresh_token = graphql_jwt.Refresh.Field()
   delete_token_cookie = graphql_jwt.DeleteJSONWebTokenCookie.Field()
 
+
+
+async def _published(channel, info, model, select=None):
+    """Yield the `model` objects named by each message on `channel`, in publish order.
+
+    `select(message)` picks the pks out of a message (default: its `ids`);
+    messages it selects nothing from cost no query. Each batch gets fresh
+    loaders, so relations are read as of that event.
+    """
+    async for message in get_pubsub().subscribe(channel):
+        pks = select(message) if select else message['ids']
+        if not pks:
+            continue
+        objects = {obj.pk: obj async for obj in model.objects.filter(pk__in=pks)}
+        info.context.loaders = AsyncLoaders()
+        for pk in pks:
+            obj = objects.get(model._meta.pk.to_python(pk))
+            if obj is not None:
+                yield obj
+
+
+class Subscription(graphene.ObjectType):
+  order_created = graphene.Field(OrderType)
+  customer_created = graphene.Field(CustomerType)
+  product_stock_changed = graphene.Field(
+      ProductType,
+      threshold=graphene.Int(description="Only products whose new stock is below this."),
+  )
+
+  async def subscribe_order_created(root, info):
+      async for order in _published(events.ORDER_CREATED, info, Order):
+          yield order
+
+  async def subscribe_customer_created(root, info):
+      async for customer in _published(events.CUSTOMER_CREATED, info, Customer):
+          yield customer
+
+  async def subscribe_product_stock_changed(root, info, threshold=None):
+      def select(message):
+          return [pk for pk, stock in message['products'] if threshold is None or stock < threshold]
+
+      async for product in _published(events.PRODUCT_STOCK_CHANGED, info, Product, select):
+          yield product
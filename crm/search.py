@@ -0,0 +1,224 @@
+import re
+import uuid
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Customer, Product
+
+# The text each searchable model is indexed on, most significant column first.
+SEARCH_FIELDS = {
+    Customer: ('name', 'email'),
+    Product: ('name', 'description'),
+}
+
+# Cap on query terms, so a pasted paragraph can't turn into a huge match expression.
+MAX_TERMS = 8
+
+# Best-ranked matches taken from each model before the models are merged
+# into one ranking (more when the requested page reaches deeper), so a broad
+# query ("a", "gmail") never sorts or ships every match.
+MAX_CANDIDATES = 200
+
+
+def search_terms(query):
+    """Split a free-text query into word terms; punctuation and operators are dropped."""
+    return re.findall(r'\w+', query or '')[:MAX_TERMS]
+
+
+class SearchBackend:
+    """Ranked prefix search over SEARCH_FIELDS.
+
+    `search()` returns `(model, pk, rank)` tuples, best match first. Backends
+    that keep a separate index also implement `index()`/`remove()` (called
+    from signals) and `rebuild()`.
+    """
+
+    def search(self, query, limit, offset=0):
+        raise NotImplementedError
+
+    @staticmethod
+    def candidates(limit, offset):
+        return max(MAX_CANDIDATES, offset + limit)
+
+    def index(self, model, instances):
+        pass
+
+    def remove(self, model, pks):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class SqliteSearchBackend(SearchBackend):
+    """One FTS5 table per model, kept in sync from Django signals.
+
+    FTS5 rows are keyed by an integer rowid, so each table has a companion
+    `<table>_keys` table mapping the UUID pk to the rowid it was given.
+    Updates and deletes go through that mapping's unique index rather than
+    scanning the (unindexed) pk column of the FTS table.
+    """
+
+    # name counts ten times as much as the secondary column in bm25()
+    WEIGHTS = (0, 10.0, 1.0)
+
+    @staticmethod
+    def table(model):
+        return f"{model._meta.db_table}_fts"
+
+    @classmethod
+    def keys_table(cls, model):
+        return f"{cls.table(model)}_keys"
+
+    def search(self, query, limit, offset=0):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        match = " ".join(f'"{term}"*' for term in terms)
+        weights = ", ".join(str(weight) for weight in self.WEIGHTS)
+        selects = [
+            f"SELECT * FROM (SELECT {i} AS kind, pk, -bm25({self.table(model)}, {weights}) AS score "
+            f"FROM {self.table(model)} WHERE {self.table(model)} MATCH %s ORDER BY score DESC, pk LIMIT %s)"
+            for i, model in enumerate(SEARCH_FIELDS)
+        ]
+        sql = " UNION ALL ".join(selects) + " ORDER BY score DESC, pk LIMIT %s OFFSET %s"
+        models = list(SEARCH_FIELDS)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match, self.candidates(limit, offset)] * len(models) + [limit, offset])
+            return [(models[kind], uuid.UUID(pk), score) for kind, pk, score in cursor.fetchall()]
+
+    def index(self, model, instances):
+        fields = SEARCH_FIELDS[model]
+        rows = [
+            (*(getattr(instance, field) or '' for field in fields), instance.pk.hex)
+            for instance in instances
+        ]
+        if not rows:
+            return
+        table, keys = self.table(model), self.keys_table(model)
+        values = ", ".join(["%s"] * len(fields))
+        with connection.cursor() as cursor:
+            cursor.executemany(f"INSERT OR IGNORE INTO {keys} (pk) VALUES (%s)", [(row[-1],) for row in rows])
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO {table} (rowid, pk, {', '.join(fields)}) "
+                f"SELECT id, pk, {values} FROM {keys} WHERE pk = %s",
+                rows,
+            )
+
+    def remove(self, model, pks):
+        table, keys = self.table(model), self.keys_table(model)
+        hexes = [(pk.hex,) for pk in pks]
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {table} WHERE rowid = (SELECT id FROM {keys} WHERE pk = %s)", hexes)
+            cursor.executemany(f"DELETE FROM {keys} WHERE pk = %s", hexes)
+
+    def rebuild(self, batch_size=2000):
+        # One transaction per table: in autocommit every inserted row would
+        # be its own commit.
+        for model, fields in SEARCH_FIELDS.items():
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(f"DELETE FROM {self.table(model)}")
+                    cursor.execute(f"DELETE FROM {self.keys_table(model)}")
+                batch = []
+                for instance in model._default_manager.only(*fields).order_by().iterator(chunk_size=batch_size):
+                    batch.append(instance)
+                    if len(batch) >= batch_size:
+                        self.index(model, batch)
+                        batch = []
+                self.index(model, batch)
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {self.table(model)} ({self.table(model)}) VALUES ('optimize')")
+
+
+class PostgresSearchBackend(SearchBackend):
+    """tsvector expressions backed by GIN expression indexes.
+
+    The index is on the same expression the query uses, so there is nothing
+    to keep in sync: Postgres maintains it on every write.
+    """
+
+    VECTORS = {
+        Customer: (
+            "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(email, '')), 'B')"
+        ),
+        Product: (
+            "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(description, '')), 'B')"
+        ),
+    }
+
+    @staticmethod
+    def index_name(model):
+        return f"{model._meta.db_table}_search_idx"
+
+    def search(self, query, limit, offset=0):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        tsquery = " & ".join(f"{term}:*" for term in terms)
+        models = list(SEARCH_FIELDS)
+        selects = [
+            f"SELECT * FROM ("
+            f"SELECT {i} AS kind, {model._meta.pk.column} AS pk, ts_rank({self.VECTORS[model]}, q) AS score "
+            f"FROM {model._meta.db_table}, to_tsquery('simple', %s) q WHERE {self.VECTORS[model]} @@ q "
+            f"ORDER BY score DESC, pk LIMIT %s"
+            f") candidates_{i}"
+            for i, model in enumerate(models)
+        ]
+        sql = " UNION ALL ".join(selects) + " ORDER BY score DESC, pk LIMIT %s OFFSET %s"
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [tsquery, self.candidates(limit, offset)] * len(models) + [limit, offset])
+            return [(models[kind], pk, score) for kind, pk, score in cursor.fetchall()]
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            for model in SEARCH_FIELDS:
+                cursor.execute(f"REINDEX INDEX {self.index_name(model)}")
+
+
+class LikeSearchBackend(SearchBackend):
+    """Unranked icontains fallback for databases without a full-text index here."""
+
+    def search(self, query, limit, offset=0):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        results = []
+        for model, fields in SEARCH_FIELDS.items():
+            condition = Q()
+            for term in terms:
+                term_condition = Q()
+                for field in fields:
+                    term_condition |= Q(**{f"{field}__icontains": term})
+                condition &= term_condition
+            pks = model._default_manager.filter(condition).order_by('pk').values_list('pk', flat=True)
+            results.extend((model, pk, 0.0) for pk in pks[:offset + limit])
+        return results[offset:offset + limit]
+
+
+BACKENDS = {
+    'sqlite': SqliteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend():
+    return BACKENDS.get(connection.vendor, LikeSearchBackend)()
+
+
+def search_objects(query, limit, offset=0):
+    """Return `[(instance, rank)]` for the best matches of `query`, best first."""
+    hits = get_search_backend().search(query, limit, offset)
+    instances = {}
+    for model in SEARCH_FIELDS:
+        pks = [pk for hit_model, pk, _ in hits if hit_model is model]
+        if pks:
+            instances[model] = model._default_manager.in_bulk(pks)
+    return [
+        (instances[model][pk], rank)
+        for model, pk, rank in hits
+        if pk in instances.get(model, {})
+    ]
@@ -1 +1,231 @@
-print('hello world')
\ No newline at end of file
+"""Synthetic CRM data at production-like volumes, for benchmarking.
+
+Everything is drawn from one seeded RNG, primary keys included, so the same
+arguments always produce the same database and benchmark runs on different
+commits see identical data.
+"""
+import math
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import invalidate_models
+from .counters import reconcile_customer_counters
+from .models import Customer, Order, Product
+from .phones import normalize_phone
+from .search import get_search_backend
+
+FIRST_NAMES = (
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Amara', 'Kwame',
+    'Chinedu', 'Ngozi', 'Wanjiru', 'Kofi', 'Aisha', 'Mohamed', 'Fatima', 'Yusuf', 'Mei', 'Hiroshi',
+    'Priya', 'Arjun', 'Sofia', 'Mateo', 'Lucia', 'Lars', 'Ingrid', 'Olga', 'Ivan', 'Zanele',
+)
+LAST_NAMES = (
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Martinez', 'Lopez',
+    'Okafor', 'Mensah', 'Kamau', 'Otieno', 'Adeyemi', 'Nkosi', 'Diallo', 'Haddad', 'Chen', 'Wang',
+    'Tanaka', 'Sato', 'Patel', 'Sharma', 'Silva', 'Rossi', 'Muller', 'Novak', 'Ivanova', 'Larsen',
+)
+EMAIL_DOMAINS = ('gmail.com', 'yahoo.com', 'outlook.com', 'icloud.com', 'proton.me', 'example.com')
+PRODUCT_ADJECTIVES = (
+    'Classic', 'Premium', 'Compact', 'Wireless', 'Organic', 'Ergonomic', 'Portable', 'Smart',
+    'Deluxe', 'Eco', 'Pro', 'Mini', 'Ultra', 'Vintage', 'Rugged',
+)
+PRODUCT_NOUNS = (
+    'Laptop', 'Headphones', 'Backpack', 'Coffee Maker', 'Desk Lamp', 'Keyboard', 'Monitor', 'Water Bottle',
+    'Notebook', 'Sneakers', 'Jacket', 'Blender', 'Speaker', 'Camera', 'Chair', 'Router', 'Tablet', 'Watch',
+)
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """Let bulk_create store the given auto_now/auto_now_add values instead of now()."""
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Generator:
+    """Draws customers, products and orders with skewed, realistic distributions.
+
+    - Order volume per customer is log-normal, so roughly a fifth of the
+      customers place most of the orders; product popularity is Zipfian.
+    - Prices are log-normal, orders hold 1-5 products, and order dates lean
+      towards the recent end of the window.
+    """
+
+    def __init__(self, random_seed=0, days=365, now=None):
+        self.rng = random.Random(random_seed)
+        self.days = days
+        self.now = now or timezone.now()
+
+    def uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def past(self, days, recency=1.0):
+        """A moment in the last `days` days; recency > 1 favours recent ones."""
+        return self.now - timedelta(seconds=days * 86400 * self.rng.random() ** recency)
+
+    def phone(self):
+        digits = f"{self.rng.randint(201, 989)}{self.rng.randint(200, 999)}{self.rng.randint(0, 9999):04d}"
+        style = self.rng.random()
+        if style < 0.2:
+            return None
+        if style < 0.5:
+            return f"+1{digits}"
+        if style < 0.7:
+            return f"({digits[:3]}) {digits[3:6]}-{digits[6:]}"
+        if style < 0.85:
+            return f"{digits[:3]}-{digits[3:6]}-{digits[6:]}"
+        return f"{digits[:3]}.{digits[3:6]}.{digits[6:]}"
+
+    def customer(self, index):
+        first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+        phone = self.phone()
+        return Customer(
+            id=self.uuid(),
+            name=f"{first} {last}",
+            email=f"{first}.{last}.{index}@{self.rng.choice(EMAIL_DOMAINS)}".lower(),
+            phone=phone,
+            phone_normalized=normalize_phone(phone),
+            address=f"{self.rng.randint(1, 9999)} {self.rng.choice(LAST_NAMES)} Street" if self.rng.random() < 0.7 else None,
+            created_at=self.past(self.days * 2),
+        )
+
+    def product(self, index):
+        adjective, noun = self.rng.choice(PRODUCT_ADJECTIVES), self.rng.choice(PRODUCT_NOUNS)
+        created_at = self.past(self.days * 2)
+        return Product(
+            product_id=self.uuid(),
+            name=f"{adjective} {noun} {index}",
+            description=f"{adjective} {noun.lower()} from the {self.rng.choice(LAST_NAMES)} collection.",
+            price=Decimal(min(math.exp(self.rng.gauss(3.5, 1.0)), 9999)).quantize(Decimal('0.01')),
+            stock=0 if self.rng.random() < 0.05 else self.rng.randint(1, 500),
+            created_at=created_at,
+            updated_at=created_at,
+        )
+
+    @staticmethod
+    def cumulative(weights):
+        total, cumulative = 0, []
+        for weight in weights:
+            total += weight
+            cumulative.append(total)
+        return cumulative
+
+    def customer_weights(self, count):
+        return self.cumulative(self.rng.lognormvariate(0, 1.5) for _ in range(count))
+
+    def product_weights(self, count):
+        ranks = list(range(1, count + 1))
+        self.rng.shuffle(ranks)
+        return self.cumulative(1 / rank ** 1.1 for rank in ranks)
+
+    def order(self, customer_pks, customer_weights, products, product_weights):
+        picks = self.rng.choices(products, cum_weights=product_weights, k=min(5, 1 + int(self.rng.expovariate(1.2))))
+        picks = list({product.pk: product for product in picks}.values())
+        quantity = self.rng.choices((1, 2, 3, 4, 5), weights=(50, 25, 12, 8, 5))[0]
+        order = Order(
+            order_id=self.uuid(),
+            customer_id_id=self.rng.choices(customer_pks, cum_weights=customer_weights)[0],
+            quantity=quantity,
+            order_date=self.past(self.days, recency=1.5),
+            total_amount=int(sum(product.price for product in picks) * quantity),
+        )
+        return order, [product.pk for product in picks]
+
+
+def _batches(count, batch_size):
+    for start in range(0, count, batch_size):
+        yield start, min(batch_size, count - start)
+
+
+def clear():
+    """Delete all customers, products and orders without loading them.
+
+    A raw delete skips signals and cascade collection, which is what makes
+    it usable at a million rows; the search index is rebuilt afterwards.
+    """
+    with transaction.atomic():
+        for queryset in (
+            Order.product_ids.through.objects.all(),
+            Order.objects.all(),
+            Customer.objects.all(),
+            Product.objects.all(),
+        ):
+            queryset._raw_delete(queryset.db)
+        invalidate_models(Customer, Product, Order)
+
+
+def seed(customers=10000, products=500, orders=100000, batch_size=5000, days=365,
+         random_seed=0, search_index=True, log=print):
+    """Insert synthetic data with bulk inserts, one transaction per batch.
+
+    Customer counters are reconciled and the search index rebuilt once at
+    the end instead of row by row. Returns the seconds spent per stage.
+    """
+    generator = Generator(random_seed=random_seed, days=days)
+    timings = {}
+
+    started = time.perf_counter()
+    with explicit_timestamps(Customer._meta.get_field('created_at')):
+        for start, size in _batches(customers, batch_size):
+            with transaction.atomic():
+                Customer.objects.bulk_create([generator.customer(start + i) for i in range(size)])
+    timings['customers'] = time.perf_counter() - started
+    log(f"{customers} customers in {timings['customers']:.1f}s")
+
+    started = time.perf_counter()
+    catalog = [generator.product(i) for i in range(products)]
+    with explicit_timestamps(Product._meta.get_field('created_at'), Product._meta.get_field('updated_at')):
+        with transaction.atomic():
+            Product.objects.bulk_create(catalog, batch_size=batch_size)
+    timings['products'] = time.perf_counter() - started
+    log(f"{products} products in {timings['products']:.1f}s")
+
+    started = time.perf_counter()
+    customer_pks = list(Customer.objects.order_by('pk').values_list('pk', flat=True))
+    catalog = list(Product.objects.order_by('pk').only('pk', 'price'))
+    customer_weights = generator.customer_weights(len(customer_pks))
+    product_weights = generator.product_weights(len(catalog))
+    Link = Order.product_ids.through
+    with explicit_timestamps(Order._meta.get_field('order_date')):
+        for start, size in _batches(orders if customer_pks and catalog else 0, batch_size):
+            drawn = [generator.order(customer_pks, customer_weights, catalog, product_weights) for _ in range(size)]
+            with transaction.atomic():
+                created = Order.objects.bulk_create([order for order, _ in drawn])
+                Link.objects.bulk_create([
+                    Link(order_id=order.pk, product_id=product_pk)
+                    for order, (_, product_pks) in zip(created, drawn)
+                    for product_pk in product_pks
+                ])
+            if (start // batch_size) % 20 == 19:
+                log(f"  {start + size} orders")
+    timings['orders'] = time.perf_counter() - started
+    log(f"{orders} orders in {timings['orders']:.1f}s")
+
+    started = time.perf_counter()
+    with transaction.atomic():
+        reconcile_customer_counters()
+    timings['counters'] = time.perf_counter() - started
+    log(f"customer counters in {timings['counters']:.1f}s")
+
+    if search_index:
+        started = time.perf_counter()
+        get_search_backend().rebuild()
+        timings['search_index'] = time.perf_counter() - started
+        log(f"search index in {timings['search_index']:.1f}s")
+
+    invalidate_models(Customer, Product, Order)
+    return timings
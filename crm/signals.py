@@ -0,0 +1,65 @@
+from django.contrib.auth import user_logged_out
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from graphql_jwt.refresh_token.signals import refresh_token_revoked
+
+from .auth import token_user_cache
+from .cache import invalidate_models
+from .counters import forget_order
+from .models import Customer, Product, Order, User
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_cached_responses(sender, **kwargs):
+    invalidate_models(sender)
+
+
+@receiver(m2m_changed, sender=Order.product_ids.through)
+def invalidate_order_products(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_models(Order, Product)
+
+
+@receiver(post_delete, sender=Order)
+def uncount_deleted_order(sender, instance, **kwargs):
+    forget_order(instance)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+def index_for_search(sender, instance, **kwargs):
+    get_search_backend().index(sender, [instance])
+
+
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+def remove_from_search(sender, instance, **kwargs):
+    get_search_backend().remove(sender, [instance.pk])
+
+
+def _forget_user_tokens(pk):
+    transaction.on_commit(lambda: token_user_cache.invalidate_user(pk))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    _forget_user_tokens(instance.pk)
+
+
+@receiver(user_logged_out)
+def invalidate_logged_out_user(sender, user=None, **kwargs):
+    if user is not None:
+        _forget_user_tokens(user.pk)
+
+
+@receiver(refresh_token_revoked)
+def invalidate_revoked_user(sender, refresh_token, **kwargs):
+    _forget_user_tokens(refresh_token.user_id)
@@ -0,0 +1,97 @@
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import events
+from .cache import invalidate_models
+from .models import Product
+
+
+def _supports_update_returning():
+    # MySQL/MariaDB have no UPDATE ... RETURNING (and MySQL rejects LIMIT in
+    # an IN subquery), so only PostgreSQL and SQLite >= 3.35 take the fast path.
+    return (
+        connection.vendor in ('postgresql', 'sqlite')
+        and connection.features.can_return_columns_from_insert
+    )
+
+
+def restock_low_stock(threshold, amount, limit):
+    """Add `amount` to the stock of up to `limit` products with stock below `threshold`.
+
+    The most depleted products go first. Returns the updated products with
+    their new stock. Where the backend supports it, this is a single
+    `UPDATE ... RETURNING` statement; the outer `stock < threshold` is checked
+    again at write time, so a row restocked concurrently is not topped up twice.
+    """
+    with transaction.atomic():
+        if _supports_update_returning():
+            products = _restock_returning(threshold, amount, limit)
+        else:
+            products = _restock_locked(threshold, amount, limit)
+        # A bulk UPDATE sends no post_save, so cached responses are dropped
+        # here, once the write commits.
+        invalidate_models(Product)
+        events.stock_changed(products)
+    return products
+
+
+def _restock_locked(threshold, amount, limit):
+    with transaction.atomic():
+        pks = list(
+            Product.objects.select_for_update()
+            .filter(stock__lt=threshold)
+            .order_by('stock', 'pk')
+            .values_list('pk', flat=True)[:limit]
+        )
+        Product.objects.filter(pk__in=pks, stock__lt=threshold).update(
+            stock=F('stock') + amount,
+            updated_at=timezone.now(),
+        )
+        return list(Product.objects.filter(pk__in=pks).order_by('stock', 'pk'))
+
+
+def _restock_returning(threshold, amount, limit):
+    qn = connection.ops.quote_name
+    opts = Product._meta
+    table = qn(opts.db_table)
+    pk = qn(opts.pk.column)
+    stock = qn(opts.get_field('stock').column)
+    updated_at = opts.get_field('updated_at')
+    fields = [field for field in opts.concrete_fields]
+    columns = ", ".join(qn(field.column) for field in fields)
+
+    sql = (
+        f"UPDATE {table} SET {stock} = {stock} + %s, {qn(updated_at.column)} = %s "
+        f"WHERE {stock} < %s AND {pk} IN ("
+        f"SELECT {pk} FROM {table} WHERE {stock} < %s ORDER BY {stock}, {pk} LIMIT %s"
+        f") RETURNING {columns}"
+    )
+    params = [
+        amount,
+        updated_at.get_db_prep_value(timezone.now(), connection),
+        threshold,
+        threshold,
+        limit,
+    ]
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+    # Run the same backend converters the ORM would (UUID, Decimal, datetime).
+    cols = [field.get_col(opts.db_table) for field in fields]
+    converters = [
+        connection.ops.get_db_converters(col) + col.get_db_converters(connection)
+        for col in cols
+    ]
+    products = []
+    for row in rows:
+        values = []
+        for col, col_converters, value in zip(cols, converters, row):
+            for converter in col_converters:
+                value = converter(value, col, connection)
+            values.append(value)
+        products.append(Product.from_db(connection.alias, [f.attname for f in fields], values))
+    products.sort(key=lambda product: (product.stock, product.pk))
+    return products
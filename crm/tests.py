@@ -1,3 +1,1454 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from alx_backend_graphql_crm.schema import schema
+from asgiref.sync import async_to_sync
+from django.conf import settings as django_settings
+from django.contrib.auth import user_logged_out
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from graphene_django.utils.testing import GraphQLTestCase
+from graphql import parse
+from graphql_jwt.refresh_token.shortcuts import create_refresh_token
+from graphql_jwt.shortcuts import get_token
+from graphql_jwt.utils import get_payload
+
+from . import events, exports
+from .auth import get_user_by_token, token_user_cache
+from .cache import response_cache
+from .counters import record_orders, stale_customers
+from .documents import DocumentCache, document_hash
+from .imports import CustomerImporter, ErrorFile, ImportFormatError, ProductImporter, read_rows
+from .models import Customer, Product, Order, User, customers_with_emails
+from .phones import normalize_phone, phone_prefix_range
+from .pubsub import InMemoryPubSub, get_pubsub
+from .reminders import iter_order_chunks, load_checkpoint, send_order_reminders
+from .views import CachedGraphQLView
+from .websocket import SUBPROTOCOL, GraphQLWebSocketApp
+
+
+@override_settings(GRAPHQL_PUBSUB={'BACKEND': 'crm.pubsub.InMemoryPubSub'})
+class CRMTestCase(GraphQLTestCase):
+    GRAPHQL_URL = '/graphql/'
+
+    def setUp(self):
+        # Events publish on commit; keep them in process.
+        get_pubsub.cache_clear()
+        self.addCleanup(get_pubsub.cache_clear)
+
+    def data(self, query, **kwargs):
+        response = self.query(query, **kwargs)
+        self.assertResponseNoErrors(response)
+        return response.json()['data']
+
+
+def make_orders(customers=3, products=4, orders_per_customer=2):
+    customers = [
+        Customer.objects.create(name=f"Customer {i}", email=f"customer{i}@example.com")
+        for i in range(customers)
+    ]
+    products = [
+        Product.objects.create(name=f"Product {i}", description="", price=Decimal(10 * (i + 1)), stock=i)
+        for i in range(products)
+    ]
+    orders = []
+    for customer in customers:
+        for i in range(orders_per_customer):
+            order = Order.objects.create(customer_id=customer, quantity=2, total_amount=30)
+            order.product_ids.set(products[i:i + 2])
+            orders.append(order)
+    return customers, products, orders
+
+
+class LoaderQueryCountTests(CRMTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_orders(customers=5, orders_per_customer=3)
+
+    def test_order_relations_cost_a_fixed_number_of_queries(self):
+        query = '''
+            query {
+              allOrders(first: 15) {
+                edges { node { totalAmount customerId { name } productIds { edges { node { name } } } } }
+              }
+            }
+        '''
+        # count, orders with their customers, products of all orders.
+        with self.assertNumQueries(3):
+            data = self.data(query)
+        edges = data['allOrders']['edges']
+        self.assertEqual(len(edges), 15)
+        self.assertTrue(all(len(edge['node']['productIds']['edges']) == 2 for edge in edges))
+
+    def test_reverse_relations_are_batched(self):
+        query = '''
+            query {
+              allCustomers(first: 5) { edges { node { name orderSet { edges { node { totalAmount } } } } } }
+            }
+        '''
+        with self.assertNumQueries(3):
+            data = self.data(query)
+        self.assertEqual(
+            [len(edge['node']['orderSet']['edges']) for edge in data['allCustomers']['edges']],
+            [3] * 5,
+        )
+
+
+class SelectionOptimizerTests(CRMTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_orders()
+
+    def order_queries(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            self.data(query)
+        return [q['sql'] for q in queries if q['sql'].startswith('SELECT "crm_order"')]
+
+    def test_selected_foreign_key_is_joined(self):
+        sql = self.order_queries('query { allOrders(first: 5) { edges { node { customerId { name } } } } }')
+        self.assertEqual(len(sql), 1)
+        self.assertIn('"crm_customer"', sql[0])
+
+    def test_unselected_foreign_key_is_not_joined(self):
+        sql = self.order_queries('query { allOrders(first: 5) { edges { node { totalAmount } } } }')
+        self.assertEqual(len(sql), 1)
+        self.assertNotIn('"crm_customer"', sql[0])
+
+    def test_fragments_are_followed(self):
+        query = '''
+            query { allOrders(first: 5) { edges { node { ...OrderCustomer } } } }
+            fragment OrderCustomer on OrderType { customerId { name } }
+        '''
+        with self.assertNumQueries(2):
+            self.data(query)
+
+
+class KeysetPaginationTests(CRMTestCase):
+    PAGE = '''
+        query ($first: Int, $last: Int, $after: String, $before: String) {
+          allCustomersKeyset(first: $first, last: $last, after: $after, before: $before) {
+            edges { node { name email } }
+            pageInfo { startCursor endCursor hasNextPage hasPreviousPage }
+          }
+        }
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        # Repeated names so pages break inside a run of equal sort keys.
+        for i, name in enumerate(['Bea', 'Ann', 'Bea', 'Cid', 'Ann', 'Bea', 'Dot']):
+            Customer.objects.create(name=name, email=f"keyset{i}@example.com")
+        cls.expected = list(Customer.objects.order_by('name', 'id').values_list('email', flat=True))
+
+    def page(self, **variables):
+        return self.data(self.PAGE, variables=variables)['allCustomersKeyset']
+
+    def test_forward_pages_cover_every_row_once(self):
+        emails, after = [], None
+        while True:
+            page = self.page(first=2, after=after)
+            emails += [edge['node']['email'] for edge in page['edges']]
+            if not page['pageInfo']['hasNextPage']:
+                break
+            after = page['pageInfo']['endCursor']
+        self.assertEqual(emails, self.expected)
+
+    def test_backward_pages_cover_every_row_once(self):
+        emails, before = [], None
+        while True:
+            page = self.page(last=3, before=before)
+            emails = [edge['node']['email'] for edge in page['edges']] + emails
+            if not page['pageInfo']['hasPreviousPage']:
+                break
+            before = page['pageInfo']['startCursor']
+        self.assertEqual(emails, self.expected)
+
+    def test_page_bounds(self):
+        first = self.page(first=3)
+        self.assertFalse(first['pageInfo']['hasPreviousPage'])
+        self.assertTrue(first['pageInfo']['hasNextPage'])
+        rest = self.page(first=10, after=first['pageInfo']['endCursor'])
+        self.assertTrue(rest['pageInfo']['hasPreviousPage'])
+        self.assertFalse(rest['pageInfo']['hasNextPage'])
+        self.assertEqual(len(rest['edges']), len(self.expected) - 3)
+
+    def test_bad_cursor_is_rejected(self):
+        for cursor in ['not a cursor', 'WyJBbm4iXQ==']:  # garbage, then one key short
+            with self.subTest(cursor=cursor):
+                response = self.query(self.PAGE, variables={'first': 2, 'after': cursor})
+                self.assertResponseHasErrors(response)
+                self.assertIn('Invalid cursor', response.json()['errors'][0]['message'])
+
+    def test_order_by_is_not_offered(self):
+        response = self.query('query { allCustomersKeyset(first: 2, orderBy: "-name") { edges { node { name } } } }')
+        self.assertResponseHasErrors(response)
+
+
+class OrderStatsTests(CRMTestCase):
+    STATS = '''
+        query ($productName: String, $totalAmount_Gte: Int) {
+          orderStats(productName: $productName, totalAmount_Gte: $totalAmount_Gte) {
+            count totalRevenue averageOrderValue minOrderValue maxOrderValue daily { count revenue }
+          }
+        }
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(name="Stats", email="stats@example.com")
+        widgets = [
+            Product.objects.create(name=f"Widget {i}", description="", price=Decimal('5.00'))
+            for i in range(3)
+        ]
+        gadget = Product.objects.create(name="Gadget", description="", price=Decimal('7.00'))
+        for total, products in [(100, widgets), (40, widgets[:2]), (10, [gadget])]:
+            order = Order.objects.create(customer_id=customer, quantity=len(products), total_amount=total)
+            order.product_ids.set(products)
+
+    def stats(self, **variables):
+        return self.data(self.STATS, variables=variables)['orderStats']
+
+    def test_totals(self):
+        stats = self.stats()
+        self.assertEqual(stats['count'], 3)
+        self.assertEqual(Decimal(stats['totalRevenue']), 150)
+        self.assertEqual(Decimal(stats['averageOrderValue']), Decimal('50.00'))
+        self.assertEqual((stats['minOrderValue'], stats['maxOrderValue']), (10, 100))
+        self.assertEqual(sum(day['count'] for day in stats['daily']), 3)
+
+    def test_product_filter_counts_each_order_once(self):
+        # Both widget orders match through several products each.
+        stats = self.stats(productName='widget')
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(Decimal(stats['totalRevenue']), 140)
+        self.assertEqual(Decimal(stats['averageOrderValue']), Decimal('70.00'))
+        self.assertEqual([day['count'] for day in stats['daily']], [2])
+
+    def test_filters_combine(self):
+        stats = self.stats(productName='widget', totalAmount_Gte=50)
+        self.assertEqual((stats['count'], Decimal(stats['totalRevenue'])), (1, 100))
+
+    def test_no_matches(self):
+        stats = self.stats(productName='nothing')
+        self.assertEqual(stats['count'], 0)
+        self.assertIsNone(stats['averageOrderValue'])
+        self.assertEqual(stats['daily'], [])
+
+
+class QueryCostTests(CRMTestCase):
+    def test_cost_is_reported(self):
+        response = self.query('query { allOrders(first: 50) { edges { node { customerId { name } } } } }')
+        self.assertResponseNoErrors(response)
+        self.assertEqual(response.json()['extensions']['cost'], {'requested': 51, 'depth': 3})
+
+    def test_variables_and_fragments_count(self):
+        query = '''
+            query ($n: Int) { allCustomers(first: $n) { edges { node { ...Orders } } } }
+            fragment Orders on CustomerType { orderSet(first: 10) { edges { node { customerId { name } } } } }
+        '''
+        response = self.query(query, variables={'n': 20})
+        self.assertEqual(response.json()['extensions']['cost'], {'requested': 1 + 20 * (1 + 10), 'depth': 4})
+
+    @override_settings(GRAPHQL_MAX_QUERY_COST=100)
+    def test_expensive_query_is_rejected(self):
+        response = self.query(
+            'query { allCustomers(first: 100) { edges { node { orderSet(first: 100) { edges { node { id } } } } } } }'
+        )
+        self.assertResponseHasErrors(response)
+        error = response.json()['errors'][0]
+        self.assertEqual(error['extensions']['code'], 'QUERY_TOO_EXPENSIVE')
+        self.assertEqual(error['extensions']['cost'], 1 + 100 * 1)
+
+    @override_settings(GRAPHQL_MAX_QUERY_DEPTH=4)
+    def test_deep_query_is_rejected(self):
+        response = self.query('''
+            query { allOrders(first: 1) { edges { node {
+              customerId { orderSet(first: 1) { edges { node { customerId { name } } } } }
+            } } } }
+        ''')
+        self.assertResponseHasErrors(response)
+        self.assertEqual(response.json()['errors'][0]['extensions']['depth'], 5)
+
+
+class BulkCreateCustomersTests(CRMTestCase):
+    MUTATION = '''
+        mutation ($customers: [CustomerInput]!) {
+          bulkCreateCustomers(customersData: $customers) {
+            successfulCustomers { email phoneNormalized }
+            errors { recordIndex field message }
+            message
+          }
+        }
+    '''
+
+    def create(self, customers):
+        return self.data(self.MUTATION, variables={'customers': customers})['bulkCreateCustomers']
+
+    def test_partial_failure(self):
+        Customer.objects.create(name="Taken", email="taken@example.com")
+        with mock.patch('crm.schema.events.customers_created') as created:
+            result = self.create([
+                {'name': "A", 'email': "a@example.com", 'phone': "555-123-4567"},
+                {'name': "B", 'email': "not-an-email"},
+                {'name': "C", 'email': "taken@example.com"},
+                {'name': "D", 'email': "a@example.com"},
+                {'name': "E", 'email': "e@example.com", 'phone': "12"},
+                {'name': "F", 'email': "f@example.com"},
+            ])
+
+        self.assertEqual(
+            result['successfulCustomers'],
+            [{'email': "a@example.com", 'phoneNormalized': "+15551234567"}, {'email': "f@example.com", 'phoneNormalized': None}],
+        )
+        self.assertEqual(
+            [(error['recordIndex'], error['field']) for error in result['errors']],
+            [(1, 'email'), (2, 'email'), (3, 'email'), (4, 'phone')],
+        )
+        self.assertIn("Some records failed (4 errors)", result['message'])
+        self.assertEqual(Customer.objects.filter(email__in=["a@example.com", "f@example.com"]).count(), 2)
+        created.assert_called_once()
+        self.assertEqual([c.email for c in created.call_args.args[0]], ["a@example.com", "f@example.com"])
+
+    def test_integrity_error_falls_back_to_single_rows(self):
+        customers = [{'name': str(i), 'email': f"row{i}@example.com"} for i in range(3)]
+        bulk_create = mock.patch.object(type(Customer.objects), 'bulk_create', side_effect=IntegrityError)
+        with bulk_create, mock.patch('crm.schema.events.customers_created') as created:
+            result = self.create(customers)
+
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(len(result['successfulCustomers']), 3)
+        self.assertEqual(Customer.objects.filter(email__startswith="row").count(), 3)
+        created.assert_called_once()
+        self.assertEqual(len(created.call_args.args[0]), 3)
+
+    def test_emails_are_unique_regardless_of_case(self):
+        Customer.objects.create(name="Taken", email="taken@example.com")
+        result = self.create([
+            {'name': "A", 'email': "TAKEN@example.com"},
+            {'name': "B", 'email': "new@example.com"},
+            {'name': "C", 'email': "New@Example.com"},
+        ])
+        self.assertEqual([c['email'] for c in result['successfulCustomers']], ["new@example.com"])
+        self.assertEqual([(e['recordIndex'], e['field']) for e in result['errors']], [(0, 'email'), (2, 'email')])
+
+    def test_concurrent_insert_fails_only_its_row(self):
+        # As if another request inserted the email after the probe ran.
+        Customer.objects.create(name="Racer", email="race@example.com")
+        with mock.patch('crm.schema.customers_with_emails', return_value=customers_with_emails([])):
+            result = self.create([
+                {'name': "A", 'email': "a@example.com"},
+                {'name': "B", 'email': "RACE@example.com"},
+            ])
+        self.assertEqual([c['email'] for c in result['successfulCustomers']], ["a@example.com"])
+        self.assertEqual(
+            [(e['recordIndex'], e['message']) for e in result['errors']],
+            [(1, "Email already exists (database constraint).")],
+        )
+        self.assertEqual(Customer.objects.filter(email__iexact="race@example.com").count(), 1)
+
+    def test_created_customers_are_searchable(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create([{'name': "Quillon Marsh", 'email': "quillon@example.com"}])
+        data = self.data('query { search(query: "quillon") { edges { node { ... on CustomerType { email } } } } }')
+        self.assertEqual([edge['node'] for edge in data['search']['edges']], [{'email': "quillon@example.com"}])
+
+
+class RestockTests(CRMTestCase):
+    MUTATION = '''
+        mutation ($threshold: Int!, $amount: Int, $limit: Int) {
+          updateLowStockProducts(threshold: $threshold, restockAmount: $amount, maxBatchSize: $limit) {
+            updatedCount lowStockProducts { name stock } errors { field }
+          }
+        }
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        for name, stock in [('Empty', 0), ('Low', 3), ('Lower', 1), ('Full', 50)]:
+            Product.objects.create(name=name, description="", price=Decimal('1.00'), stock=stock)
+
+    def restock(self, **variables):
+        return self.data(self.MUTATION, variables=variables)['updateLowStockProducts']
+
+    def test_most_depleted_first_up_to_the_limit(self):
+        result = self.restock(threshold=5, amount=10, limit=2)
+        self.assertEqual(result['updatedCount'], 2)
+        self.assertEqual(result['lowStockProducts'], [{'name': 'Empty', 'stock': 10}, {'name': 'Lower', 'stock': 11}])
+        self.assertEqual(
+            dict(Product.objects.values_list('name', 'stock')),
+            {'Empty': 10, 'Low': 3, 'Lower': 11, 'Full': 50},
+        )
+
+    def test_locking_fallback_matches(self):
+        with mock.patch('crm.stock._supports_update_returning', return_value=False):
+            result = self.restock(threshold=5, amount=10, limit=2)
+        self.assertEqual(result['lowStockProducts'], [{'name': 'Empty', 'stock': 10}, {'name': 'Lower', 'stock': 11}])
+
+    def test_validation(self):
+        result = self.restock(threshold=-1, amount=0, limit=0)
+        self.assertEqual(result['updatedCount'], 0)
+        self.assertEqual([e['field'] for e in result['errors']], ['threshold', 'restock_amount', 'max_batch_size'])
+        self.assertEqual(Product.objects.filter(stock__lt=5).count(), 3)
+
+    def test_products_are_invalidated_on_commit(self):
+        with mock.patch.object(response_cache, 'invalidate') as invalidate:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.restock(threshold=5)
+                invalidate.assert_not_called()
+        self.assertTrue(callbacks)
+        invalidate.assert_any_call(Product)
+
+
+class CreateOrdersTests(CRMTestCase):
+    MUTATION = '''
+        mutation ($orders: [OrderInput!]!) {
+          createOrders(orders: $orders) {
+            successfulOrders { totalAmount quantity customerId { email } productIds { edges { node { name } } } }
+            errors { recordIndex field message }
+            message
+          }
+        }
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name="Buyer", email="buyer@example.com")
+        cls.products = [
+            Product.objects.create(name=f"Item {i}", description="", price=Decimal(10 + i))
+            for i in range(2)
+        ]
+
+    def create(self, orders):
+        return self.data(self.MUTATION, variables={'orders': orders})['createOrders']
+
+    def test_partial_failure(self):
+        customer, (a, b) = str(self.customer.pk), [str(p.pk) for p in self.products]
+        result = self.create([
+            {'customerUuid': customer, 'productUuids': [a, b, a]},
+            {'customerUuid': "nope", 'productUuids': [a]},
+            {'customerUuid': customer, 'productUuids': []},
+            {'customerUuid': customer, 'productUuids': ["not-a-uuid", str(uuid.uuid4())]},
+            {'customerUuid': customer, 'productUuids': [b]},
+        ])
+
+        self.assertEqual(
+            [(error['recordIndex'], error['field']) for error in result['errors']],
+            [(1, 'customer_id'), (2, 'product_ids'), (3, 'product_ids'), (3, 'product_ids')],
+        )
+        orders = result['successfulOrders']
+        self.assertEqual([(o['totalAmount'], o['quantity']) for o in orders], [(21, 2), (11, 1)])
+        self.assertEqual(
+            [[edge['node']['name'] for edge in o['productIds']['edges']] for o in orders],
+            [['Item 0', 'Item 1'], ['Item 1']],
+        )
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(Order.product_ids.through.objects.count(), 3)
+
+    def test_write_failure_creates_nothing(self):
+        bulk_create = mock.patch.object(type(Order.objects), 'bulk_create', side_effect=IntegrityError("boom"))
+        with bulk_create:
+            result = self.create([{'customerUuid': str(self.customer.pk), 'productUuids': [str(self.products[0].pk)]}])
+        self.assertEqual(result['successfulOrders'], [])
+        self.assertEqual([(e['recordIndex'], e['field']) for e in result['errors']], [(None, '__all__')])
+        self.assertFalse(Order.objects.exists())
+
+
+class ResponseCacheTests(CRMTestCase):
+    PRODUCTS = 'query { allProducts { edges { node { name stock } } } }'
+    STATS = 'query { orderStats { count } }'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers, cls.products, _ = make_orders(customers=1, products=2, orders_per_customer=1)
+
+    def setUp(self):
+        super().setUp()
+        caches[response_cache.alias].clear()
+        patcher = mock.patch.object(response_cache, 'enabled', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch(self, query):
+        response = self.query(query)
+        self.assertResponseNoErrors(response)
+        body = response.json()
+        return body['data'], body['extensions'].get('cache')
+
+    def mutate(self, mutation, **variables):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.data(mutation, variables=variables)
+
+    def test_repeated_query_hits(self):
+        first, status = self.fetch(self.PRODUCTS)
+        self.assertEqual(status, 'MISS')
+        second, status = self.fetch(self.PRODUCTS)
+        self.assertEqual((second, status), (first, 'HIT'))
+
+    def test_mutation_invalidates_what_it_writes(self):
+        self.fetch(self.PRODUCTS)
+        self.mutate('mutation { createProduct(name: "New", price: 3) { success } }')
+        data, status = self.fetch(self.PRODUCTS)
+        self.assertEqual(status, 'MISS')
+        self.assertIn({'name': 'New', 'stock': 0}, [edge['node'] for edge in data['allProducts']['edges']])
+
+    def test_restock_invalidates_products(self):
+        self.fetch(self.PRODUCTS)
+        self.mutate('mutation { updateLowStockProducts(threshold: 100, restockAmount: 5) { updatedCount } }')
+        data, status = self.fetch(self.PRODUCTS)
+        self.assertEqual(status, 'MISS')
+        self.assertEqual(sorted(edge['node']['stock'] for edge in data['allProducts']['edges']), [5, 6])
+
+    def test_computed_types_follow_their_models(self):
+        self.fetch(self.STATS)
+        self.mutate(
+            'mutation ($c: String!, $p: [String]!) { createOrder(customerUuid: $c, productUuids: $p) { success } }',
+            c=str(self.customers[0].pk), p=[str(self.products[0].pk)],
+        )
+        data, status = self.fetch(self.STATS)
+        self.assertEqual((data['orderStats']['count'], status), (2, 'MISS'))
+
+    def test_unrelated_writes_keep_entries(self):
+        self.fetch(self.PRODUCTS)
+        self.mutate('mutation { createCustomer(name: "Other", email: "other@example.com") { success } }')
+        self.assertEqual(self.fetch(self.PRODUCTS)[1], 'HIT')
+
+    def test_uncommitted_writes_keep_entries(self):
+        self.fetch(self.PRODUCTS)
+        with self.captureOnCommitCallbacks(execute=False):
+            self.data('mutation { createProduct(name: "Rolled back", price: 3) { success } }')
+        self.assertEqual(self.fetch(self.PRODUCTS)[1], 'HIT')
+
+    def test_readyz_reports_counters(self):
+        self.fetch(self.PRODUCTS)
+        self.fetch(self.PRODUCTS)
+        with mock.patch('crm.views.run_checks', return_value=(True, {})):
+            stats = self.client.get('/readyz').json()['caches']['responses']
+        self.assertTrue(stats['enabled'])
+        self.assertGreaterEqual(stats['hits'], 1)
+        self.assertGreaterEqual(stats['misses'], 1)
+
+
+class Crash(BaseException):
+    """Escapes the per-send error handling, like the process dying mid-run."""
+
+
+class OrderReminderTests(CRMTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _, _, cls.orders = make_orders(customers=1, products=1, orders_per_customer=5)
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log_file = os.path.join(directory.name, 'reminders.log')
+        self.checkpoint_file = os.path.join(directory.name, 'checkpoint.json')
+
+    def run_reminders(self, sender, **kwargs):
+        return async_to_sync(send_order_reminders)(
+            sender=sender, chunk_size=2, log_file=self.log_file, checkpoint_file=self.checkpoint_file, **kwargs,
+        )
+
+    def order_ids(self, orders):
+        return [str(order.order_id) for order in orders]
+
+    def test_chunks_follow_the_date_index(self):
+        async def chunks():
+            return [chunk async for chunk in iter_order_chunks(self.orders[0].order_date, chunk_size=2)]
+
+        # One query per chunk, and one more to find the end.
+        with self.assertNumQueries(4):
+            result = async_to_sync(chunks)()
+        self.assertEqual([len(chunk) for chunk in result], [2, 2, 1])
+        self.assertEqual([row['pk'] for chunk in result for row in chunk], [order.pk for order in self.orders])
+
+    def test_sends_and_logs_every_order(self):
+        sent = []
+
+        async def sender(reminder):
+            if reminder['order_id'] == str(self.orders[1].order_id):
+                raise ValueError("mailbox full")
+            sent.append(reminder['order_id'])
+
+        with self.assertLogs('crm.reminders', 'WARNING'):
+            self.assertEqual(self.run_reminders(sender), (4, 1))
+        self.assertEqual(sorted(sent), sorted(self.order_ids(self.orders[:1] + self.orders[2:])))
+        with open(self.log_file) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[1].endswith(" (send failed)"))
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+
+    def test_resumes_after_the_last_finished_chunk(self):
+        sent = []
+
+        async def crashing_sender(reminder):
+            if reminder['order_id'] == str(self.orders[2].order_id):
+                raise Crash
+            sent.append(reminder['order_id'])
+
+        async def sender(reminder):
+            sent.append(reminder['order_id'])
+
+        with self.assertRaises(Crash):
+            self.run_reminders(crashing_sender)
+        since, after = load_checkpoint(self.checkpoint_file)
+        self.assertEqual(after, (self.orders[1].order_date, self.orders[1].pk))
+
+        sent.clear()
+        # The window is the checkpointed one, not `days` back from now.
+        self.assertEqual(self.run_reminders(sender, days=0), (3, 0))
+        self.assertEqual(sent, self.order_ids(self.orders[2:]))
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+
+    def test_unreadable_checkpoint_starts_over(self):
+        with open(self.checkpoint_file, 'w') as f:
+            f.write('{"since": "yesterday"')
+        self.assertIsNone(load_checkpoint(self.checkpoint_file))
+        self.assertIsNone(load_checkpoint(self.checkpoint_file + '.missing'))
+
+
+class PhoneTests(CRMTestCase):
+    QUERY = '''
+        query ($exact: String, $prefix: String) {
+          allCustomers(phoneExact: $exact, phonePrefix: $prefix, orderBy: "name") { edges { node { name } } }
+        }
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        for name, phone in [('Ann', '555-123-4567'), ('Bob', '+15551230000'), ('Cid', '+442071234567'), ('Dot', None)]:
+            Customer.objects.create(name=name, email=f"{name.lower()}@example.com", phone=phone)
+
+    def names(self, **variables):
+        data = self.data(self.QUERY, variables=variables)
+        return [edge['node']['name'] for edge in data['allCustomers']['edges']]
+
+    def test_normalize_phone(self):
+        for raw, normalized in [
+            ('555-123-4567', '+15551234567'),
+            ('(555) 123-4567', '+15551234567'),
+            ('+15551234567', '+15551234567'),
+            (' +442071234567 ', '+442071234567'),
+            ('12', None),
+            ('', None),
+            (None, None),
+        ]:
+            with self.subTest(raw=raw):
+                self.assertEqual(normalize_phone(raw), normalized)
+
+    def test_prefix_range(self):
+        self.assertEqual(phone_prefix_range('+1 555'), ('+1555', '+1555:'))
+        self.assertIsNone(phone_prefix_range('+'))
+
+    def test_save_keeps_normalized_column_in_sync(self):
+        customer = Customer.objects.get(name='Ann')
+        self.assertEqual(customer.phone_normalized, '+15551234567')
+        customer.phone = '+442079999999'
+        customer.save(update_fields=['phone'])
+        customer.refresh_from_db()
+        self.assertEqual(customer.phone_normalized, '+442079999999')
+
+    def test_exact_matches_any_accepted_format(self):
+        self.assertEqual(self.names(exact='(555) 123-4567'), ['Ann'])
+        self.assertEqual(self.names(exact='+15551230000'), ['Bob'])
+        self.assertEqual(self.names(exact='not a phone'), [])
+
+    def test_prefix(self):
+        self.assertEqual(self.names(prefix='+1555123'), ['Ann', 'Bob'])
+        self.assertEqual(self.names(prefix='44'), ['Cid'])
+        self.assertEqual(self.names(prefix='+'), ['Ann', 'Bob', 'Cid', 'Dot'])
+
+
+class SearchTests(CRMTestCase):
+    QUERY = '''
+      query($query: String!, $first: Int) {
+        search(query: $query, first: $first) {
+          edges { rank node { ... on CustomerType { email } ... on ProductType { name } } }
+        }
+      }
+    '''
+
+    def search(self, query, first=None):
+        data = self.data(self.QUERY, variables={'query': query, 'first': first})
+        return [edge['node'].get('email') or edge['node']['name'] for edge in data['search']['edges']]
+
+    def test_name_matches_outrank_secondary_columns(self):
+        # bm25 needs a corpus where the term is rare, or every hit scores the same.
+        for i in range(8):
+            Customer.objects.create(name=f"Filler {i}", email=f"filler{i}@example.com")
+            Product.objects.create(name=f"Filler {i}", description="Nothing to see", price=Decimal("1.00"))
+        Customer.objects.create(name="Ada Byrne", email="lovelace@example.com")
+        Customer.objects.create(name="Lovelace Ng", email="ng@example.com")
+        Product.objects.create(name="Lovelace Lamp", description="Brass", price=Decimal("1.00"))
+        Product.objects.create(name="Widget", description="As used by Lovelace", price=Decimal("1.00"))
+        results = self.search("lovelace")
+        self.assertEqual(len(results), 4)
+        self.assertEqual(set(results[:2]), {"ng@example.com", "Lovelace Lamp"})
+        self.assertEqual(set(results[2:]), {"lovelace@example.com", "Widget"})
+
+    def test_every_term_must_match_as_a_prefix(self):
+        Customer.objects.create(name="Marguerite Dupont", email="md@example.com")
+        Customer.objects.create(name="Marguerite Okafor", email="mo@example.com")
+        self.assertEqual(set(self.search("marg")), {"md@example.com", "mo@example.com"})
+        self.assertEqual(self.search("marg dup"), ["md@example.com"])
+        self.assertEqual(self.search("argue"), [])
+
+    def test_updates_and_deletes_follow_the_row(self):
+        customer = Customer.objects.create(name="Odalys Brant", email="ob@example.com")
+        customer.name = "Odalys Finch"
+        customer.save()
+        self.assertEqual(self.search("finch"), ["ob@example.com"])
+        self.assertEqual(self.search("brant"), [])
+        customer.delete()
+        self.assertEqual(self.search("odalys"), [])
+
+    def test_pks_sharing_their_high_bits_are_both_indexed(self):
+        # 0005 keyed FTS rows on pk.int >> 65, so these two replaced each other.
+        high = uuid.uuid4().int >> 65 << 65
+        for low, email in ((1, "first@example.com"), (2, "second@example.com")):
+            Customer.objects.create(id=uuid.UUID(int=high | low), name="Twin Pike", email=email)
+        self.assertEqual(set(self.search("twin")), {"first@example.com", "second@example.com"})
+        Customer.objects.get(email="first@example.com").delete()
+        self.assertEqual(self.search("twin"), ["second@example.com"])
+
+    def test_rebuild_restores_the_index(self):
+        Customer.objects.create(name="Ines Rowe", email="ir@example.com")
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM crm_customer_fts")
+        self.assertEqual(self.search("ines"), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search("ines"), ["ir@example.com"])
+
+    def test_like_fallback(self):
+        Customer.objects.create(name="Tobias Lind", email="tl@example.com")
+        Product.objects.create(name="Lindenwood Desk", price=Decimal("90.00"))
+        Customer.objects.create(name="Tobias Marsh", email="tm@example.com")
+        with mock.patch('crm.search.BACKENDS', {}):
+            self.assertEqual(set(self.search("lind")), {"tl@example.com", "Lindenwood Desk"})
+            self.assertEqual(self.search("tob lind"), ["tl@example.com"])
+            self.assertEqual(len(self.search("tobias", first=1)), 1)
+
+
+class CustomerCounterTests(CRMTestCase):
+    CREATE_ORDERS = '''
+        mutation ($orders: [OrderInput!]!) { createOrders(orders: $orders) { errors { message } } }
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name="Counted", email="counted@example.com")
+        cls.other = Customer.objects.create(name="Other", email="other@example.com")
+        cls.cheap = Product.objects.create(name="Cheap", description="", price=Decimal('5.00'))
+        cls.dear = Product.objects.create(name="Dear", description="", price=Decimal('20.00'))
+
+    def order(self, customer, *products):
+        return {'customerUuid': str(customer.pk), 'productUuids': [str(product.pk) for product in products]}
+
+    def counters(self, customer):
+        customer.refresh_from_db()
+        return customer.order_count, customer.lifetime_value, customer.last_order_at
+
+    def last_order_date(self, customer):
+        return Order.objects.filter(customer_id=customer).latest('order_date').order_date
+
+    def test_create_order_increments(self):
+        self.data(
+            'mutation ($c: String!, $p: [String]!) { createOrder(customerUuid: $c, productUuids: $p) { success } }',
+            variables={'c': str(self.customer.pk), 'p': [str(self.cheap.pk), str(self.dear.pk)]},
+        )
+        self.assertEqual(self.counters(self.customer), (1, 25, self.last_order_date(self.customer)))
+
+    def test_create_orders_accumulates_per_customer(self):
+        self.data(self.CREATE_ORDERS, variables={'orders': [
+            self.order(self.customer, self.dear),
+            self.order(self.customer, self.cheap),
+            self.order(self.other, self.cheap),
+        ]})
+        self.assertEqual(self.counters(self.customer), (2, 25, self.last_order_date(self.customer)))
+        self.assertEqual(self.counters(self.other), (1, 5, self.last_order_date(self.other)))
+        self.assertFalse(stale_customers().exists())
+
+    def test_older_orders_keep_last_order_at(self):
+        late = datetime(2024, 6, 1, tzinfo=timezone.utc)
+        record_orders([Order(customer_id=self.customer, order_date=late, total_amount=7)])
+        record_orders([Order(customer_id=self.customer, order_date=datetime(2024, 1, 1, tzinfo=timezone.utc), total_amount=3)])
+        self.assertEqual(self.counters(self.customer), (2, 10, late))
+
+    def test_failed_batch_leaves_counters_alone(self):
+        with mock.patch.object(type(Order.objects), 'bulk_create', side_effect=IntegrityError):
+            self.data(self.CREATE_ORDERS, variables={'orders': [self.order(self.customer, self.dear)]})
+        self.assertEqual(self.counters(self.customer), (0, 0, None))
+
+    def test_deleting_orders_decrements(self):
+        self.data(self.CREATE_ORDERS, variables={'orders': [self.order(self.customer, self.cheap)]})
+        kept = self.last_order_date(self.customer)
+        self.data(self.CREATE_ORDERS, variables={'orders': [self.order(self.customer, self.dear)]})
+
+        Order.objects.get(customer_id=self.customer, total_amount=20).delete()
+        self.assertEqual(self.counters(self.customer), (1, 5, kept))
+        Order.objects.filter(customer_id=self.customer).delete()
+        self.assertEqual(self.counters(self.customer), (0, 0, None))
+        self.assertFalse(stale_customers().exists())
+
+    def test_deleting_a_customer_cascades_cleanly(self):
+        self.data(self.CREATE_ORDERS, variables={'orders': [self.order(self.customer, self.cheap)] * 2})
+        self.customer.delete()
+        self.assertFalse(Order.objects.exists())
+
+    def test_out_of_band_writes_are_reconciled(self):
+        self.data(self.CREATE_ORDERS, variables={'orders': [self.order(self.customer, self.cheap)]})
+        # A queryset update sends no signal, so the counters drift.
+        Order.objects.filter(customer_id=self.customer).update(total_amount=50)
+        self.assertEqual(list(stale_customers()), [self.customer])
+
+        out = StringIO()
+        call_command('reconcile_customer_counters', '--check', stdout=out)
+        self.assertTrue(out.getvalue().startswith("1 customers out of sync"))
+
+        call_command('reconcile_customer_counters', '--stale-only', stdout=StringIO())
+        self.assertEqual(self.counters(self.customer)[:2], (1, 50))
+        self.assertEqual(self.counters(self.other), (0, 0, None))
+        self.assertFalse(stale_customers().exists())
+
+
+class ImportTests(CRMTestCase):
+    CUSTOMERS_CSV = (
+        "name,email,phone,address\n"
+        "Ann,ann@example.com,555-123-4567,1 Road\n"
+        "Bob,not-an-email,,\n"
+        ",nameless@example.com,,\n"
+        "Cid,cid@example.com,12,\n"
+        "Ann again,ann@example.com,,\n"
+        "Old,old@example.com,+442071234567,New address\n"
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.old = Customer.objects.create(name="Old name", email="old@example.com")
+
+    def run_import(self, importer_class, text, format='csv', **options):
+        errors = StringIO()
+        importer = importer_class(on_error=ErrorFile(errors), **options)
+        rows = read_rows(StringIO(text), format, importer.required_columns)
+        summary = importer.run(rows)
+        errors.seek(0)
+        return summary, list(csv.DictReader(errors))
+
+    def test_rejected_rows_are_reported_by_line(self):
+        summary, errors = self.run_import(CustomerImporter, self.CUSTOMERS_CSV)
+        self.assertEqual((summary['rows'], summary['created'], summary['updated'], summary['failed']), (6, 1, 0, 5))
+        self.assertEqual(
+            [(error['line'], error['field']) for error in errors],
+            [('3', 'email'), ('4', 'name'), ('5', 'phone'), ('6', 'email'), ('7', 'email')],
+        )
+        self.assertEqual(json.loads(errors[0]['row'])['email'], 'not-an-email')
+        self.assertEqual(errors[-1]['message'], "Email already exists.")
+        ann = Customer.objects.get(email='ann@example.com')
+        self.assertEqual((ann.name, ann.phone_normalized, ann.address), ('Ann', '+15551234567', '1 Road'))
+        self.old.refresh_from_db()
+        self.assertEqual(self.old.name, "Old name")
+
+    def test_upsert_updates_by_email(self):
+        summary, errors = self.run_import(CustomerImporter, self.CUSTOMERS_CSV, upsert=True, batch_size=2)
+        # "Ann again" lands in a later batch than Ann, so it updates her.
+        self.assertEqual((summary['created'], summary['updated'], summary['failed']), (1, 2, 3))
+        self.assertEqual(Customer.objects.get(email='ann@example.com').name, "Ann again")
+        self.old.refresh_from_db()
+        self.assertEqual(
+            (self.old.name, self.old.phone_normalized, self.old.address),
+            ('Old', '+442071234567', 'New address'),
+        )
+        self.assertEqual(Customer.objects.filter(email='old@example.com').count(), 1)
+
+    def test_products_ndjson(self):
+        existing = Product.objects.create(name="Existing", description="", price=Decimal('1.00'), stock=1)
+        text = "\n".join([
+            json.dumps({'name': "New", 'price': "2.50", 'stock': 4}),
+            json.dumps({'product_id': str(existing.pk), 'name': "Renamed", 'price': "3", 'stock': 9}),
+            '{"name": "Broken"',
+            json.dumps({'name': "Free", 'price': "0"}),
+            json.dumps(["not", "an", "object"]),
+            "",
+        ])
+        summary, errors = self.run_import(ProductImporter, text, format='ndjson', upsert=True)
+        self.assertEqual((summary['created'], summary['updated'], summary['failed']), (1, 1, 3))
+        self.assertEqual([(error['line'], error['field']) for error in errors], [('3', '__all__'), ('4', 'price'), ('5', '__all__')])
+        existing.refresh_from_db()
+        self.assertEqual((existing.name, existing.price, existing.stock), ("Renamed", Decimal('3.00'), 9))
+        new = Product.objects.get(name="New")
+        self.assertEqual((new.price, new.stock), (Decimal('2.50'), 4))
+
+    def test_emails_match_regardless_of_case(self):
+        text = "name,email\nNew,NEW@example.com\nAgain,new@example.com\nOld,OLD@Example.com\n"
+        summary, errors = self.run_import(CustomerImporter, text, upsert=True)
+        self.assertEqual((summary['created'], summary['updated'], summary['failed']), (1, 1, 1))
+        self.assertEqual(errors[0]['message'], "Email appears more than once in this file.")
+        self.old.refresh_from_db()
+        self.assertEqual(self.old.name, "Old")
+
+    def test_missing_columns_fail_the_import(self):
+        with self.assertRaises(ImportFormatError):
+            self.run_import(CustomerImporter, "name,phone\nAnn,\n")
+
+    def test_endpoint_needs_staff_token(self):
+        staff = User.objects.create_user(username='staff', email='staff@example.com', password='x', is_staff=True)
+        response = self.client.post('/import/customers/', self.CUSTOMERS_CSV, content_type='text/csv')
+        self.assertEqual(response.status_code, 403)
+
+        response = self.client.post(
+            '/import/customers/?upsert=1', self.CUSTOMERS_CSV, content_type='text/csv',
+            HTTP_AUTHORIZATION=f"JWT {get_token(staff)}",
+        )
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['created'], body['updated'], body['failed']), (1, 1, 4))
+        self.assertEqual(len(body['errors']), 4)
+
+
+class ExportTests(CRMTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers, cls.products, cls.orders = make_orders(customers=2, products=3, orders_per_customer=2)
+        cls.empty = Order.objects.create(customer_id=cls.customers[0], quantity=1, total_amount=5)
+        cls.staff = User.objects.create_user(username='staff', email='staff@example.com', password='x', is_staff=True)
+
+    def export(self, filters=None, format='ndjson', chunk_size=exports.DEFAULT_CHUNK_SIZE):
+        return list(exports.stream_orders(filters or {}, format, chunk_size))
+
+    def test_ndjson_streams_one_chunk_at_a_time(self):
+        with self.assertNumQueries(0):
+            content = exports.stream_orders({}, 'ndjson', chunk_size=2)
+        # The order rows in one query, then one query per chunk for their products.
+        with self.assertNumQueries(1 + 3):
+            chunks = list(content)
+        self.assertEqual([chunk.count("\n") for chunk in chunks], [2, 2, 1])
+        records = [json.loads(line) for line in "".join(chunks).splitlines()]
+        self.assertEqual([record['order_id'] for record in records], [str(order.order_id) for order in [*self.orders, self.empty]])
+        first = records[0]
+        self.assertEqual(first['customer'], {'id': str(self.customers[0].pk), 'name': "Customer 0", 'email': "customer0@example.com"})
+        self.assertEqual(
+            [(product['name'], product['price']) for product in first['products']],
+            [("Product 0", "10.00"), ("Product 1", "20.00")],
+        )
+        self.assertEqual(records[-1]['products'], [])
+
+    def test_csv_has_a_row_per_order_line(self):
+        chunks = self.export(format='csv', chunk_size=3)
+        self.assertEqual(chunks[0], ",".join(exports.CSV_COLUMNS) + "\r\n")
+        rows = list(csv.DictReader(StringIO("".join(chunks))))
+        self.assertEqual(len(rows), 4 * 2 + 1)
+        self.assertEqual(
+            [(row['order_id'], row['product_name']) for row in rows[:2]],
+            [(str(self.orders[0].order_id), "Product 0"), (str(self.orders[0].order_id), "Product 1")],
+        )
+        self.assertEqual((rows[-1]['order_id'], rows[-1]['product_id'], rows[-1]['total_amount']), (str(self.empty.order_id), '', '5'))
+
+    def test_filters(self):
+        records = [json.loads(line) for line in "".join(self.export({'customer_name': "customer 1"})).splitlines()]
+        self.assertEqual({record['customer']['name'] for record in records}, {"Customer 1"})
+        self.assertEqual(len(records), 2)
+        # Both products of an order match, but the order is exported once.
+        records = "".join(self.export({'product_name': "product"})).splitlines()
+        self.assertEqual(len(records), 4)
+        with self.assertRaises(exports.ExportFilterError) as raised:
+            self.export({'total_amount__gte': "lots"})
+        self.assertIn('total_amount__gte', raised.exception.errors)
+        with self.assertRaises(ValueError):
+            self.export(format='xml')
+
+    def test_endpoint_needs_staff_token(self):
+        member = User.objects.create_user(username='member', email='member@example.com', password='x')
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get('/export/orders/').status_code, 403)
+        self.client.logout()
+        response = self.client.get('/export/orders/', HTTP_AUTHORIZATION=f"JWT {get_token(member)}")
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get('/export/orders/', HTTP_AUTHORIZATION="JWT not-a-token")
+        self.assertEqual(response.status_code, 401)
+
+    def test_endpoint_streams_the_export(self):
+        auth = {'HTTP_AUTHORIZATION': f"JWT {get_token(self.staff)}"}
+        response = self.client.get('/export/orders/?format=csv&chunk_size=2&customer_name=customer 0', **auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="orders.csv"')
+        rows = list(csv.DictReader(StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual({row['customer_name'] for row in rows}, {"Customer 0"})
+        self.assertEqual(len(rows), 2 * 2 + 1)
+
+        response = self.client.get('/export/orders/', **auth)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 5)
+
+        for query in ('?format=xml', '?chunk_size=0', '?chunk_size=many', '?total_amount__gte=lots'):
+            self.assertEqual(self.client.get(f'/export/orders/{query}', **auth).status_code, 400, query)
+
+
+class TokenUserCacheTests(CRMTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='jwt', email='jwt@example.com', password='x')
+
+    def setUp(self):
+        super().setUp()
+        token_user_cache.clear()
+        self.addCleanup(token_user_cache.clear)
+        self.token = get_token(self.user)
+
+    def authorized(self, query):
+        return self.query(query, headers={'Authorization': f"JWT {self.token}"})
+
+    def assertForgotten(self, forget):
+        get_user_by_token(self.token)
+        with self.captureOnCommitCallbacks() as callbacks:
+            forget()
+        self.assertIsNotNone(token_user_cache.get(self.token), "dropped before commit")
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(token_user_cache.get(self.token))
+
+    def test_repeat_requests_skip_the_user_query(self):
+        with self.assertNumQueries(1):
+            self.assertResponseNoErrors(self.authorized('query { hello }'))
+        with self.assertNumQueries(0):
+            self.assertResponseNoErrors(self.authorized('query { hello }'))
+        self.assertEqual(token_user_cache.stats()['hits'], 1)
+
+    def test_cached_user_is_a_copy(self):
+        user = get_user_by_token(self.token)
+        user.first_name = "Changed"
+        self.assertEqual(get_user_by_token(self.token).first_name, "")
+
+    def test_invalid_token_is_rejected(self):
+        self.token = "not-a-token"
+        self.assertResponseHasErrors(self.authorized('query { hello }'))
+        self.assertEqual(token_user_cache.stats()['size'], 0)
+
+    def test_user_save_forgets_tokens(self):
+        self.assertForgotten(lambda: self.user.save())
+
+    def test_logout_forgets_tokens(self):
+        self.assertForgotten(lambda: user_logged_out.send(sender=User, request=None, user=self.user))
+
+    def test_refresh_token_revoke_forgets_tokens(self):
+        refresh_token = create_refresh_token(self.user)
+        self.assertForgotten(refresh_token.revoke)
+
+    def test_other_users_stay_cached(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='x')
+        other_token = get_token(other)
+        get_user_by_token(other_token)
+        self.assertForgotten(lambda: self.user.save())
+        self.assertEqual(token_user_cache.get(other_token).pk, other.pk)
+
+
+class OrderingTests(CRMTestCase):
+    QUERY = 'query ($orderBy: [String]) { allCustomers(orderBy: $orderBy) { edges { node { name } } } }'
+
+    @classmethod
+    def setUpTestData(cls):
+        for name, count in [('Bea', 2), ('Ann', 2), ('Cid', 5)]:
+            Customer.objects.create(name=name, email=f"{name}@example.com", order_count=count)
+
+    def names(self, order_by):
+        data = self.data(self.QUERY, variables={'orderBy': order_by})
+        return [edge['node']['name'] for edge in data['allCustomers']['edges']]
+
+    def test_order_by_takes_a_list(self):
+        self.assertEqual(self.names(['-orderCount', 'name']), ['Cid', 'Ann', 'Bea'])
+        self.assertEqual(self.names(['orderCount', '-name']), ['Bea', 'Ann', 'Cid'])
+
+    def test_single_key_still_accepted(self):
+        response = self.query('query { allCustomers(orderBy: "-name") { edges { node { name } } } }')
+        self.assertResponseNoErrors(response)
+        self.assertEqual([e['node']['name'] for e in response.json()['data']['allCustomers']['edges']], ['Cid', 'Bea', 'Ann'])
+
+    def test_unknown_key_is_rejected(self):
+        self.assertResponseHasErrors(self.query(self.QUERY, variables={'orderBy': ['password']}))
+
+
+class AsyncViewTests(CRMTestCase):
+    ASYNC_URL = '/graphql/async/'
+    ORDERS = '''
+        query ($first: Int, $last: Int, $after: String, $before: String) {
+          allOrders(first: $first, last: $last, after: $after, before: $before) {
+            edges { cursor node { totalAmount customerId { name } productIds { edges { node { name } } } } }
+            pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+          }
+        }
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        make_orders(customers=4, orders_per_customer=3)
+
+    def async_post(self, query, variables=None):
+        # Driven from sync code so assertNumQueries sees the thread the async
+        # ORM runs its queries on.
+        return async_to_sync(self.async_client.post)(
+            self.ASYNC_URL, json.dumps({'query': query, 'variables': variables}), content_type='application/json',
+        )
+
+    def async_data(self, query, variables=None):
+        response = self.async_post(query, variables)
+        self.assertResponseNoErrors(response)
+        return response.json()['data']
+
+    def test_nested_relations_are_batched(self):
+        # count, orders joined to their customers, products of all orders.
+        with self.assertNumQueries(3):
+            data = self.async_data(self.ORDERS, {'first': 12})
+        edges = data['allOrders']['edges']
+        self.assertEqual(len(edges), 12)
+        self.assertTrue(all(edge['node']['customerId']['name'] for edge in edges))
+        self.assertTrue(all(len(edge['node']['productIds']['edges']) == 2 for edge in edges))
+
+    def test_loaders_batch_per_tick(self):
+        query = '''
+            query {
+              allCustomers(first: 4) { edges { node {
+                orderSet { edges { node { productIds { edges { node { name } } } } } }
+              } } }
+            }
+        '''
+        # count, customers, one orderSet batch, one productIds batch.
+        with self.assertNumQueries(4):
+            data = self.async_data(query)
+        self.assertEqual(data, self.data(query))
+
+    def test_pagination_matches_the_sync_view(self):
+        first = self.async_data(self.ORDERS, {'first': 5})
+        cursor = first['allOrders']['pageInfo']['endCursor']
+        pages = [
+            {'first': 5},
+            {'first': 5, 'after': cursor},
+            {'last': 3, 'before': cursor},
+            {'first': 50, 'after': cursor},
+            {'last': 4},
+        ]
+        for variables in pages:
+            with self.subTest(**variables):
+                expected = self.data(self.ORDERS, variables=variables)
+                self.assertEqual(self.async_data(self.ORDERS, variables), expected)
+
+    def test_root_fields_and_aggregates(self):
+        query = '''
+            query {
+              orderStats { count totalRevenue }
+              allCustomers(first: 2) { edges { node { name orderSet { edges { node { totalAmount } } } } } }
+              allProducts(first: 1) { edges { node { name } } }
+            }
+        '''
+        expected = self.data(query)
+        self.assertEqual(self.async_data(query), expected)
+        self.assertEqual(expected['orderStats']['count'], 12)
+
+    def test_mutation(self):
+        data = self.async_data(
+            'mutation { createProduct(name: "Async", price: 4, stock: 2) { success product { name stock } } }'
+        )
+        self.assertEqual(data['createProduct'], {'success': True, 'product': {'name': 'Async', 'stock': 2}})
+        self.assertTrue(Product.objects.filter(name="Async").exists())
+
+    def test_field_errors_are_reported(self):
+        self.assertResponseHasErrors(self.async_post('{ allOrders(first: -1) { edges { cursor } } }'))
+
+
+class DocumentCacheTests(TestCase):
+    def test_least_recently_used_is_evicted(self):
+        cache = DocumentCache(maxsize=2)
+        cache.set('a', 'A')
+        cache.set('b', 'B')
+        self.assertEqual(cache.get('a'), 'A')
+        cache.set('c', 'C')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), ('A', 'C'))
+        self.assertEqual(cache.stats(), {'size': 2, 'maxsize': 2, 'hits': 3, 'misses': 1, 'hit_ratio': 0.75})
+
+    def test_clear(self):
+        cache = DocumentCache()
+        cache.set('a', 'A')
+        cache.get('a')
+        cache.clear()
+        self.assertEqual((cache.get('a'), cache.stats()['hits']), (None, 0))
+
+
+class PersistedQueryTests(CRMTestCase):
+    QUERY = 'query { hello }'
+
+    def setUp(self):
+        super().setUp()
+        document_cache = CachedGraphQLView.document_cache
+        self.addCleanup(document_cache.clear)
+        document_cache.clear()
+
+    def post(self, body):
+        return self.client.post(self.GRAPHQL_URL, json.dumps(body), content_type='application/json')
+
+    def persisted(self, sha256, **body):
+        return self.post({**body, 'extensions': {'persistedQuery': {'version': 1, 'sha256Hash': sha256}}})
+
+    def test_miss_register_hit(self):
+        sha256 = document_hash(self.QUERY)
+        miss = self.persisted(sha256).json()
+        self.assertEqual(miss['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_FOUND')
+
+        registered = self.persisted(sha256, query=self.QUERY)
+        self.assertResponseNoErrors(registered)
+
+        hit = self.persisted(sha256)
+        self.assertResponseNoErrors(hit)
+        self.assertEqual(hit.json()['data'], {'hello': "Hello, GraphQL!"})
+
+    def test_get_with_extensions_in_the_query_string(self):
+        sha256 = document_hash(self.QUERY)
+        self.persisted(sha256, query=self.QUERY)
+        extensions = json.dumps({'persistedQuery': {'version': 1, 'sha256Hash': sha256}})
+        response = self.client.get(self.GRAPHQL_URL, {'extensions': extensions}, HTTP_ACCEPT='application/json')
+        self.assertResponseNoErrors(response)
+
+    def test_hash_must_match_the_query(self):
+        response = self.persisted('0' * 64, query=self.QUERY)
+        self.assertResponseHasErrors(response)
+        self.assertEqual(response.json()['errors'][0]['message'], "provided sha does not match query")
+
+    def test_invalid_documents_are_not_registered(self):
+        query = 'query { nope }'
+        self.assertResponseHasErrors(self.persisted(document_hash(query), query=query))
+        miss = self.persisted(document_hash(query)).json()
+        self.assertEqual(miss['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_FOUND')
+
+    def test_malformed_extensions_are_rejected(self):
+        for extensions in ["x", "[1]", ["x"], 7, {'persistedQuery': "abc"}, {'persistedQuery': {'sha256Hash': 1}}]:
+            with self.subTest(extensions=extensions):
+                response = self.post({'query': self.QUERY, 'extensions': extensions})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('errors', response.json())
+
+    def test_repeat_queries_skip_parsing(self):
+        with mock.patch('crm.views.parse', wraps=parse) as parse_mock:
+            for _ in range(3):
+                self.assertResponseNoErrors(self.query(self.QUERY))
+        self.assertEqual(parse_mock.call_count, 1)
+
+
+@override_settings(DEBUG=False, GRAPHQL_TRACING={'HEADER': 'X-GraphQL-Trace', 'SAMPLE_RATE': 0.0})
+class TracingTests(CRMTestCase):
+    ASYNC_URL = '/graphql/async/'
+    QUERY = 'query { allCustomers(first: 1) { edges { node { name } } } }'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='staff', email='staff@example.com', password='x', is_staff=True)
+        cls.member = User.objects.create_user(username='member', email='member@example.com', password='x')
+
+    def setUp(self):
+        super().setUp()
+        token_user_cache.clear()
+
+    def traced(self, user=None, url=None, **headers):
+        headers = {'X-GraphQL-Trace': '1', **headers}
+        if user is not None:
+            headers['Authorization'] = f"JWT {get_token(user)}"
+        post = async_to_sync(self.async_client.post) if url == self.ASYNC_URL else self.client.post
+        response = post(
+            url or self.GRAPHQL_URL, json.dumps({'query': self.QUERY}), content_type='application/json', headers=headers,
+        )
+        self.assertResponseNoErrors(response)
+        return response.json().get('extensions', {}).get('tracing')
+
+    def test_staff_jwt_gets_the_trace(self):
+        tracing = self.traced(self.staff)
+        self.assertIsNotNone(tracing)
+        self.assertIn('allCustomers', [field['path'] for field in tracing['fields']])
+
+    def test_staff_jwt_on_the_async_view(self):
+        self.assertIsNotNone(self.traced(self.staff, url=self.ASYNC_URL))
+
+    def test_other_users_do_not(self):
+        self.assertIsNone(self.traced(self.member))
+        self.assertIsNone(self.traced())
+        self.assertIsNone(self.traced(self.member, url=self.ASYNC_URL))
+
+    def test_staff_session_gets_the_trace(self):
+        self.client.force_login(self.staff)
+        self.assertIsNotNone(self.traced())
+
+    def test_token_is_verified_once(self):
+        with mock.patch('crm.auth.get_payload', wraps=get_payload) as payload:
+            self.traced(self.staff)
+        self.assertEqual(payload.call_count, 1)
+
+
+class WebSocketSession:
+    """Drives the ASGI WebSocket app in-process, one JSON message at a time."""
+
+    def __init__(self, subprotocols=(SUBPROTOCOL,)):
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+        scope = {'type': 'websocket', 'path': '/graphql/', 'subprotocols': list(subprotocols)}
+        self.task = asyncio.create_task(GraphQLWebSocketApp(schema)(scope, self.incoming.get, self.outgoing.put))
+
+    async def event(self):
+        return await asyncio.wait_for(self.outgoing.get(), 5)
+
+    async def send(self, message):
+        await self.incoming.put({'type': 'websocket.receive', 'text': json.dumps(message)})
+
+    async def receive(self):
+        event = await self.event()
+        if event['type'] != 'websocket.send':
+            raise AssertionError(f"Expected a message, got {event}")
+        return json.loads(event['text'])
+
+    async def connect(self, **payload):
+        await self.incoming.put({'type': 'websocket.connect'})
+        accept = await self.event()
+        await self.send({'type': 'connection_init', 'payload': payload})
+        return accept, await self.receive()
+
+    async def disconnect(self):
+        await self.incoming.put({'type': 'websocket.disconnect'})
+        await asyncio.wait_for(self.task, 5)
+
+
+async def wait_for_subscribers(channel, count=1):
+    """Subscribing happens in a task of its own; wait until it is registered."""
+    async with asyncio.timeout(5):
+        while len(get_pubsub()._subscribers.get(channel, ())) != count:
+            await asyncio.sleep(0.01)
+
+
+class SubscriptionTests(CRMTestCase):
+    ORDER_CREATED = 'subscription { orderCreated { totalAmount customerId { name } } }'
+
+    @classmethod
+    def setUpTestData(cls):
+        make_orders(customers=1, products=1, orders_per_customer=1)
+        cls.order = Order.objects.get()
+
+    def test_tests_default_to_the_in_memory_backend(self):
+        self.assertEqual(django_settings.GRAPHQL_PUBSUB['BACKEND'], 'crm.pubsub.InMemoryPubSub')
+
+    async def test_handshake(self):
+        session = WebSocketSession()
+        accept, ack = await session.connect()
+        self.assertEqual(accept, {'type': 'websocket.accept', 'subprotocol': SUBPROTOCOL})
+        self.assertEqual(ack, {'type': 'connection_ack'})
+        await session.send({'type': 'ping'})
+        self.assertEqual(await session.receive(), {'type': 'pong'})
+        await session.send({'type': 'connection_init'})
+        self.assertEqual(await session.event(), {'type': 'websocket.close', 'code': 4429})
+
+    async def test_other_subprotocols_are_refused(self):
+        session = WebSocketSession(subprotocols=['graphql-ws'])
+        await session.incoming.put({'type': 'websocket.connect'})
+        self.assertEqual(await session.event(), {'type': 'websocket.close', 'code': 4406})
+
+    async def test_messages_before_init_close_the_socket(self):
+        session = WebSocketSession()
+        await session.incoming.put({'type': 'websocket.connect'})
+        await session.event()
+        await session.send({'type': 'subscribe', 'id': '1', 'payload': {'query': self.ORDER_CREATED}})
+        self.assertEqual(await session.event(), {'type': 'websocket.close', 'code': 4401})
+
+    async def test_bad_token_is_forbidden(self):
+        session = WebSocketSession()
+        await session.incoming.put({'type': 'websocket.connect'})
+        await session.event()
+        await session.send({'type': 'connection_init', 'payload': {'Authorization': "JWT not-a-token"}})
+        self.assertEqual(await session.event(), {'type': 'websocket.close', 'code': 4403})
+
+    async def test_subscribe_next_complete(self):
+        session = WebSocketSession()
+        await session.connect()
+        await session.send({'type': 'subscribe', 'id': 'a', 'payload': {'query': self.ORDER_CREATED}})
+        await wait_for_subscribers(events.ORDER_CREATED)
+
+        get_pubsub().publish(events.ORDER_CREATED, {'ids': [self.order.pk]})
+        message = await session.receive()
+        self.assertEqual(message['type'], 'next')
+        self.assertEqual(message['id'], 'a')
+        self.assertEqual(message['payload']['data']['orderCreated']['customerId']['name'], "Customer 0")
+
+        await session.send({'type': 'complete', 'id': 'a'})
+        await wait_for_subscribers(events.ORDER_CREATED, 0)
+        await session.disconnect()
+
+    async def test_duplicate_ids_close_the_socket(self):
+        session = WebSocketSession()
+        await session.connect()
+        await session.send({'type': 'subscribe', 'id': 'a', 'payload': {'query': self.ORDER_CREATED}})
+        await session.send({'type': 'subscribe', 'id': 'a', 'payload': {'query': self.ORDER_CREATED}})
+        self.assertEqual(await session.event(), {'type': 'websocket.close', 'code': 4409})
+        await wait_for_subscribers(events.ORDER_CREATED, 0)
+
+    async def test_queries_stay_on_http(self):
+        session = WebSocketSession()
+        await session.connect()
+        await session.send({'type': 'subscribe', 'id': 'q', 'payload': {'query': '{ hello }'}})
+        self.assertEqual(await session.receive(), {'type': 'error', 'id': 'q', 'payload': [
+            {'message': "Only subscription operations are served over WebSocket."},
+        ]})
+        await session.disconnect()
+
+    def test_mutations_publish_on_commit(self):
+        with mock.patch.object(get_pubsub(), 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.data('mutation { createCustomer(name: "Wren", email: "wren@example.com") { customer { id } } }')
+        [(channel, message)] = [call.args for call in publish.call_args_list]
+        self.assertEqual(channel, events.CUSTOMER_CREATED)
+        self.assertEqual(message, {'ids': [str(Customer.objects.get(email="wren@example.com").pk)]})
+
+
+class InMemoryPubSubTests(SimpleTestCase):
+    async def test_fan_out(self):
+        pubsub = InMemoryPubSub()
+        first, second, other = pubsub.subscribe('a'), pubsub.subscribe('a'), pubsub.subscribe('b')
+        pending = [asyncio.ensure_future(anext(subscriber)) for subscriber in (first, second, other)]
+        async with asyncio.timeout(5):
+            while len(pubsub._subscribers['a']) < 2 or not pubsub._subscribers['b']:
+                await asyncio.sleep(0)
+
+        pubsub.publish('a', {'n': 1})
+        self.assertEqual(await asyncio.wait_for(pending[0], 5), {'n': 1})
+        self.assertEqual(await asyncio.wait_for(pending[1], 5), {'n': 1})
+        self.assertFalse(pending[2].done())
+
+        pending[2].cancel()
+        await asyncio.gather(pending[2], return_exceptions=True)
+        for subscriber in (first, second, other):
+            await subscriber.aclose()
+        self.assertEqual(dict(pubsub._subscribers), {})
+
+    async def test_full_queue_drops_the_oldest_message(self):
+        pubsub = InMemoryPubSub()
+        subscriber = pubsub.subscribe('a')
+        with mock.patch('crm.pubsub.SUBSCRIBER_QUEUE_SIZE', 2):
+            pending = asyncio.ensure_future(anext(subscriber))
+            async with asyncio.timeout(5):
+                while not pubsub._subscribers['a']:
+                    await asyncio.sleep(0)
+        pubsub.publish('a', 1)
+        self.assertEqual(await asyncio.wait_for(pending, 5), 1)
+
+        # Nobody is reading: 2 is pushed out by 4.
+        with self.assertLogs('crm.pubsub', 'WARNING'):
+            for n in (2, 3, 4):
+                pubsub.publish('a', n)
+            await asyncio.sleep(0)
+        self.assertEqual([await anext(subscriber), await anext(subscriber)], [3, 4])
+        await subscriber.aclose()
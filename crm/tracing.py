@@ -0,0 +1,207 @@
+import contextvars
+import inspect
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.utils import get_http_authorization
+
+logger = logging.getLogger(__name__)
+
+# The resolver currently running, so SQL issued under it is charged to it.
+_current_field = contextvars.ContextVar('graphql_trace_field', default=None)
+
+
+def tracing_settings():
+    return {
+        'HEADER': 'X-GraphQL-Trace',
+        'SAMPLE_RATE': 0.0,
+        'LOG_TOP_FIELDS': 10,
+        **getattr(settings, 'GRAPHQL_TRACING', {}),
+    }
+
+
+class FieldTrace:
+    __slots__ = ('path', 'parent_type', 'field_name', 'start', 'duration', 'sql_count', 'sql_duration')
+
+    def __init__(self, path, parent_type, field_name, start):
+        self.path = path
+        self.parent_type = parent_type
+        self.field_name = field_name
+        self.start = start
+        self.duration = 0
+        self.sql_count = 0
+        self.sql_duration = 0
+
+    def as_dict(self, origin):
+        return {
+            'path': self.path,
+            'parentType': self.parent_type,
+            'fieldName': self.field_name,
+            'startOffset': self.start - origin,
+            'duration': self.duration,
+            'sqlCount': self.sql_count,
+            'sqlDuration': self.sql_duration,
+        }
+
+
+class Tracer:
+    """Timings for one GraphQL operation: phases, resolvers and the SQL under them.
+
+    All durations are in nanoseconds, as in Apollo tracing. `expose` decides
+    whether the report goes into `extensions.tracing` (debug header) or to
+    the log (sampled requests).
+    """
+
+    def __init__(self, expose):
+        self.expose = expose
+        self.start = time.perf_counter_ns()
+        self.phases = {}
+        self.fields = []
+        self.sql_count = 0
+        self.sql_duration = 0
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter_ns() - started
+
+    def start_field(self, info):
+        field = FieldTrace(
+            list(info.path.as_list()), str(info.parent_type), info.field_name, time.perf_counter_ns()
+        )
+        self.fields.append(field)
+        return field
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        """`connection.execute_wrapper` hook charging each query to the running resolver."""
+        started = time.perf_counter_ns()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter_ns() - started
+            self.sql_count += 1
+            self.sql_duration += elapsed
+            field = _current_field.get()
+            if field is not None:
+                field.sql_count += 1
+                field.sql_duration += elapsed
+
+    def by_field(self):
+        """Resolver stats grouped by path with list indexes removed, slowest first.
+
+        An N+1 shows up as one entry with a high `count` and a matching `sqlCount`.
+        """
+        groups = {}
+        for field in self.fields:
+            key = ".".join(str(part) for part in field.path if not isinstance(part, int))
+            group = groups.setdefault(key, {'path': key, 'count': 0, 'duration': 0, 'sqlCount': 0, 'sqlDuration': 0})
+            group['count'] += 1
+            group['duration'] += field.duration
+            group['sqlCount'] += field.sql_count
+            group['sqlDuration'] += field.sql_duration
+        return sorted(groups.values(), key=lambda group: group['duration'], reverse=True)
+
+    def report(self):
+        end = time.perf_counter_ns()
+        return {
+            'version': 1,
+            'duration': end - self.start,
+            'phases': dict(self.phases),
+            'sql': {'count': self.sql_count, 'duration': self.sql_duration},
+            'fields': self.by_field(),
+            'resolvers': [field.as_dict(self.start) for field in self.fields],
+        }
+
+    def log(self, operation_name=None):
+        report = self.report()
+        logger.info(
+            "graphql trace %s",
+            json.dumps({
+                'operation': operation_name,
+                'duration_ms': report['duration'] / 1e6,
+                'phases_ms': {name: duration / 1e6 for name, duration in report['phases'].items()},
+                'sql': report['sql'],
+                'fields': report['fields'][:tracing_settings()['LOG_TOP_FIELDS']],
+            }),
+        )
+
+
+def _request_user(request):
+    """The user the operation will run as: the session user, else the JWT's.
+
+    Tracing starts before graphql_jwt's middleware has looked at the token,
+    so it is authenticated here the way the middleware will; the backend
+    memoizes the outcome on the request, so it is only verified once.
+    """
+    user = getattr(request, 'user', None)
+    if (user is None or user.is_anonymous) and get_http_authorization(request) is not None:
+        try:
+            return authenticate(request=request)
+        except JSONWebTokenError:
+            return None
+    return user
+
+
+def start_tracing(request):
+    """Return a Tracer if this request should be traced, else None.
+
+    The debug header exposes the trace in the response, but only to staff
+    users (by session or JWT) or with DEBUG on; other requests are traced at
+    SAMPLE_RATE and logged.
+    """
+    config = tracing_settings()
+    header = 'HTTP_' + config['HEADER'].upper().replace('-', '_')
+    if request.META.get(header):
+        user = _request_user(request)
+        if settings.DEBUG or (user is not None and user.is_staff):
+            return Tracer(expose=True)
+    if config['SAMPLE_RATE'] and random.random() < config['SAMPLE_RATE']:
+        return Tracer(expose=False)
+    return None
+
+
+def get_tracer(context):
+    return getattr(context, 'graphql_tracer', None)
+
+
+def trace_phase(context, name):
+    tracer = get_tracer(context)
+    return tracer.phase(name) if tracer is not None else nullcontext()
+
+
+class TracingMiddleware:
+    """Graphene middleware timing every resolver of a traced request."""
+
+    def resolve(self, next, root, info, **kwargs):
+        tracer = get_tracer(info.context)
+        if tracer is None:
+            return next(root, info, **kwargs)
+
+        field = tracer.start_field(info)
+        token = _current_field.set(field)
+        try:
+            result = next(root, info, **kwargs)
+        finally:
+            _current_field.reset(token)
+            field.duration = time.perf_counter_ns() - field.start
+
+        if inspect.isawaitable(result):
+            return self._resolve_async(field, result)
+        return result
+
+    async def _resolve_async(self, field, result):
+        token = _current_field.set(field)
+        try:
+            return await result
+        finally:
+            _current_field.reset(token)
+            field.duration = time.perf_counter_ns() - field.start
@@ -1,9 +1,513 @@
-from django.shortcuts import render
+import codecs
+import inspect
+import json
+from collections import namedtuple
+from contextlib import nullcontext
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.db import connection, transaction
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.http.response import HttpResponseBadRequest
 from django.contrib.auth.mixins import LoginRequiredMixin
-from graphene_django.views import GraphQLView
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView, HttpError
+from graphql import ExecutionResult, GraphQLError, OperationType, execute, get_operation_ast, parse, validate_schema
+from graphql.validation import validate
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.utils import get_http_authorization
+
+from . import exports
+from .auth import token_user_cache
+from .cache import request_scope, response_cache
+from .cost import QueryCostError, check_query_cost
+from .documents import DocumentCache, document_hash
+from .health import run_checks
+from .imports import IMPORTERS, ImportFormatError, detect_format, read_rows
+from .loaders import AsyncLoaders
+from .tracing import get_tracer, start_tracing, trace_phase
+
+
+document_cache = DocumentCache(maxsize=getattr(settings, 'GRAPHQL_DOCUMENT_CACHE_SIZE', 256))
+
+# What `prepare_operation` hands to execution: the parsed document and the
+# bookkeeping needed once a result comes back.
+PreparedOperation = namedtuple(
+    'PreparedOperation', 'schema document operation_ast extensions cache_key'
+)
+
+
+class PersistedQueryNotFound(GraphQLError):
+    def __init__(self):
+        super().__init__(
+            "PersistedQueryNotFound",
+            extensions={'code': 'PERSISTED_QUERY_NOT_FOUND'},
+        )
+
+
+class CachedGraphQLView(GraphQLView):
+    """GraphQLView that skips parse/validate for documents it has seen before.
+
+    Also implements Automatic Persisted Queries: a client may send only
+    `extensions.persistedQuery.sha256Hash`; if the hash is unknown it gets a
+    PersistedQueryNotFound error and retries with the full query text.
+    """
+
+    document_cache = document_cache
+
+    @staticmethod
+    def get_persisted_query_hash(request, data):
+        extensions = request.GET.get('extensions') or data.get('extensions')
+        if not extensions:
+            return None
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        if not isinstance(extensions, dict):
+            raise HttpError(HttpResponseBadRequest("Extensions must be a JSON object."))
+        persisted_query = extensions.get('persistedQuery') or {}
+        if not isinstance(persisted_query, dict) or not isinstance(persisted_query.get('sha256Hash', ''), str):
+            raise HttpError(HttpResponseBadRequest("extensions.persistedQuery must be an object with a string sha256Hash."))
+        return persisted_query.get('sha256Hash')
+
+    def get_document(self, schema, query, persisted_hash, request=None):
+        """Return `(document, errors)` from the cache, or parse and validate on a miss."""
+        if query:
+            key = document_hash(query)
+            if persisted_hash and persisted_hash != key:
+                return None, [GraphQLError("provided sha does not match query")]
+        else:
+            key = persisted_hash
+
+        document = self.document_cache.get(key)
+        if document is not None:
+            return document, []
+        if not query:
+            return None, [PersistedQueryNotFound()]
+
+        try:
+            with trace_phase(request, 'parse'):
+                document = parse(query)
+        except Exception as e:
+            return None, [e]
+
+        with trace_phase(request, 'validate'):
+            validation_errors = validate(
+                schema,
+                document,
+                self.validation_rules,
+                graphene_settings.MAX_VALIDATION_ERRORS,
+            )
+        if validation_errors:
+            return None, validation_errors
+
+        self.document_cache.set(key, document)
+        return document, []
+
+    def prepare_operation(self, request, data, query, variables, operation_name, show_graphiql=False):
+        """Everything before execution: document, cost limits and response cache lookup.
+
+        Returns a PreparedOperation, or the final ExecutionResult (or None when
+        GraphiQL should render) if the request ends here.
+        """
+        persisted_hash = self.get_persisted_query_hash(request, data)
+        if not query and not persisted_hash:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors)
+
+        document, errors = self.get_document(schema, query, persisted_hash, request)
+        if errors:
+            return ExecutionResult(data=None, errors=errors)
+
+        try:
+            with trace_phase(request, 'cost'):
+                cost, depth = check_query_cost(
+                    schema,
+                    document,
+                    variables,
+                    operation_name,
+                    max_cost=getattr(settings, 'GRAPHQL_MAX_QUERY_COST', None),
+                    max_depth=getattr(settings, 'GRAPHQL_MAX_QUERY_DEPTH', None),
+                    default_page_size=graphene_settings.RELAY_CONNECTION_MAX_LIMIT or 100,
+                )
+        except QueryCostError as e:
+            return ExecutionResult(data=None, errors=[e])
+        extensions = {'cost': {'requested': cost, 'depth': depth}}
+
+        operation_ast = get_operation_ast(document, operation_name)
+
+        if operation_ast is not None and operation_ast.operation == OperationType.SUBSCRIPTION:
+            return ExecutionResult(data=None, errors=[GraphQLError(
+                "Subscriptions are served over WebSocket (graphql-transport-ws) at /graphql/."
+            )])
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        cache_key = None
+        if (
+            response_cache.enabled
+            and operation_ast is not None
+            and operation_ast.operation == OperationType.QUERY
+        ):
+            cache_key = response_cache.key_for(
+                schema, document, variables, operation_name, request_scope(request)
+            )
+            if cache_key is not None:
+                cached_data = response_cache.get(cache_key)
+                if cached_data is not None:
+                    return ExecutionResult(data=cached_data, extensions={**extensions, 'cache': 'HIT'})
+                extensions['cache'] = 'MISS'
+
+        return PreparedOperation(schema, document, operation_ast, extensions, cache_key)
+
+    def get_execute_options(self, request, variables, operation_name):
+        execute_options = {
+            "root_value": self.get_root_value(request),
+            "context_value": self.get_context(request),
+            "variable_values": variables,
+            "operation_name": operation_name,
+            "middleware": self.get_middleware(request),
+        }
+        if self.execution_context_class:
+            execute_options["execution_context_class"] = self.execution_context_class
+        return execute_options
+
+    def execute_prepared(self, request, prepared, variables, operation_name):
+        tracer = get_tracer(request)
+        try:
+            with (
+                connection.execute_wrapper(tracer.sql_wrapper) if tracer else nullcontext(),
+                trace_phase(request, 'execute'),
+            ):
+                result = self._execute(request, prepared, variables, operation_name)
+        except Exception as e:
+            return ExecutionResult(errors=[e], extensions=prepared.extensions)
+        return self.finish_operation(request, prepared, result)
+
+    def _execute(self, request, prepared, variables, operation_name):
+        operation_ast = prepared.operation_ast
+        execute_options = self.get_execute_options(request, variables, operation_name)
+        if (
+            operation_ast is not None
+            and operation_ast.operation == OperationType.MUTATION
+            and (
+                graphene_settings.ATOMIC_MUTATIONS is True
+                or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+            )
+        ):
+            with transaction.atomic():
+                result = execute(prepared.schema, prepared.document, **execute_options)
+                if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                    transaction.set_rollback(True)
+        else:
+            result = execute(prepared.schema, prepared.document, **execute_options)
+        return result
+
+    def finish_operation(self, request, prepared, result):
+        if prepared.cache_key is not None and not result.errors:
+            response_cache.set(prepared.cache_key, result.data)
+
+        result.extensions = {**(result.extensions or {}), **prepared.extensions}
+        tracer = get_tracer(request)
+        if tracer is not None:
+            if tracer.expose:
+                result.extensions['tracing'] = tracer.report()
+            else:
+                tracer.log(getattr(prepared.operation_ast.name, 'value', None) if prepared.operation_ast else None)
+        return result
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        request.graphql_tracer = start_tracing(request)
+        prepared = self.prepare_operation(request, data, query, variables, operation_name, show_graphiql)
+        if not isinstance(prepared, PreparedOperation):
+            return prepared
+        return self.execute_prepared(request, prepared, variables, operation_name)
+
+    def get_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        return self.encode_result(request, execution_result, id, show_graphiql)
+
+    def encode_result(self, request, execution_result, id=None, show_graphiql=False):
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if execution_result:
+            response = {}
 
+            if execution_result.errors:
+                set_rollback()
+                response["errors"] = [
+                    self.format_error(e) for e in execution_result.errors
+                ]
 
-class PrivateGraphQLView(LoginRequiredMixin, GraphQLView):
+            if execution_result.errors and any(
+                not getattr(e, "path", None) for e in execution_result.errors
+            ):
+                status_code = 400
+            else:
+                response["data"] = execution_result.data
+
+            if execution_result.extensions:
+                response["extensions"] = execution_result.extensions
+
+            if self.batch:
+                response["id"] = id
+                response["status"] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+        else:
+            result = None
+
+        return result, status_code
+
+
+class AsyncGraphQLView(CachedGraphQLView):
+    """CachedGraphQLView for ASGI servers, running queries on graphql-core's async executor.
+
+    Root fields of a query resolve concurrently, relations batch per event
+    loop tick through AsyncLoaders and the ORM is used through its async API,
+    so an in-flight query doesn't hold a worker thread. Mutations run on the
+    synchronous path in a thread, keeping ATOMIC_MUTATIONS. No GraphiQL and
+    no batching on this view.
+    """
+
+    graphiql = False
+    batch = False
+
+    async def get(self, request, *args, **kwargs):
+        return await self.dispatch_async(request)
+
+    async def post(self, request, *args, **kwargs):
+        return await self.dispatch_async(request)
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method.lower() not in ("get", "post"):
+            return self.error_response(request, HttpError(
+                HttpResponseNotAllowed(
+                    ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                )
+            ))
+        return await super(GraphQLView, self).dispatch(request, *args, **kwargs)
+
+    def error_response(self, request, e):
+        response = e.response
+        response["Content-Type"] = "application/json"
+        response.content = self.json_encode(
+            request, {"errors": [self.format_error(e)]}
+        )
+        return response
+
+    async def dispatch_async(self, request):
+        try:
+            data = self.parse_body(request)
+            await self.authenticate_request(request)
+            query, variables, operation_name, id = self.get_graphql_params(request, data)
+            execution_result = await self.execute_graphql_request_async(
+                request, data, query, variables, operation_name
+            )
+            result, status_code = self.encode_result(request, execution_result, id)
+            return HttpResponse(
+                status=status_code, content=result, content_type="application/json"
+            )
+        except HttpError as e:
+            return self.error_response(request, e)
+
+    async def authenticate_request(self, request):
+        # Resolve the lazy session user and the JWT up front: the JWT middleware
+        # would otherwise hit the database from inside the event loop.
+        request.user = await request.auser()
+        if request.user.is_anonymous and get_http_authorization(request) is not None:
+            try:
+                user = await sync_to_async(authenticate)(request=request)
+            except JSONWebTokenError:
+                # Left to the middleware, which reports it on the field as usual.
+                return
+            if user is not None:
+                request.user = user
+
+    async def execute_graphql_request_async(self, request, data, query, variables, operation_name):
+        request.graphql_tracer = tracer = await sync_to_async(start_tracing)(request)
+        # The response cache may be Redis; its lookup and store run off the event loop.
+        prepared = await sync_to_async(self.prepare_operation)(request, data, query, variables, operation_name)
+        if not isinstance(prepared, PreparedOperation):
+            return prepared
+
+        operation_ast = prepared.operation_ast
+        if operation_ast is None or operation_ast.operation != OperationType.QUERY:
+            return await sync_to_async(self.execute_prepared)(request, prepared, variables, operation_name)
+
+        request.loaders = AsyncLoaders()
+        if tracer is not None:
+            # The async ORM runs queries on the request's sync thread, so the
+            # wrapper has to be installed on that thread's connection.
+            await sync_to_async(lambda: connection.execute_wrappers.append(tracer.sql_wrapper))()
+        try:
+            with trace_phase(request, 'execute'):
+                result = execute(
+                    prepared.schema, prepared.document,
+                    **self.get_execute_options(request, variables, operation_name)
+                )
+                if inspect.isawaitable(result):
+                    result = await result
+        except Exception as e:
+            return ExecutionResult(errors=[e], extensions=prepared.extensions)
+        finally:
+            if tracer is not None:
+                await sync_to_async(lambda: connection.execute_wrappers.remove(tracer.sql_wrapper))()
+        return await sync_to_async(self.finish_operation)(request, prepared, result)
+
+
+class PrivateGraphQLView(LoginRequiredMixin, CachedGraphQLView):
     pass
 
-# Create your views here.
+
+@never_cache
+@require_GET
+def healthz(request):
+    """Liveness: the process is up and serving requests. Touches no dependency."""
+    return JsonResponse({'status': 'ok'})
+
+
+@never_cache
+@require_GET
+def readyz(request):
+    """Readiness: database, Celery broker and migrations, with per-check latency.
+
+    Also reports this process's in-memory cache counters.
+    """
+    ok, checks = run_checks()
+    caches = {
+        'documents': document_cache.stats(),
+        'responses': response_cache.stats(),
+        'jwt_users': token_user_cache.stats(),
+    }
+    return JsonResponse(
+        {'status': 'ok' if ok else 'unavailable', 'checks': checks, 'caches': caches},
+        status=200 if ok else 503,
+    )
+
+
+def _require_staff_token(request):
+    """An error response unless the Authorization header carries a staff user's JWT.
+
+    Only the token counts, never the session, which is what makes the bulk
+    endpoints safe to exempt from CSRF.
+    """
+    try:
+        user = authenticate(request=request) if get_http_authorization(request) else None
+    except JSONWebTokenError as e:
+        return JsonResponse({'error': str(e)}, status=401)
+    if user is None or not user.is_staff:
+        return JsonResponse({'error': "Staff credentials required."}, status=403)
+    return None
+
+
+@csrf_exempt
+@require_POST
+def import_records(request, kind):
+    """Stream a CSV or NDJSON upload of customers or products into the database.
+
+    The file is either the raw request body or a multipart `file` field; it
+    is read line by line and never held in memory whole. Needs a staff JWT
+    in the Authorization header. Very large files are better sent through
+    the import_crm command, which also writes every rejected row to a file.
+    """
+    denied = _require_staff_token(request)
+    if denied:
+        return denied
+
+    importer_class = IMPORTERS.get(kind)
+    if importer_class is None:
+        return JsonResponse({'error': f"Unknown kind {kind!r}."}, status=404)
+
+    upload = request.FILES.get('file') if request.content_type == 'multipart/form-data' else None
+    if upload is not None:
+        lines, name = upload, upload.name
+    else:
+        lines, name = request, None
+    format = request.GET.get('format') or (
+        'ndjson' if 'ndjson' in request.content_type else detect_format(name)
+    )
+
+    errors = []
+    max_errors = getattr(settings, 'IMPORT_MAX_REPORTED_ERRORS', 1000)
+
+    def collect(error):
+        if len(errors) < max_errors:
+            errors.append(error.as_dict())
+
+    importer = importer_class(upsert=request.GET.get('upsert') == '1', on_error=collect)
+    try:
+        summary = importer.run(
+            read_rows(codecs.iterdecode(lines, 'utf-8-sig'), format, importer.required_columns)
+        )
+    except (ImportFormatError, UnicodeDecodeError) as e:
+        return JsonResponse({'error': str(e), **importer.summary(0)}, status=400)
+    return JsonResponse({**summary, 'errors': errors, 'errors_truncated': summary['failed'] > len(errors)})
+
+
+@require_GET
+def export_orders(request):
+    """Stream orders with their customer and products as NDJSON (default) or CSV.
+
+    Query parameters other than `format` and `chunk_size` are OrderFilter
+    filters, e.g. `?total_amount__gte=100&customer_name=smith`. Needs a staff
+    JWT in the Authorization header.
+    """
+    denied = _require_staff_token(request)
+    if denied:
+        return denied
+
+    params = request.GET.copy()
+    format = params.pop('format', ['ndjson'])[-1]
+    try:
+        chunk_size = int(params.pop('chunk_size', [exports.DEFAULT_CHUNK_SIZE])[-1])
+    except ValueError:
+        return JsonResponse({'error': "chunk_size must be a whole number."}, status=400)
+    if format not in exports.FORMATS or not 0 < chunk_size <= 10000:
+        return JsonResponse({'error': f"format must be one of {', '.join(exports.FORMATS)} and chunk_size 1-10000."}, status=400)
+
+    try:
+        content = exports.stream_orders(params, format, chunk_size)
+    except exports.ExportFilterError as e:
+        return JsonResponse({'error': str(e), 'filters': e.errors}, status=400)
+    response = StreamingHttpResponse(content, content_type=exports.CONTENT_TYPES[format])
+    response['Content-Disposition'] = f'attachment; filename="orders.{format}"'
+    return response
@@ -0,0 +1,230 @@
+"""GraphQL subscriptions over WebSocket, as a plain ASGI application.
+
+Speaks the graphql-transport-ws protocol (the one graphql-ws, Apollo and
+urql clients use): the client opens with `connection_init`, optionally
+carrying `{"Authorization": "JWT <token>"}`, then starts any number of
+`subscribe` operations by id and stops them with `complete`. Only
+subscription operations are accepted; queries and mutations stay on HTTP.
+
+Documents go through the same document cache and cost limits as the HTTP
+views. Events come from crm.pubsub, and resolvers run on the async path
+(AsyncLoaders, async ORM), so an idle subscription holds no thread.
+"""
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from graphene_django.settings import graphene_settings
+from graphql import ExecutionResult, GraphQLError, OperationType, get_operation_ast, subscribe
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.settings import jwt_settings
+
+from .auth import get_user_by_token
+from .cost import QueryCostError, check_query_cost
+from .loaders import AsyncLoaders
+from .views import CachedGraphQLView
+
+logger = logging.getLogger(__name__)
+
+SUBPROTOCOL = 'graphql-transport-ws'
+
+# Close codes defined by the protocol.
+CLOSE_BAD_REQUEST = 4400
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+CLOSE_SUBPROTOCOL = 4406
+CLOSE_INIT_TIMEOUT = 4408
+CLOSE_DUPLICATE_ID = 4409
+CLOSE_TOO_MANY_INITS = 4429
+
+
+class SubscriptionContext:
+    """`info.context` for subscription resolvers, standing in for the HTTP request."""
+
+    def __init__(self, scope, user):
+        self.scope = scope
+        self.user = user
+        self.loaders = AsyncLoaders()
+
+
+class _Closed(Exception):
+    def __init__(self, code):
+        self.code = code
+
+
+class GraphQLWebSocketApp:
+    def __init__(self, schema):
+        self.schema = schema
+        self.view = CachedGraphQLView(schema=schema)
+        config = getattr(settings, 'GRAPHQL_SUBSCRIPTIONS', {})
+        self.init_timeout = config.get('CONNECTION_INIT_TIMEOUT', 10)
+        self.max_operations = config.get('MAX_OPERATIONS_PER_CONNECTION', 50)
+
+    async def __call__(self, scope, receive, send):
+        if (await receive())['type'] != 'websocket.connect':
+            return
+        if SUBPROTOCOL not in scope.get('subprotocols', ()):
+            await send({'type': 'websocket.close', 'code': CLOSE_SUBPROTOCOL})
+            return
+        await send({'type': 'websocket.accept', 'subprotocol': SUBPROTOCOL})
+        await _Connection(self, scope, receive, send).run()
+
+
+class _Connection:
+    def __init__(self, app, scope, receive, send):
+        self.app = app
+        self.scope = scope
+        self.receive = receive
+        self._send = send
+        self._send_lock = asyncio.Lock()
+        self.context = None
+        self.operations = {}
+
+    async def send(self, message):
+        async with self._send_lock:
+            await self._send({'type': 'websocket.send', 'text': json.dumps(message, cls=DjangoJSONEncoder)})
+
+    async def close(self, code):
+        async with self._send_lock:
+            await self._send({'type': 'websocket.close', 'code': code})
+
+    async def next_message(self):
+        """The next client message, or None once the socket is gone."""
+        event = await self.receive()
+        if event['type'] == 'websocket.disconnect':
+            return None
+        try:
+            message = json.loads(event.get('text') or event.get('bytes') or '')
+        except ValueError:
+            raise _Closed(CLOSE_BAD_REQUEST)
+        if not isinstance(message, dict) or not isinstance(message.get('type'), str):
+            raise _Closed(CLOSE_BAD_REQUEST)
+        return message
+
+    async def run(self):
+        try:
+            try:
+                message = await asyncio.wait_for(self.next_message(), self.app.init_timeout)
+            except asyncio.TimeoutError:
+                raise _Closed(CLOSE_INIT_TIMEOUT)
+            if message is None:
+                return
+            if message['type'] != 'connection_init':
+                raise _Closed(CLOSE_UNAUTHORIZED)
+            self.context = SubscriptionContext(self.scope, await self.authenticate(message.get('payload')))
+            await self.send({'type': 'connection_ack'})
+
+            while (message := await self.next_message()) is not None:
+                await self.handle(message)
+        except _Closed as e:
+            await self.close(e.code)
+        finally:
+            for task in self.operations.values():
+                task.cancel()
+            await asyncio.gather(*self.operations.values(), return_exceptions=True)
+            await sync_to_async(close_old_connections)()
+
+    async def authenticate(self, payload):
+        """The user named by the JWT in the init payload, or None when there is none."""
+        payload = payload if isinstance(payload, dict) else {}
+        authorization = payload.get('Authorization') or payload.get('authorization')
+        if not authorization:
+            return None
+        prefix, _, token = str(authorization).partition(' ')
+        if prefix.lower() != jwt_settings.JWT_AUTH_HEADER_PREFIX.lower() or not token:
+            raise _Closed(CLOSE_FORBIDDEN)
+        try:
+            return await sync_to_async(get_user_by_token)(token)
+        except JSONWebTokenError:
+            raise _Closed(CLOSE_FORBIDDEN)
+
+    async def handle(self, message):
+        kind = message['type']
+        if kind == 'ping':
+            await self.send({'type': 'pong'})
+        elif kind == 'pong':
+            pass
+        elif kind == 'connection_init':
+            raise _Closed(CLOSE_TOO_MANY_INITS)
+        elif kind == 'subscribe':
+            id, payload = message.get('id'), message.get('payload')
+            if not isinstance(id, str) or not isinstance(payload, dict):
+                raise _Closed(CLOSE_BAD_REQUEST)
+            if id in self.operations:
+                raise _Closed(CLOSE_DUPLICATE_ID)
+            if len(self.operations) >= self.app.max_operations:
+                await self.send({'type': 'error', 'id': id, 'payload': [
+                    {'message': f"At most {self.app.max_operations} subscriptions per connection."}
+                ]})
+                return
+            task = asyncio.create_task(self.execute(id, payload))
+            self.operations[id] = task
+            task.add_done_callback(lambda _: self.operations.get(id) is task and self.operations.pop(id))
+        elif kind == 'complete':
+            task = self.operations.pop(message.get('id'), None)
+            if task is not None:
+                task.cancel()
+        else:
+            raise _Closed(CLOSE_BAD_REQUEST)
+
+    def prepare(self, payload):
+        """Return `(document, errors)` for a subscribe payload."""
+        graphql_schema = self.app.schema.graphql_schema
+        extensions = payload.get('extensions') or {}
+        persisted_query = extensions.get('persistedQuery') if isinstance(extensions, dict) else None
+        persisted_hash = persisted_query.get('sha256Hash') if isinstance(persisted_query, dict) else None
+        if persisted_hash is not None and not isinstance(persisted_hash, str):
+            persisted_hash = None
+        document, errors = self.app.view.get_document(graphql_schema, payload.get('query'), persisted_hash)
+        if errors:
+            return None, errors
+
+        operation_ast = get_operation_ast(document, payload.get('operationName'))
+        if operation_ast is None or operation_ast.operation != OperationType.SUBSCRIPTION:
+            return None, [GraphQLError("Only subscription operations are served over WebSocket.")]
+        try:
+            check_query_cost(
+                graphql_schema,
+                document,
+                payload.get('variables'),
+                payload.get('operationName'),
+                max_cost=getattr(settings, 'GRAPHQL_MAX_QUERY_COST', None),
+                max_depth=getattr(settings, 'GRAPHQL_MAX_QUERY_DEPTH', None),
+                default_page_size=graphene_settings.RELAY_CONNECTION_MAX_LIMIT or 100,
+            )
+        except QueryCostError as e:
+            return None, [e]
+        return document, []
+
+    async def execute(self, id, payload):
+        document, errors = self.prepare(payload)
+        if errors:
+            await self.send({'type': 'error', 'id': id, 'payload': [self.app.view.format_error(e) for e in errors]})
+            return
+
+        results = await subscribe(
+            self.app.schema.graphql_schema,
+            document,
+            context_value=self.context,
+            variable_values=payload.get('variables'),
+            operation_name=payload.get('operationName'),
+        )
+        if isinstance(results, ExecutionResult):
+            await self.send({'type': 'error', 'id': id, 'payload': [self.app.view.format_error(e) for e in results.errors]})
+            return
+
+        try:
+            async for result in results:
+                await self.send({'type': 'next', 'id': id, 'payload': result.formatted})
+            await self.send({'type': 'complete', 'id': id})
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Subscription %s failed.", id)
+            await self.send({'type': 'error', 'id': id, 'payload': [{'message': "Internal server error."}]})
+        finally:
+            await results.aclose()